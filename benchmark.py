@@ -0,0 +1,185 @@
+"""
+生成成本基准：对比「每个变体单独请求」和「一次请求生成全部变体」两种模式的 Token 与耗时。
+加 --compression 时改为检查案例压缩：每条案例省下的 Token，以及压缩前后的风格特征是否一致。
+
+只比较初稿阶段（排版阶段两种模式完全一样）。默认离线估算，不调用 API：
+按 generation.estimate_tokens 统计两种模式实际会发出的 Prompt 大小。
+加 --live 时用 DEEPSEEK_API_KEY 真实跑一遍（使用临时缓存文件，不读写 api_cache.json），
+Token 取接口返回的 usage（含命中 DeepSeek 前缀缓存的部分），同时统计合并请求解析失败、退回单独请求的次数。
+
+    python benchmark.py --variants 3
+    python benchmark.py --posts posts.json --topic "新手理财记账 App" --variants 3 --live
+    python benchmark.py --compression [--live]
+"""
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import generation
+from generation import (
+    HISTORY_FILE, MAX_COMBINED_VARIANTS, analyze_and_generate_prompt, build_multi_variant_prompt,
+    combined_group_size, estimate_tokens, generate_draft, get_usage_stats,
+)
+from jobs import MAX_WORKERS
+from example_compress import compress_post, style_profile
+
+DEFAULT_TOPIC = "推荐一款适合新手的理财记账 App"
+FIDELITY_TOLERANCE = 0.15  # 风格特征的相对偏差不超过 15% 视为保真
+FIDELITY_MIN_DELTA = 0.05  # 数值本身很小（如疑问句比例 0.02 → 0.03）时按绝对差判断
+STYLE_FEATURES = {
+    "emoji_per_100": "Emoji / 百字", "exclaim_ratio": "感叹句比例", "question_ratio": "疑问句比例",
+    "avg_line_chars": "平均行长", "bold_per_100": "加粗 / 百字", "pages": "页数",
+}
+
+
+def load_posts(path: str) -> list:
+    """读取案例：与 UI 上传的 JSON 格式相同；不指定时用 history.json 里的文案充当案例。"""
+    if not path:
+        with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
+            return [item["text"] for item in json.load(f)]
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return data["posts"] if isinstance(data, dict) else data
+
+
+def estimate_modes(system_prompt: str, user_prompt: str, n: int) -> list:
+    """离线估算两种模式的请求数和输入 Token。变体超过 MAX_COMBINED_VARIANTS 时合并请求按组计。"""
+    single = estimate_tokens(system_prompt + user_prompt)
+    group_sizes = [combined_group_size(start, n) for start in range(0, n, MAX_COMBINED_VARIANTS)]
+    combined = sum(estimate_tokens(system_prompt + build_multi_variant_prompt(user_prompt, size))
+                   for size in group_sizes)
+    return [
+        {"mode": f"单独请求 ×{n}", "requests": n, "prompt_tokens": single * n},
+        {"mode": "合并请求", "requests": len(group_sizes), "prompt_tokens": combined},
+    ]
+
+
+def run_live(system_prompt: str, user_prompt: str, n: int, api_key: str, model: str, max_tokens: int) -> list:
+    """两种模式各真实跑一遍初稿，返回按 usage 统计的结果。"""
+    rows = []
+    for mode, combined in ((f"单独请求 ×{n}", False), ("合并请求", True)):
+        # 每种模式用一份空缓存，保证每个请求都真实发出；并发数与后台任务队列一致
+        generation.CACHE_FILE = os.path.join(tempfile.mkdtemp(prefix="xhs-bench-"), "api_cache.json")
+        before = get_usage_stats()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=min(n, MAX_WORKERS)) as executor:
+            results = list(executor.map(
+                lambda vid: generate_draft(system_prompt, user_prompt, api_key, model, max_tokens,
+                                           variant_id=vid, retries=1,
+                                           combined_n=combined_group_size(vid, n) if combined else 0),
+                range(n),
+            ))
+        elapsed = time.perf_counter() - start
+        after = get_usage_stats()
+        calls = after["calls"] - before["calls"]
+        rows.append({
+            "mode": mode,
+            "requests": calls,
+            "prompt_tokens": after["prompt_tokens"] - before["prompt_tokens"],
+            "cache_hit_tokens": after["prompt_cache_hit_tokens"] - before["prompt_cache_hit_tokens"],
+            "completion_tokens": after["completion_tokens"] - before["completion_tokens"],
+            "seconds": round(elapsed, 1),
+            "ok": sum(1 for text, _, err in results if not err),
+            "fallbacks": max(calls - math.ceil(n / MAX_COMBINED_VARIANTS), 0) if combined else 0,
+        })
+    return rows
+
+
+def print_table(rows: list):
+    columns = [("mode", "模式"), ("requests", "请求数"), ("prompt_tokens", "输入 Token"),
+               ("cache_hit_tokens", "其中命中缓存"),
+               ("completion_tokens", "输出 Token"), ("seconds", "耗时(s)"), ("ok", "成功篇数"), ("fallbacks", "退回单独请求")]
+    columns = [(key, title) for key, title in columns if any(key in row for row in rows)]
+    print(" | ".join(title for _, title in columns))
+    for row in rows:
+        print(" | ".join(str(row.get(key, "-")) for key, _ in columns))
+    baseline, combined = rows[0]["prompt_tokens"], rows[-1]["prompt_tokens"]
+    if baseline:
+        print(f"\n输入 Token 节省：{baseline - combined}（{(baseline - combined) / baseline:.1%}）")
+
+
+def fidelity_rows(reference: dict, candidate: dict) -> list:
+    rows = []
+    for key, name in STYLE_FEATURES.items():
+        a, b = reference.get(key, 0), candidate.get(key, 0)
+        drift = abs(b - a) / a if a else (0.0 if b == 0 else 1.0)
+        ok = drift <= FIDELITY_TOLERANCE or abs(b - a) <= FIDELITY_MIN_DELTA
+        rows.append((name, round(a, 2), round(b, 2), f"{drift:.0%}", "✅" if ok else "⚠️"))
+    return rows
+
+
+def print_fidelity(title: str, reference: dict, candidate: dict, labels=("原文", "压缩后")) -> bool:
+    rows = fidelity_rows(reference, candidate)
+    print(f"\n{title}")
+    print(f"特征 | {labels[0]} | {labels[1]} | 偏差 | 保真")
+    for row in rows:
+        print(" | ".join(str(v) for v in row))
+    return all(row[-1] == "✅" for row in rows)
+
+
+def run_compression(posts: list, topic: str, args) -> bool:
+    """案例压缩的 Token 节省与风格保真检查；--live 时再各生成一篇初稿，比较输出风格与原案例的接近程度。"""
+    texts = [p["text"] if isinstance(p, dict) else p for p in posts][:generation.MAX_EXAMPLE_POSTS]
+    compressed = [compress_post(t) for t in texts]
+    print("案例 | 原文 Token | 压缩后 Token | 节省")
+    for i, (t, c) in enumerate(zip(texts, compressed)):
+        before, after = estimate_tokens(t), estimate_tokens(c)
+        print(f"{i + 1} | {before} | {after} | {(before - after) / before:.1%}" if before else f"{i + 1} | 0 | 0 | -")
+    before, after = (sum(estimate_tokens(t) for t in group) for group in (texts, compressed))
+    print(f"\n每次请求的案例 Token：{before} → {after}，节省 {before - after}（{(before - after) / max(before, 1):.1%}）")
+    reference = style_profile(texts)
+    ok = print_fidelity("案例风格特征（压缩前 vs 压缩后）", reference, style_profile(compressed))
+
+    if args.live:
+        api_key = os.environ.get("DEEPSEEK_API_KEY", "")
+        if not api_key:
+            sys.exit("--live 需要设置环境变量 DEEPSEEK_API_KEY")
+        generation.CACHE_FILE = os.path.join(tempfile.mkdtemp(prefix="xhs-bench-"), "api_cache.json")
+        drafts = {}
+        for compress in (False, True):
+            system_prompt, user_prompt = analyze_and_generate_prompt(posts, topic, args.max_tokens, compress=compress)
+            text, _, err = generate_draft(system_prompt, user_prompt, api_key, args.model, args.max_tokens, retries=1)
+            if err:
+                sys.exit(err)
+            drafts[compress] = text
+        ok &= print_fidelity("生成结果的风格特征（未压缩案例 vs 压缩案例）", style_profile([drafts[False]]),
+                             style_profile([drafts[True]]), labels=("未压缩", "压缩"))
+    print("\n结论：" + ("风格保真 ✅" if ok else "有特征偏差超过阈值 ⚠️（单篇生成结果本身有随机性，可多跑几次）"))
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比单独请求与合并请求生成多个变体的成本")
+    parser.add_argument("--posts", default="", help="案例 JSON（[...] 或 {\"posts\": [...]}），默认取 history.json")
+    parser.add_argument("--topic", default=DEFAULT_TOPIC, help="目标主题")
+    parser.add_argument("--variants", "-n", type=int, default=3, help="变体数")
+    parser.add_argument("--live", action="store_true", help="真实调用 API（需要 DEEPSEEK_API_KEY）")
+    parser.add_argument("--model", default="deepseek-chat")
+    parser.add_argument("--max-tokens", type=int, default=2000)
+    parser.add_argument("--compression", action="store_true", help="检查案例压缩的 Token 节省与风格保真")
+    args = parser.parse_args()
+
+    posts = load_posts(args.posts)
+    if args.compression:
+        sys.exit(0 if run_compression(posts, args.topic, args) else 1)
+    system_prompt, user_prompt = analyze_and_generate_prompt(posts, args.topic, args.max_tokens)
+
+    if not args.live:
+        print(f"离线估算（{len(posts)} 条案例，{args.variants} 个变体，只统计初稿阶段的输入 Token）\n")
+        print_table(estimate_modes(system_prompt, user_prompt, args.variants))
+        return
+
+    api_key = os.environ.get("DEEPSEEK_API_KEY", "")
+    if not api_key:
+        sys.exit("--live 需要设置环境变量 DEEPSEEK_API_KEY")
+    print(f"真实调用（{args.model}，{args.variants} 个变体，只统计初稿阶段）\n")
+    print_table(run_live(system_prompt, user_prompt, args.variants, api_key, args.model, args.max_tokens))
+
+
+if __name__ == "__main__":
+    main()
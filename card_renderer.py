@@ -0,0 +1,697 @@
+"""
+无头卡片渲染器：不依赖浏览器，把带 `@---` 分页的 Markdown 直接渲染成小红书卡片 JPG。
+
+与 文案到图片生成.py 里的编辑器保持同一套约定：
+- 四个主题 minimal / serif / acid / tech（对应编辑器里的 STYLES）
+- 画布尺寸预设 375x500 / 375x667（对应 #canvas-size），默认按 pixelRatio=2 输出
+- 文件命名 rednote_cover.jpg / rednote_page_N.jpg（可选 WebP / PNG，及单张字节预算）
+- 正文放不下时逐步缩小字号（对应编辑器的 fitCard，最小 10px）
+
+字体从 static/fonts/ 目录读取（与编辑器共用，可用环境变量 XHS_FONT_DIR 覆盖），需要 .otf / .ttf / .ttc 格式：
+编辑器用的 .woff2 Pillow 读不了。缺少中文字体时命令行直接报错（Pillow 内置字体没有中文字形）。
+
+命令行批量渲染（多进程）：
+    python card_renderer.py history.json -o output --style serif --size 375x667 -j 8
+"""
+import io
+import os
+import re
+import json
+import logging
+import argparse
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from PIL import Image, ImageColor, ImageDraw, ImageFont, ImageOps
+
+from emoji_pattern import EMOJI_SEQ, EMOJI_RE
+
+logger = logging.getLogger(__name__)
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+FONT_DIR = os.environ.get("XHS_FONT_DIR", os.path.join(base_dir, "static", "fonts"))
+
+# ==========================================
+# 主题 & 画布配置（与编辑器 CSS 保持一致）
+# ==========================================
+CANVAS_SIZES = {
+    "375x500": (375, 500),  # 📕 小红书 (3:4)
+    "375x667": (375, 667),  # 📱 手机海报 (9:16)
+}
+
+THEMES = {
+    "minimal": {
+        "bg": "#EBF5FB", "text": "#1E3A5F", "gray": "#566573", "border": "#AED6F1", "accent": "#3498DB",
+        "font": "sans", "padding": 32, "header": 56, "quote_bg": "#E2EFF8", "quote_text": "#566573",
+        "code_bg": "#D6EAF8", "h1_bar": 3, "h1_indent": 15,
+    },
+    "serif": {
+        "bg": "#F2EFE9", "text": "#2C2C2C", "gray": "#9CA3AF", "border": "#D1D5DB", "accent": "#B85C5C",
+        "font": "serif", "padding": 32, "header": 32, "quote_bg": "#F8F7F4", "quote_text": "#555555",
+        "code_bg": "#FFFFFF", "h1_bar": 4, "h1_indent": 20,
+    },
+    "acid": {
+        "bg": "#CCFF00", "text": "#000000", "gray": "#000000", "border": "#000000", "accent": "#000000",
+        "font": "sans", "padding": 24, "header": 32, "quote_bg": "#E5FF80", "quote_text": "#000000",
+        "code_bg": "#000000", "h1_bar": 0, "h1_indent": 0,
+    },
+    "tech": {
+        "bg": "#0F172A", "text": "#E2E8F0", "gray": "#94A3B8", "border": "#3B82F6", "accent": "#60A5FA",
+        "font": "sans", "padding": 24, "header": 0, "quote_bg": "#1E1B4B", "quote_text": "#D8B4FE",
+        "code_bg": "#0F172A", "h1_bar": 0, "h1_indent": 0, "grid": "#172445", "quote_bar": "#8B5CF6",
+    },
+}
+
+# 字体文件名（不含扩展名），按 FONT_EXTS 的顺序找第一个存在的文件
+FONT_FILES = {
+    ("sans", False): "NotoSansSC-Regular",
+    ("sans", True): "NotoSansSC-Bold",
+    ("serif", False): "NotoSerifSC-Regular",
+    ("serif", True): "NotoSerifSC-Bold",
+}
+EMOJI_FONT_FILE = "NotoEmoji-Regular"  # 单色 Emoji 字体，任意字号可用
+FONT_EXTS = (".otf", ".ttf", ".ttc")   # Pillow 能读的格式；.woff / .woff2 只给编辑器内嵌用
+
+MIN_BODY_SIZE = 10  # 与编辑器 fitCard 的最小字号一致
+BODY_LINE_HEIGHT = 1.7
+HEADING_LINE_HEIGHT = 1.3
+
+# 避头尾标点：这些字符不能出现在行首 / 行尾
+NO_LINE_START = set("，。、；：！？）」』】》〉”’…—,.;:!?)]}%")
+NO_LINE_END = set("（「『【《〈“‘([{")
+
+TOKEN_RE = re.compile(rf"{EMOJI_SEQ}|[A-Za-z0-9][A-Za-z0-9_'\-.%/@&+]*|[ \t]+|.", re.S)
+
+# ==========================================
+# 字体加载
+# ==========================================
+_missing_families = set()  # 缺字体的警告每个进程只打一次
+
+
+def find_font(name: str):
+    """FONT_DIR 下 name 对应的 .otf / .ttf / .ttc 文件路径，没有则返回 None。"""
+    for ext in FONT_EXTS:
+        path = os.path.join(FONT_DIR, name + ext)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def font_problem(family: str):
+    """family 缺少可用的中文字体时返回说明（只放了 woff / woff2 时会指出来），否则返回 None。"""
+    names = list(dict.fromkeys([FONT_FILES[(family, False)], FONT_FILES[("sans", False)]]))
+    if any(find_font(name) for name in names):
+        return None
+    webfonts = [name + ext for name in names for ext in (".woff2", ".woff") if os.path.exists(os.path.join(FONT_DIR, name + ext))]
+    hint = f"（{'、'.join(webfonts)} 是网页字体，Pillow 无法读取）" if webfonts else ""
+    return (f"{FONT_DIR} 下没有 {names[0]} 的 {' / '.join(FONT_EXTS)} 文件{hint}，"
+            f"Pillow 内置字体没有中文字形，渲染出来会是方框。请放入 {names[0]}.otf 等字体文件。")
+
+
+@lru_cache(maxsize=None)
+def load_font(family: str, bold: bool, size: int):
+    """按 (字体族, 粗细, 像素字号) 加载字体，进程内缓存。找不到字体文件时逐级降级。"""
+    candidates = [FONT_FILES.get((family, bold)), FONT_FILES.get((family, False)), FONT_FILES[("sans", bold)]]
+    if family == "emoji":
+        candidates = [EMOJI_FONT_FILE]
+    for name in candidates:
+        path = find_font(name) if name else None
+        if path:
+            return ImageFont.truetype(path, size)
+    if family != "emoji" and family not in _missing_families:
+        _missing_families.add(family)
+        logger.warning("暂用 Pillow 内置字体：%s", font_problem(family))
+    return ImageFont.load_default(size)
+
+
+def _has_emoji_font() -> bool:
+    return find_font(EMOJI_FONT_FILE) is not None
+
+
+def _rgb(color: str):
+    return ImageColor.getrgb(color)
+
+# ==========================================
+# Markdown 解析（只覆盖爆款文案里实际会出现的语法）
+# ==========================================
+def split_pages(markdown_text: str) -> list:
+    """与编辑器一致：按 `@---` 分页并丢弃空白页。"""
+    return [p for p in markdown_text.split("@---") if p.strip()]
+
+
+def parse_blocks(page_text: str, image_root: str = "") -> list:
+    """把一页 Markdown 解析成 (类型, 级别, 内容) 的块列表。
+
+    类型：h（标题）/ p（段落，保留软换行）/ quote / li / code / img / hr
+    """
+    blocks = []
+    para = []
+    lines = page_text.strip("\n").split("\n")
+
+    def flush():
+        if para:
+            blocks.append(("p", 0, "\n".join(para)))
+            para.clear()
+
+    i = 0
+    while i < len(lines):
+        line = lines[i].rstrip()
+        stripped = line.strip()
+        if stripped.startswith("```"):
+            flush()
+            code = []
+            i += 1
+            while i < len(lines) and not lines[i].strip().startswith("```"):
+                code.append(lines[i].rstrip())
+                i += 1
+            blocks.append(("code", 0, "\n".join(code)))
+        elif not stripped or stripped in ("::: row", ":::"):
+            flush()
+        elif re.match(r"^#{1,6}\s", stripped):
+            flush()
+            level = len(stripped) - len(stripped.lstrip("#"))
+            blocks.append(("h", min(level, 4), stripped[level:].strip()))
+        elif stripped.startswith(">"):
+            flush()
+            quote = []
+            while i < len(lines) and lines[i].strip().startswith(">"):
+                quote.append(lines[i].strip()[1:].strip())
+                i += 1
+            blocks.append(("quote", 0, "\n".join(quote)))
+            continue
+        elif re.match(r"^([-*+]|\d+\.)\s", stripped):
+            flush()
+            bullet, _, rest = stripped.partition(" ")
+            blocks.append(("li", 0, ("• " if bullet in "-*+" else bullet + " ") + rest.strip()))
+        elif re.fullmatch(r"(-{3,}|\*{3,})", stripped):
+            flush()
+            blocks.append(("hr", 0, ""))
+        elif re.fullmatch(r"(!\[[^\]]*\]\([^)]*\)\s*)+", stripped):
+            flush()
+            for alt, src in re.findall(r"!\[([^\]]*)\]\(([^)\s]*)[^)]*\)", stripped):
+                path = src if os.path.isabs(src) else os.path.join(image_root, src)
+                if os.path.isfile(path):  # img:xxx 是编辑器内的粘贴图，这里无法解析，直接跳过
+                    width = alt.split("|")[1] if "|" in alt else ""
+                    blocks.append(("img", 0, (path, width)))
+        else:
+            para.append(line)
+        i += 1
+    flush()
+    return blocks
+
+
+def tokenize(text: str) -> list:
+    """把行内 Markdown 拆成 (片段, 是否加粗) 的 token 列表；中文逐字、英文按词、Emoji 按序列。"""
+    text = re.sub(r"\[([^\]]+)\]\([^)]*\)", r"\1", text)  # 链接只保留文字
+    text = re.sub(r"`([^`]+)`", r"\1", text)
+    tokens = []
+    for idx, chunk in enumerate(text.split("**")):
+        bold = idx % 2 == 1
+        chunk = re.sub(r"(?<!\w)[*_]([^*_]+)[*_](?!\w)", r"\1", chunk)  # 斜体按普通文字处理
+        tokens.extend((t, bold) for t in TOKEN_RE.findall(chunk))
+    return tokens
+
+# ==========================================
+# 排版：测量 + 中文断行
+# ==========================================
+def _token_font(token: str, family: str, bold: bool, size: int):
+    if EMOJI_RE.fullmatch(token) and _has_emoji_font():
+        return load_font("emoji", False, size)
+    return load_font(family, bold, size)
+
+
+def wrap_tokens(tokens: list, family: str, size: int, max_width: float) -> list:
+    """贪心断行（含避头尾规则）。返回行列表，每行是 [(片段, 加粗, 宽度), ...]。"""
+    lines, cur, cur_w = [], [], 0.0
+
+    def flush():
+        nonlocal cur, cur_w
+        while cur and not cur[-1][0].strip():
+            cur.pop()
+        lines.append(cur)
+        cur, cur_w = [], 0.0
+
+    for text, bold in tokens:
+        if text == "\n":
+            flush()
+            continue
+        width = _token_font(text, family, bold, size).getlength(text)
+        if width > max_width and len(text) > 1:
+            # 超长英文单词/链接：拆成单字符继续排
+            for ch in text:
+                w = _token_font(ch, family, bold, size).getlength(ch)
+                if cur and cur_w + w > max_width:
+                    flush()
+                cur.append((ch, bold, w))
+                cur_w += w
+            continue
+        if cur and cur_w + width > max_width:
+            if text[0] in NO_LINE_START:
+                # 标点悬挂在行尾，不挤到下一行行首
+                cur.append((text, bold, width))
+                cur_w += width
+                continue
+            carry = []
+            while cur and cur[-1][0][-1] in NO_LINE_END:
+                carry.insert(0, cur.pop())
+            flush()
+            cur = carry
+            cur_w = sum(t[2] for t in carry)
+            if not text.strip():
+                continue
+        if not cur and not text.strip():
+            continue
+        cur.append((text, bold, width))
+        cur_w += width
+    if cur:
+        flush()
+    return lines
+
+
+def layout_blocks(blocks: list, theme: dict, width: int, body_size: float, heading_base: int, scale: int,
+                  at_top: bool = True) -> tuple:
+    """把块排成可绘制的条目。返回 (条目列表, 总高度)，全部按设备像素计算。
+
+    at_top=False 表示这些块接在页面已有内容之后（首块的上外边距不再省略），分页测量时使用。
+    """
+    family = theme["font"]
+    items = []
+    y = 0.0
+    body_px = max(1, round(body_size * scale))
+    heading_sizes = {1: heading_base, 2: round(heading_base * 0.75), 3: round(heading_base * 0.6), 4: round(heading_base * 0.5)}
+
+    for idx, (kind, level, content) in enumerate(blocks):
+        first = idx == 0 and at_top
+        if kind == "h":
+            size = max(1, round(heading_sizes[level] * scale))
+            margin_top = 0 if first else size * 0.5
+            margin_bottom = size * (0.8 if level == 1 else 0.3)
+            indent = theme["h1_indent"] * scale if level == 1 else 0
+            tokens = [(t, True) for t, _ in tokenize(content)]
+            lines = wrap_tokens(tokens, family, size, width - indent)
+            y += margin_top
+            line_h = size * HEADING_LINE_HEIGHT
+            items.append({"kind": "h", "level": level, "y": y, "lines": lines, "size": size,
+                          "line_h": line_h, "indent": indent, "height": line_h * len(lines)})
+            y += line_h * len(lines) + margin_bottom
+        elif kind in ("p", "li", "quote", "code"):
+            pad = 16 * scale if kind == "quote" else (12 * scale if kind == "code" else 0)
+            indent = 12 * scale if kind == "li" else 0
+            tokens = tokenize(content) if kind != "code" else [(t, False) for t in TOKEN_RE.findall(content)]
+            size = body_px if kind != "code" else max(1, round(body_size * 0.85 * scale))
+            lines = wrap_tokens(tokens, family, size, width - 2 * pad - indent)
+            line_h = size * BODY_LINE_HEIGHT
+            height = line_h * len(lines) + (2 * 12 * scale if pad else 0)
+            if kind == "quote" and not first:
+                y += 16 * scale
+            items.append({"kind": kind, "y": y, "lines": lines, "size": size, "line_h": line_h,
+                          "indent": indent, "pad": pad, "height": height})
+            margin_bottom = body_px * 0.8 if kind != "li" else body_px * 0.2
+            if kind == "quote":
+                margin_bottom = 16 * scale
+            y += height + margin_bottom
+        elif kind == "img":
+            path, css_width = content
+            with Image.open(path) as im:
+                iw, ih = im.size
+            target_w = width
+            if css_width.endswith("%"):
+                target_w = width * min(100, float(css_width[:-1])) / 100
+            elif css_width.endswith("px"):
+                target_w = min(width, float(css_width[:-2]) * scale)
+            target_h = target_w * ih / iw
+            y += 12 * scale
+            items.append({"kind": "img", "y": y, "path": path, "w": target_w, "height": target_h})
+            y += target_h + 12 * scale
+        elif kind == "hr":
+            y += body_px * 0.8
+            items.append({"kind": "hr", "y": y, "height": scale})
+            y += scale + body_px * 0.8
+    return items, y
+
+
+def fit_page(blocks: list, theme: dict, width: int, height: int, body_size: float, heading_base: int, scale: int) -> tuple:
+    """与编辑器 fitCard 相同的策略：正文字号每次减 0.5px，直到放得下或到达最小字号。"""
+    size = float(body_size)
+    items, total = layout_blocks(blocks, theme, width, size, heading_base, scale)
+    while total > height + 2 * scale and size > MIN_BODY_SIZE:
+        size -= 0.5
+        items, total = layout_blocks(blocks, theme, width, size, heading_base, scale)
+    return items, size
+
+# ==========================================
+# 绘制
+# ==========================================
+def _draw_line(draw, line: list, x: float, top: float, line_h: float, family: str, size: int, fill):
+    ascent, descent = load_font(family, False, size).getmetrics()
+    baseline = top + (line_h - (ascent + descent)) / 2 + ascent
+    for text, bold, w in line:
+        draw.text((x, baseline), text, font=_token_font(text, family, bold, size), fill=fill, anchor="ls")
+        x += w
+
+
+def _draw_background(img, theme: dict, scale: int):
+    if "grid" in theme:
+        draw = ImageDraw.Draw(img)
+        step = 40 * scale
+        for gx in range(0, img.width, step):
+            draw.line([(gx, 0), (gx, img.height)], fill=_rgb(theme["grid"]), width=scale)
+        for gy in range(0, img.height, step):
+            draw.line([(0, gy), (img.width, gy)], fill=_rgb(theme["grid"]), width=scale)
+
+
+def draw_items(img, items: list, theme: dict, style_id: str, x0: float, y0: float, width: float, bottom: float,
+               scale: int):
+    """绘制排好版的条目；超出 bottom 的部分被裁掉（对应卡片的 overflow: hidden）。"""
+    layer = Image.new("RGBA", img.size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(layer)
+    family = theme["font"]
+    text_color = _rgb(theme["text"])
+    accent = _rgb(theme["accent"])
+
+    for item in items:
+        top = y0 + item["y"]
+        if top >= bottom:
+            break
+        kind = item["kind"]
+        if kind == "h":
+            fill = text_color
+            if style_id == "tech" and item["level"] == 1:
+                fill = accent
+            if style_id == "serif" and item["level"] == 2:
+                fill = accent
+            if style_id == "acid" and item["level"] == 2:
+                line_w = max((sum(t[2] for t in ln) for ln in item["lines"]), default=0)
+                draw.rectangle([x0, top, x0 + line_w + 20 * scale, top + item["height"]], fill=(0, 0, 0))
+                fill = _rgb(theme["bg"])
+            if item["level"] == 1 and item["indent"]:
+                bar = theme["h1_bar"] * scale
+                draw.rectangle([x0, top, x0 + bar, top + item["height"]], fill=accent)
+            if style_id in ("acid", "tech") and item["level"] == 1:
+                line_y = top + item["height"] + 2 * scale
+                draw.rectangle([x0, line_y, x0 + width, line_y + 4 * scale],
+                               fill=(0, 0, 0) if style_id == "acid" else _rgb("#7EA4F8"))
+            x = x0 + item["indent"] + (10 * scale if style_id == "acid" and item["level"] == 2 else 0)
+            for n, line in enumerate(item["lines"]):
+                _draw_line(draw, line, x, top + n * item["line_h"], item["line_h"], family, item["size"], fill)
+        elif kind in ("p", "li", "quote", "code"):
+            pad = item["pad"]
+            fill = text_color
+            if kind == "quote":
+                fill = _rgb(theme["quote_text"])
+                draw.rectangle([x0, top, x0 + width, top + item["height"]], fill=_rgb(theme["quote_bg"]))
+                draw.rectangle([x0, top, x0 + 3 * scale, top + item["height"]], fill=_rgb(theme.get("quote_bar", theme["accent"])))
+            elif kind == "code":
+                draw.rounded_rectangle([x0, top, x0 + width, top + item["height"]], radius=6 * scale,
+                                       fill=_rgb(theme["code_bg"]), outline=_rgb(theme["border"]))
+                if style_id == "acid":
+                    fill = _rgb(theme["bg"])
+            inner_top = top + (12 * scale if pad else 0)
+            for n, line in enumerate(item["lines"]):
+                _draw_line(draw, line, x0 + pad + item["indent"], inner_top + n * item["line_h"],
+                           item["line_h"], family, item["size"], fill)
+        elif kind == "img":
+            with Image.open(item["path"]) as im:
+                pic = ImageOps.exif_transpose(im).convert("RGB").resize((round(item["w"]), round(item["height"])))
+            layer.paste(pic, (round(x0 + (width - item["w"]) / 2), round(top)))
+        elif kind == "hr":
+            draw.line([(x0, top), (x0 + width, top)], fill=_rgb(theme["border"]), width=scale)
+
+    # 裁掉溢出区域后叠加到底图
+    layer = layer.crop((0, 0, img.width, round(bottom)))
+    img.paste(layer, (0, 0), layer)
+
+
+def _draw_page_header(draw, theme: dict, style_id: str, x0: float, y0: float, width: float, date: str, page_num: int, scale: int):
+    size = 12 * scale
+    font = load_font(theme["font"], True, size)
+    if style_id == "minimal":
+        draw.text((x0, y0 + 6 * scale), date, font=font, fill=_rgb(theme["border"]))
+        label = f"0{page_num}"
+        lw = font.getlength(label)
+        draw.rounded_rectangle([x0 + width - lw - 16 * scale, y0, x0 + width, y0 + 24 * scale], radius=4 * scale,
+                               fill=_rgb(theme["code_bg"]))
+        draw.text((x0 + width - lw - 8 * scale, y0 + 6 * scale), label, font=font, fill=_rgb(theme["text"]))
+        draw.line([(x0, y0 + 40 * scale), (x0 + width, y0 + 40 * scale)], fill=_rgb(theme["border"]), width=scale)
+    elif style_id in ("serif", "acid"):
+        label = f"第 {page_num} 页" if style_id == "serif" else f"P.0{page_num}"
+        color = _rgb(theme["gray"])
+        draw.text((x0, y0), date, font=font, fill=color)
+        draw.text((x0 + width - font.getlength(label), y0), label, font=font, fill=color)
+        line_w = (2 if style_id == "acid" else 1) * scale
+        draw.line([(x0, y0 + 24 * scale), (x0 + width, y0 + 24 * scale)], fill=_rgb(theme["border"]), width=line_w)
+
+
+def content_box(style_id: str, size: str, scale: int = 1) -> tuple:
+    """正文区域 (x0, top, 宽, 高)：画布减去内边距和页眉。"""
+    theme = THEMES[style_id]
+    css_w, css_h = CANVAS_SIZES[size]
+    pad = theme["padding"] * scale
+    top = pad + theme["header"] * scale
+    return pad, top, css_w * scale - 2 * pad, css_h * scale - pad - top
+
+
+def render_page(page_text: str, style_id: str = "minimal", size: str = "375x500", page_num: int = 1,
+                date: str = "", body_size: float = 15, heading_scale: int = 26, pixel_ratio: int = 2,
+                image_root: str = ""):
+    """渲染单页正文卡片，返回 (PIL.Image, 实际使用的正文字号)。"""
+    theme = THEMES[style_id]
+    css_w, css_h = CANVAS_SIZES[size]
+    scale = pixel_ratio
+    img = Image.new("RGB", (css_w * scale, css_h * scale), _rgb(theme["bg"]))
+    _draw_background(img, theme, scale)
+
+    x0, top, width, body_h = content_box(style_id, size, scale)
+    _draw_page_header(ImageDraw.Draw(img), theme, style_id, x0, theme["padding"] * scale, width, date, page_num, scale)
+    bottom = top + body_h
+
+    blocks = parse_blocks(page_text, image_root)
+    items, used_size = fit_page(blocks, theme, width, body_h, body_size, heading_scale, scale)
+    draw_items(img, items, theme, style_id, x0, top, width, bottom, scale)
+    return img, used_size
+
+
+def _fit_title(title: str, family: str, max_size: int, width: float, max_height: float, scale: int) -> tuple:
+    """封面标题自动缩放：从设定字号开始缩小，直到整段标题放进可用高度。"""
+    size = max_size
+    while True:
+        px = round(size * scale)
+        lines = wrap_tokens([(t, True) for t, _ in tokenize(title)], family, px, width)
+        if px * 1.15 * len(lines) <= max_height or size <= 16:
+            return lines, px
+        size -= 2
+
+
+def render_cover(title: str, style_id: str = "minimal", size: str = "375x500", date: str = "", tag: str = "",
+                 intro: str = "", title_size: int = 48, pixel_ratio: int = 2, cover_image: str = None):
+    """渲染封面卡片（对应编辑器里的 renderCoverHTML）。"""
+    theme = THEMES[style_id]
+    css_w, css_h = CANVAS_SIZES[size]
+    scale = pixel_ratio
+    W, H = css_w * scale, css_h * scale
+    img = Image.new("RGB", (W, H), _rgb(theme["bg"]))
+    draw = ImageDraw.Draw(img)
+    family = "sans" if style_id != "serif" else "serif"
+    small = load_font(family, True, 12 * scale)
+    text_top = 0
+
+    if cover_image and os.path.isfile(cover_image):
+        # 有封面图：上 55% 放图（cover 裁切），下 45% 放文字
+        img_h = round(H * 0.55)
+        with Image.open(cover_image) as im:
+            pic = ImageOps.fit(ImageOps.exif_transpose(im).convert("RGB"), (W, img_h))
+        img.paste(pic, (0, 0))
+        text_top = img_h
+    else:
+        _draw_background(img, theme, scale)
+
+    pad = (40 if style_id == "minimal" else theme["padding"] + 8) * scale
+    x0, width = pad, W - 2 * pad
+    area_h = H - text_top - 2 * pad
+    title_color = _rgb(theme["accent"] if style_id == "tech" else theme["text"])
+    lines, px = _fit_title(title, family, title_size, width - (24 * scale if style_id == "serif" else 0),
+                           area_h * 0.6, scale)
+    line_h = px * 1.15
+    block_h = line_h * len(lines)
+    y = text_top + pad + (area_h - block_h) / 2
+    x = x0 + (24 * scale if style_id == "serif" else 0)
+
+    # 标题上方：日期 / 装饰
+    if style_id == "tech":
+        draw.text((W / 2, y - 28 * scale), "SYSTEM READY", font=small, fill=_rgb(theme["accent"]), anchor="ms")
+    else:
+        draw.text((x, y - 24 * scale), date, font=small,
+                  fill=_rgb(theme["accent"] if style_id == "serif" else theme["gray"]))
+    if style_id == "serif":
+        draw.rectangle([x0, y - 32 * scale, x0 + 4 * scale, y + block_h + 40 * scale], fill=_rgb(theme["accent"]))
+
+    for n, line in enumerate(lines):
+        line_w = sum(t[2] for t in line)
+        lx = (W - line_w) / 2 if style_id in ("acid", "tech") else x
+        _draw_line(draw, line, lx, y + n * line_h, line_h, family, px, title_color)
+    y += block_h + 16 * scale
+
+    # 标题下方：简介 / 作者
+    if style_id == "minimal":
+        draw.rectangle([x0, y, x0 + 64 * scale, y + 4 * scale], fill=_rgb(theme["accent"]))
+        y += 20 * scale
+        if intro:
+            intro_px = 16 * scale
+            for line in wrap_tokens(tokenize(intro), family, intro_px, width)[:4]:
+                _draw_line(draw, line, x0, y, intro_px * 1.6, family, intro_px, _rgb(theme["gray"]))
+                y += intro_px * 1.6
+        foot = H - pad
+        draw.line([(x0, foot - 32 * scale), (x0 + width, foot - 32 * scale)], fill=_rgb(theme["border"]), width=scale)
+        draw.text((x0, foot - 8 * scale), tag, font=small, fill=_rgb(theme["text"]), anchor="ls")
+    elif style_id == "acid":
+        tag_w = small.getlength(tag) + 32 * scale
+        draw.rectangle([(W - tag_w) / 2, y, (W + tag_w) / 2, y + 32 * scale], fill=(0, 0, 0))
+        draw.text((W / 2, y + 16 * scale), tag, font=small, fill=_rgb(theme["bg"]), anchor="mm")
+    elif style_id == "tech":
+        draw.text((W / 2, y + 12 * scale), f"{date} // {tag}", font=small, fill=_rgb(theme["gray"]), anchor="ms")
+    else:
+        draw.text((x, y + 24 * scale), tag, font=small, fill=_rgb(theme["gray"]))
+    return img
+
+# ==========================================
+# 编码：格式 + 单张字节预算（与编辑器的导出设置一致）
+# ==========================================
+EXPORT_FORMATS = {"jpeg": ("JPEG", "jpg"), "webp": ("WEBP", "webp"), "png": ("PNG", "png")}
+MIN_QUALITY = 40
+QUALITY_SEARCH_STEPS = 6
+
+
+def encode_image(img, fmt: str = "jpeg", quality: int = 92, max_bytes: int = 0) -> bytes:
+    """把图片编码成字节。有 max_bytes 时在 [MIN_QUALITY, quality] 上二分，取不超预算的最高质量。"""
+    pil_format, _ = EXPORT_FORMATS[fmt]
+
+    def encode(q):
+        buf = io.BytesIO()
+        if pil_format == "PNG":
+            img.save(buf, "PNG", optimize=True)
+        else:
+            img.save(buf, pil_format, quality=q)
+        return buf.getvalue()
+
+    data = encode(quality)
+    if pil_format == "PNG" or not max_bytes or len(data) <= max_bytes:
+        return data
+    lo, hi, best = MIN_QUALITY, quality, None
+    for _ in range(QUALITY_SEARCH_STEPS):
+        q = (lo + hi) // 2
+        candidate = encode(q)
+        if len(candidate) <= max_bytes:
+            best, lo = candidate, q
+        else:
+            hi = q
+        if hi - lo <= 1:
+            break
+    return best or encode(MIN_QUALITY)  # 最低质量仍超预算时，返回能做到的最小结果
+
+
+# ==========================================
+# 整篇渲染 & 多进程批量
+# ==========================================
+def render_post(markdown_text: str, out_dir: str, title: str = "", style_id: str = "minimal",
+                size: str = "375x500", date: str = "VOL.08", tag: str = "@常用名", intro: str = "",
+                title_size: int = 48, body_size: float = 15, heading_scale: int = 26,
+                pixel_ratio: int = 2, quality: int = 92, cover_image: str = None, image_root: str = "",
+                auto_paginate: bool = False, fmt: str = "jpeg", max_bytes: int = 0) -> list:
+    """渲染一整篇帖子（封面 + 各分页），按 fmt（jpeg / webp / png，见 EXPORT_FORMATS）写出图片并返回文件路径列表。
+
+    max_bytes > 0 时每张图压到这个字节数以内（PNG 不压，见 encode_image）。
+
+    auto_paginate=True 时先按画布实测重新分页（见 pagination.py），每页都能以设定字号放下。
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    ext = EXPORT_FORMATS[fmt][1]
+
+    def save(img, name):
+        path = os.path.join(out_dir, f"{name}.{ext}")
+        with open(path, "wb") as f:
+            f.write(encode_image(img, fmt, quality, max_bytes))
+        paths.append(path)
+
+    if auto_paginate:
+        from pagination import repaginate  # pagination 依赖本模块的排版函数，延迟导入避免循环
+        markdown_text = repaginate(markdown_text, style_id, size, body_size, heading_scale, image_root=image_root)
+
+    cover = render_cover(title, style_id, size, date, tag, intro, title_size, pixel_ratio, cover_image)
+    save(cover, "rednote_cover")
+
+    for index, page_text in enumerate(split_pages(markdown_text)):
+        page, _ = render_page(page_text, style_id, size, index + 1, date, body_size, heading_scale,
+                              pixel_ratio, image_root)
+        save(page, f"rednote_page_{index + 1}")
+    return paths
+
+
+def _render_job(job: dict) -> tuple:
+    """子进程入口：job 为 render_post 的关键字参数。"""
+    return job["out_dir"], render_post(**job)
+
+
+def render_batch(posts: list, out_root: str, max_workers: int = None, **options) -> dict:
+    """多进程批量渲染。posts 为 {"title"/"topic", "text"} 列表（兼容 history.json），返回 {输出目录: 文件列表}。"""
+    jobs = []
+    for i, post in enumerate(posts):
+        if isinstance(post, str):
+            post = {"text": post}
+        title = post.get("title") or post.get("topic") or ""
+        folder = post.get("id") or f"post_{i + 1:04d}"
+        jobs.append({**options, "markdown_text": post["text"], "title": title,
+                     "out_dir": os.path.join(out_root, str(folder))})
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(_render_job, job): job for job in jobs}
+        for future in as_completed(futures):
+            try:
+                out_dir, paths = future.result()
+                results[out_dir] = paths
+            except Exception as e:
+                logger.error("渲染失败 %s: %s", futures[future]["out_dir"], e)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量把生成的文案渲染成小红书卡片 JPG")
+    parser.add_argument("input", help="JSON 文件：[...] / {\"posts\": [...]} / history.json")
+    parser.add_argument("-o", "--out", default="output", help="输出目录")
+    parser.add_argument("--style", default="minimal", choices=list(THEMES))
+    parser.add_argument("--size", default="375x500", choices=list(CANVAS_SIZES))
+    parser.add_argument("--body-size", type=float, default=15)
+    parser.add_argument("--title-size", type=int, default=48)
+    parser.add_argument("--heading-scale", type=int, default=26)
+    parser.add_argument("--pixel-ratio", type=int, default=2)
+    parser.add_argument("--auto-paginate", action="store_true", help="忽略模型给的 @---，按画布实测重新分页")
+    parser.add_argument("--format", default="jpeg", choices=list(EXPORT_FORMATS))
+    parser.add_argument("--max-kb", type=int, default=0, help="单张图片大小上限（KB），0 为不限")
+    parser.add_argument("--date", default="VOL.08")
+    parser.add_argument("--tag", default="@常用名")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="进程数，默认等于 CPU 核数")
+    parser.add_argument("--allow-default-font", action="store_true", help="缺少中文字体时仍用 Pillow 内置字体渲染（仅适合纯英文内容）")
+    args = parser.parse_args()
+
+    problem = font_problem(THEMES[args.style]["font"])
+    if problem and not args.allow_default_font:
+        parser.error(problem)
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    with open(args.input, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    posts = data["posts"] if isinstance(data, dict) and "posts" in data else data
+
+    results = render_batch(
+        posts, args.out, max_workers=args.workers,
+        style_id=args.style, size=args.size, body_size=args.body_size, title_size=args.title_size,
+        heading_scale=args.heading_scale, pixel_ratio=args.pixel_ratio, date=args.date, tag=args.tag,
+        image_root=os.path.dirname(os.path.abspath(args.input)), auto_paginate=args.auto_paginate,
+        fmt=args.format, max_bytes=args.max_kb * 1024,
+    )
+    total = sum(len(p) for p in results.values())
+    logger.info("完成：%d 篇帖子，共 %d 张图片 -> %s", len(results), total, args.out)
+
+
+if __name__ == "__main__":
+    main()
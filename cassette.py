@@ -0,0 +1,162 @@
+"""
+DeepSeek 调用的录制 / 回放：复现性能问题、离线跑基准时，让 API 的行为完全确定。
+
+    XHS_CASSETTE_MODE=record  真实调用，同时把每个请求的参数、返回内容（含 usage）、报错和耗时追加到录制文件
+    XHS_CASSETTE_MODE=replay  不联网，按请求参数从录制文件里取出当时的结果，并按原耗时等待后返回
+    XHS_CASSETTE              录制文件路径，默认 cassette.jsonl（每行一次调用）
+    XHS_CASSETTE_TIME_SCALE   回放耗时的倍数：1 为原速，0.1 为十倍速，0 为不等待
+
+录制的是 chat.completions.create 这一层（SDK 内部的 HTTP 库各版本不同），限速、Key 无效等报错也会原样回放，
+初稿 → 排版的完整流程、重试和限速退避都能在没有网络的机器上复现。
+同样的请求录了多次时按顺序依次回放（比如先限速、重试后成功），用完后一直重复最后一次。
+重试前的退避等待走 backoff_sleep，回放时同样按 XHS_CASSETTE_TIME_SCALE 缩放。
+回放时 API Key 随便填一个即可，不会发出请求，也不会写进录制文件。
+
+    XHS_CASSETTE_MODE=record DEEPSEEK_API_KEY=sk-... python benchmark.py --live
+    XHS_CASSETTE_MODE=replay XHS_CASSETTE_TIME_SCALE=0 DEEPSEEK_API_KEY=x python benchmark.py --live
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from types import SimpleNamespace
+
+import openai
+from openai.types.chat import ChatCompletion
+
+logger = logging.getLogger(__name__)
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+RECORD, REPLAY = "record", "replay"
+CASSETTE_MODE = os.environ.get("XHS_CASSETTE_MODE", "")
+CASSETTE_FILE = os.environ.get("XHS_CASSETTE", os.path.join(base_dir, "cassette.jsonl"))
+CASSETTE_TIME_SCALE = float(os.environ.get("XHS_CASSETTE_TIME_SCALE", "1"))
+
+# 回放报错时按状态码还原成 SDK 的异常类型，调用方的 except 分支与真实调用时一致
+_STATUS_ERRORS = {
+    400: openai.BadRequestError,
+    401: openai.AuthenticationError,
+    403: openai.PermissionDeniedError,
+    404: openai.NotFoundError,
+    409: openai.ConflictError,
+    422: openai.UnprocessableEntityError,
+    429: openai.RateLimitError,
+}
+
+
+class CassetteMiss(LookupError):
+    """回放模式下，录制文件里没有这个请求。"""
+
+
+def request_key(request: dict) -> str:
+    """同样的模型、消息和参数得到同一个 key（与参数顺序无关）。"""
+    return hashlib.sha256(json.dumps(request, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def _error_entry(e: Exception) -> dict:
+    if isinstance(e, openai.APIStatusError):
+        return {"status": e.status_code, "message": e.message, "body": e.body}
+    return {"status": None, "message": str(e), "body": None}
+
+
+def _rebuild_error(error: dict) -> Exception:
+    status = error["status"]
+    if status is None:
+        return openai.APIConnectionError(message=error["message"], request=None)
+    cls = _STATUS_ERRORS.get(status, openai.InternalServerError if status >= 500 else openai.APIStatusError)
+    response = SimpleNamespace(status_code=status, headers={}, request=None)
+    return cls(error["message"], response=response, body=error["body"])
+
+
+class Cassette:
+    """录制文件。进程内共用一个实例，多个工作线程同时录制 / 回放是安全的。"""
+
+    def __init__(self, path: str = CASSETTE_FILE, mode: str = REPLAY, time_scale: float = CASSETTE_TIME_SCALE):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"XHS_CASSETTE_MODE 只能是 {RECORD} 或 {REPLAY}")
+        self.path = path
+        self.mode = mode
+        self.time_scale = time_scale
+        self._lock = threading.Lock()
+        self._entries = self._load() if mode == REPLAY else {}  # key -> [录制记录, ...]
+        self._cursor = {}  # key -> 下一次回放第几条
+
+    def _load(self) -> dict:
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"录制文件 {self.path} 不存在，请先用 XHS_CASSETTE_MODE=record 录制")
+        entries = {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    entries.setdefault(entry["key"], []).append(entry)
+        return entries
+
+    def _append(self, entry: dict):
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def call(self, create, **request):
+        """代替 client.chat.completions.create(**request)。"""
+        key = request_key(request)
+        if self.mode == REPLAY:
+            return self._replay(key)
+
+        started = time.perf_counter()
+        entry = {"key": key, "request": request}
+        try:
+            response = create(**request)
+        except Exception as e:
+            self._append(dict(entry, latency=time.perf_counter() - started, error=_error_entry(e)))
+            raise
+        self._append(dict(entry, latency=time.perf_counter() - started, response=response.model_dump(mode="json")))
+        return response
+
+    def _replay(self, key: str):
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                raise CassetteMiss(f"录制文件 {os.path.basename(self.path)} 中没有这个请求（Prompt 或参数与录制时不同）")
+            index = self._cursor.get(key, 0)
+            self._cursor[key] = index + 1
+            entry = entries[min(index, len(entries) - 1)]
+        if self.time_scale > 0:
+            time.sleep(entry["latency"] * self.time_scale)
+        if "error" in entry:
+            raise _rebuild_error(entry["error"])
+        return ChatCompletion.model_validate(entry["response"])
+
+
+_cassette = None
+_cassette_lock = threading.Lock()
+
+
+def get_cassette():
+    """按环境变量创建进程内唯一的录制文件实例；没开启录制 / 回放时返回 None。"""
+    global _cassette
+    if not CASSETTE_MODE:
+        return None
+    with _cassette_lock:
+        if _cassette is None:
+            _cassette = Cassette(CASSETTE_FILE, CASSETTE_MODE, CASSETTE_TIME_SCALE)
+            logger.info("API 调用%s：%s", "录制中" if CASSETTE_MODE == RECORD else "回放自录制文件", CASSETTE_FILE)
+        return _cassette
+
+
+def backoff_sleep(seconds: float):
+    """重试前的等待。回放时按回放倍数缩放：录下来的 429 不必真的再等 5 / 10 / 20 秒。"""
+    cassette = get_cassette()
+    if cassette is not None and cassette.mode == REPLAY:
+        seconds *= cassette.time_scale
+    if seconds > 0:
+        time.sleep(seconds)
+
+
+def chat_completion(client, **request):
+    """generation 发出请求的唯一入口：开启录制 / 回放时经过 Cassette，否则直接调用。"""
+    cassette = get_cassette()
+    if cassette is None:
+        return client.chat.completions.create(**request)
+    return cassette.call(client.chat.completions.create, **request)
@@ -0,0 +1,242 @@
+"""
+爆款案例库：把案例帖子连同平台、标签和预先算好的特征（字数、Token 数、页数、Emoji 数）存进 SQLite，
+用 FTS5 全文索引按关键词检索，UI 和命令行都可以按条件挑一组案例来生成。
+
+trigram 分词对中文按子串匹配，关键词至少 3 个字；更短的关键词退回 LIKE 扫描。
+
+    python corpus.py import posts.json --platform 小红书 --tags 职场,AI
+    python corpus.py search 副业 --tag 职场 --limit 5
+    python corpus.py stats
+    python corpus.py delete 12 13
+"""
+import os
+import re
+import sys
+import json
+import sqlite3
+import hashlib
+import argparse
+from contextlib import closing
+from datetime import datetime
+
+from generation import base_dir, estimate_tokens
+from emoji_pattern import EMOJI_RE
+from format_check import split_pages
+from post_ingest import ingest_upload, normalize_post
+
+CORPUS_DB = os.environ.get("XHS_CORPUS_DB", os.path.join(base_dir, "corpus.db"))
+MIN_FTS_QUERY_CHARS = 3  # trigram 分词的最短匹配长度
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    id INTEGER PRIMARY KEY,
+    text TEXT NOT NULL,
+    digest TEXT NOT NULL UNIQUE,
+    platform TEXT NOT NULL DEFAULT '',
+    tags TEXT NOT NULL DEFAULT '',
+    char_count INTEGER NOT NULL,
+    token_count INTEGER NOT NULL,
+    page_count INTEGER NOT NULL,
+    emoji_count INTEGER NOT NULL,
+    created TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_posts_platform ON posts(platform);
+CREATE INDEX IF NOT EXISTS idx_posts_char_count ON posts(char_count);
+CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(
+    text, tags, content='posts', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS posts_ai AFTER INSERT ON posts BEGIN
+    INSERT INTO posts_fts(rowid, text, tags) VALUES (new.id, new.text, new.tags);
+END;
+CREATE TRIGGER IF NOT EXISTS posts_ad AFTER DELETE ON posts BEGIN
+    INSERT INTO posts_fts(posts_fts, rowid, text, tags) VALUES ('delete', old.id, old.text, old.tags);
+END;
+CREATE TRIGGER IF NOT EXISTS posts_au AFTER UPDATE ON posts BEGIN
+    INSERT INTO posts_fts(posts_fts, rowid, text, tags) VALUES ('delete', old.id, old.text, old.tags);
+    INSERT INTO posts_fts(rowid, text, tags) VALUES (new.id, new.text, new.tags);
+END;
+"""
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def parse_tags(tags) -> list:
+    """"职场, AI，副业" 或 ["职场", "AI"] → ["职场", "AI", "副业"]（去空白、去重、保持顺序）。"""
+    if isinstance(tags, str):
+        tags = re.split(r"[,，、\s]+", tags)
+    return list(dict.fromkeys(t.strip() for t in tags if t and t.strip()))
+
+
+def post_features(text: str) -> dict:
+    """入库时一次性算好的特征，组装 Prompt 时不必再扫描原文。"""
+    return {
+        "char_count": len(text),
+        "token_count": estimate_tokens(text),
+        "page_count": len(split_pages(text)),
+        "emoji_count": len(EMOJI_RE.findall(text)),
+    }
+
+
+class CorpusStore:
+    """案例库。每次操作单独开连接，可以在 Streamlit 的多个会话线程里共用一个实例。"""
+
+    def __init__(self, path: str = CORPUS_DB):
+        self.path = path
+        with closing(self._connect()) as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    # ---------- 写入 ----------
+    def add_posts(self, posts, platform: str = "", tags=()) -> tuple:
+        """批量入库，返回 (新增条数, 已存在而跳过的条数)。正文相同（忽略空白）的帖子只存一份。"""
+        tag_text = ",".join(parse_tags(tags))
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        added = skipped = 0
+        with closing(self._connect()) as conn, conn:
+            for post in posts:
+                text = normalize_post(post)
+                if not text:
+                    continue
+                digest = hashlib.md5(_WHITESPACE_RE.sub("", text).encode("utf-8")).hexdigest()
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO posts (text, digest, platform, tags, char_count, token_count, "
+                    "page_count, emoji_count, created) VALUES (:text, :digest, :platform, :tags, :char_count, "
+                    ":token_count, :page_count, :emoji_count, :created)",
+                    dict(post_features(text), text=text, digest=digest, platform=platform.strip(),
+                         tags=tag_text, created=now),
+                )
+                if cursor.rowcount:
+                    added += 1
+                else:
+                    skipped += 1
+        return added, skipped
+
+    def delete(self, ids: list) -> int:
+        with closing(self._connect()) as conn, conn:
+            return conn.executemany("DELETE FROM posts WHERE id = ?", [(i,) for i in ids]).rowcount
+
+    # ---------- 查询 ----------
+    def search(self, query: str = "", tags=(), platform: str = "", min_chars: int = 0, max_chars: int = 0,
+               limit: int = 20) -> list:
+        """按关键词 / 标签 / 平台 / 字数筛选，返回帖子字典列表（含预先算好的特征）。
+
+        有关键词时按相关度排序，否则按入库时间倒序。
+        """
+        sql, where, params, order = "SELECT posts.* FROM posts", [], [], "posts.id DESC"
+        query = query.strip()
+        if len(query) >= MIN_FTS_QUERY_CHARS:
+            sql += " JOIN posts_fts ON posts_fts.rowid = posts.id"
+            where.append("posts_fts MATCH ?")
+            params.append('"' + query.replace('"', '""') + '"')
+            order = "posts_fts.rank"
+        elif query:
+            where.append("posts.text LIKE ?")
+            params.append(f"%{query}%")
+        for tag in parse_tags(tags):
+            where.append("(',' || posts.tags || ',') LIKE ?")
+            params.append(f"%,{tag},%")
+        if platform:
+            where.append("posts.platform = ?")
+            params.append(platform)
+        if min_chars:
+            where.append("posts.char_count >= ?")
+            params.append(min_chars)
+        if max_chars:
+            where.append("posts.char_count <= ?")
+            params.append(max_chars)
+
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {order} LIMIT ?"
+        params.append(limit)
+        with closing(self._connect()) as conn:
+            return [dict(row) for row in conn.execute(sql, params)]
+
+    def get_posts(self, ids: list) -> list:
+        """按给定顺序取出帖子。"""
+        if not ids:
+            return []
+        with closing(self._connect()) as conn:
+            rows = conn.execute(f"SELECT * FROM posts WHERE id IN ({','.join('?' * len(ids))})", ids)
+            by_id = {row["id"]: dict(row) for row in rows}
+        return [by_id[i] for i in ids if i in by_id]
+
+    def platforms(self) -> list:
+        with closing(self._connect()) as conn:
+            return [r[0] for r in conn.execute("SELECT DISTINCT platform FROM posts WHERE platform != '' ORDER BY 1")]
+
+    def tags(self) -> list:
+        with closing(self._connect()) as conn:
+            values = [r[0] for r in conn.execute("SELECT DISTINCT tags FROM posts WHERE tags != ''")]
+        return sorted({tag for value in values for tag in value.split(",")})
+
+    def stats(self) -> dict:
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT COUNT(*), COALESCE(SUM(token_count), 0), COALESCE(AVG(char_count), 0) "
+                               "FROM posts").fetchone()
+        return {"posts": row[0], "tokens": row[1], "avg_chars": round(row[2])}
+
+
+# ==========================================
+# 命令行
+# ==========================================
+def _print_posts(posts: list, as_json: bool):
+    if as_json:
+        print(json.dumps({"posts": [p["text"] for p in posts]}, ensure_ascii=False, indent=2))
+        return
+    for p in posts:
+        preview = p["text"].replace("\n", " ")[:40]
+        print(f"#{p['id']:<6} {p['char_count']:>5} 字  {p['platform'] or '-':<6} [{p['tags']}]  {preview}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="爆款案例库（SQLite + 全文检索）")
+    parser.add_argument("--db", default=CORPUS_DB, help="案例库文件路径")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_import = sub.add_parser("import", help="从 JSON 导入（[...] 或 {\"posts\": [...]}，自动清洗去重）")
+    p_import.add_argument("files", nargs="+")
+    p_import.add_argument("--platform", default="")
+    p_import.add_argument("--tags", default="", help="逗号分隔")
+
+    p_search = sub.add_parser("search", help="检索案例；加 --json 可直接作为 UI 的上传文件")
+    p_search.add_argument("query", nargs="?", default="")
+    p_search.add_argument("--tag", action="append", default=[])
+    p_search.add_argument("--platform", default="")
+    p_search.add_argument("--min-chars", type=int, default=0)
+    p_search.add_argument("--max-chars", type=int, default=0)
+    p_search.add_argument("--limit", type=int, default=20)
+    p_search.add_argument("--json", action="store_true")
+
+    p_delete = sub.add_parser("delete", help="按编号删除案例")
+    p_delete.add_argument("ids", nargs="+", type=int)
+
+    sub.add_parser("stats", help="案例库概况")
+    args = parser.parse_args()
+
+    store = CorpusStore(args.db)
+    if args.command == "import":
+        for path in args.files:
+            with open(path, "rb") as f:
+                ingest = ingest_upload(f)
+            added, skipped = store.add_posts(ingest["posts"], args.platform, args.tags)
+            print(f"{path}: 读取 {ingest['total']} 条，去重后 {len(ingest['posts'])} 条，新增 {added} 条，已存在 {skipped} 条")
+    elif args.command == "search":
+        _print_posts(store.search(args.query, args.tag, args.platform, args.min_chars, args.max_chars, args.limit),
+                     args.json)
+    elif args.command == "delete":
+        print(f"已删除 {store.delete(args.ids)} 条")
+    else:
+        s = store.stats()
+        print(f"共 {s['posts']} 条案例，平均 {s['avg_chars']} 字，约 {s['tokens']} Token")
+        print("平台：" + ("、".join(store.platforms()) or "-"))
+        print("标签：" + ("、".join(store.tags()) or "-"))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,15 @@
+"""
+Emoji 的正则：排版校验（format_check）、案例压缩（example_compress）和卡片渲染（card_renderer）共用一份，
+数 Emoji 和画 Emoji 的规则不会各自走样。这里只依赖标准库，format_check 引入它不会连带引入 Pillow。
+
+一个 Emoji 序列指：国旗（两个区域指示符），或一个 Emoji 字符加可选的变体选择符 / 肤色，
+再用零宽连接符（ZWJ）串起来的组合（如 👩‍💻）。
+"""
+import re
+
+_EMOJI_CHARS = r"\U0001F300-\U0001FAFF\u2600-\u27BF\u2B00-\u2BFF\u2300-\u23FF"
+EMOJI_SEQ = (
+    r"(?:[\U0001F1E6-\U0001F1FF]{2}"
+    rf"|[{_EMOJI_CHARS}][\uFE0F\U0001F3FB-\U0001F3FF]?(?:\u200D[{_EMOJI_CHARS}]\uFE0F?)*)"
+)
+EMOJI_RE = re.compile(EMOJI_SEQ)
@@ -0,0 +1,154 @@
+"""
+案例压缩：案例原文会逐字放进 Prompt，其中连串的重复 Emoji、标点、装饰分隔线、话题标签和大段空白
+几乎不携带风格信息，却要按 Token 付费。发送前先压缩一遍：
+
+- 同一个 Emoji 连续出现时最多留 2 个，不同 Emoji 连成一串时最多留 3 个；
+- 同一个标点连续出现时最多留 2 个（！！！！ → ！！）；
+- 只有符号的装饰分隔线（━━━━━━）缩成 3 个字符；
+- 行末空白、多余空格和连续空行收紧；
+- 末尾的话题标签去重，最多留 5 个；
+- 特别长的案例只保留开头钩子、中间一段样本和结尾的行动引导。
+
+分页符 `@---`、Markdown 表格 / 分隔线和加粗不受影响；截短的案例在原处只留一个空行，不插入省略说明
+（案例是让模型模仿的样本，说明文字会被照抄进生成结果）。
+
+默认关闭（压缩会改变 Prompt，也就改变缓存键，已有缓存不再命中）。先用 benchmark.py --compression
+确认风格保真，再设环境变量 XHS_COMPRESS_EXAMPLES=1 或在侧边栏打开。
+
+    texts, stats = compress_examples(texts)
+    stats["tokens_before"], stats["tokens_after"]
+"""
+import os
+import re
+
+from emoji_pattern import EMOJI_SEQ, EMOJI_RE
+from format_check import PAGE_BREAK_RE
+
+COMPRESS_EXAMPLES = os.environ.get("XHS_COMPRESS_EXAMPLES", "0") == "1"
+MAX_SAME_EMOJI = 2
+MAX_EMOJI_RUN = 3
+MAX_SAME_PUNCT = 2
+MAX_HASHTAGS = 5
+DECOR_KEEP = 3
+# 超过 MAX_EXAMPLE_CHARS 字的案例：开头 / 中间 / 结尾各保留这么多字（按整行取）
+MAX_EXAMPLE_CHARS = 1000
+HEAD_CHARS, MIDDLE_CHARS, TAIL_CHARS = 450, 200, 250
+
+_SAME_EMOJI_RE = re.compile(rf"({EMOJI_SEQ})(?:\1){{{MAX_SAME_EMOJI},}}")
+_EMOJI_RUN_RE = re.compile(rf"(?:{EMOJI_SEQ}){{{MAX_EMOJI_RUN + 1},}}")
+# * - _ = 不在其中：***、--- 在 Markdown 里有含义
+_SAME_PUNCT_RE = re.compile(rf"([！!？?。.~～…，,、；;：:·•♪☆★♡♥])\1{{{MAX_SAME_PUNCT},}}")
+_INNER_SPACES_RE = re.compile(r"(?<=\S)[ \t　]{2,}(?=\S)")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+_WORD_RE = re.compile(r"\w")
+_HASHTAG_RE = re.compile(r"#[^#\s]+(?:#(?=\s|$))?")
+# 整行只有表格 / 分隔线语法（|---|:--:|、---、***、@---）：原样保留
+_MARKUP_LINE_RE = re.compile(r"[ \t|:\-=*_+@]*[|\-=*_@][ \t|:\-=*_+@]*")
+
+
+def _collapse_line(line: str) -> str:
+    line = line.rstrip()
+    if not line or PAGE_BREAK_RE.fullmatch(line) or _MARKUP_LINE_RE.fullmatch(line):
+        return line
+    stripped = line.strip()
+    if len(stripped) > DECOR_KEEP + 1 and not _WORD_RE.search(stripped) and not EMOJI_RE.search(stripped):
+        return stripped.replace(" ", "")[:DECOR_KEEP]
+    line = _SAME_EMOJI_RE.sub(lambda m: m.group(1) * MAX_SAME_EMOJI, line)
+    line = _EMOJI_RUN_RE.sub(lambda m: "".join(EMOJI_RE.findall(m.group(0))[:MAX_EMOJI_RUN]), line)
+    line = _SAME_PUNCT_RE.sub(lambda m: m.group(1) * MAX_SAME_PUNCT, line)
+    return _INNER_SPACES_RE.sub(" ", line)
+
+
+def _is_tag_line(line: str) -> bool:
+    return bool(_HASHTAG_RE.search(line)) and not _HASHTAG_RE.sub("", line).strip()
+
+
+def _dedupe_hashtag_tail(lines: list) -> list:
+    """末尾只有话题标签的几行合成一行，去重后最多留 MAX_HASHTAGS 个。"""
+    start = len(lines)
+    while start > 0 and (not lines[start - 1].strip() or _is_tag_line(lines[start - 1])):
+        start -= 1
+    tags, seen = [], set()
+    for line in lines[start:]:
+        for tag in _HASHTAG_RE.findall(line):
+            name = tag.strip("#").replace("[话题]", "")
+            if name not in seen:
+                seen.add(name)
+                tags.append(tag)
+    if not tags:
+        return lines
+    return lines[:start] + [" ".join(tags[:MAX_HASHTAGS])]
+
+
+def _take_lines(lines: list, indexes, budget: int) -> list:
+    """按顺序取整行，直到字数用完（至少取一行）。"""
+    taken, used = [], 0
+    for i in indexes:
+        if taken and used + len(lines[i]) > budget:
+            break
+        taken.append(i)
+        used += len(lines[i])
+    return taken
+
+
+def _cap_length(text: str) -> str:
+    """保留开头钩子、中间一段样本和结尾的行动引导，各段之间只隔一个空行。"""
+    if len(text) <= MAX_EXAMPLE_CHARS:
+        return text
+    lines = text.split("\n")
+    head = _take_lines(lines, range(len(lines)), HEAD_CHARS)
+    tail = _take_lines(lines, range(len(lines) - 1, head[-1], -1), TAIL_CHARS)
+    if not tail or sum(len(lines[i]) for i in head + tail) > MAX_EXAMPLE_CHARS:
+        # 少数几行特别长（没怎么换行），按字数截取
+        return text[:HEAD_CHARS].rstrip() + "\n\n" + text[-TAIL_CHARS:].lstrip()
+    gap = range(head[-1] + 1, tail[-1])
+    middle = _take_lines(lines, range((gap.start + gap.stop) // 2, gap.stop), MIDDLE_CHARS) if gap else []
+    sections = [head] + ([middle] if middle else []) + [tail[::-1]]
+    return "\n\n".join("\n".join(lines[i] for i in section).strip("\n") for section in sections)
+
+
+def _collapse(text: str) -> str:
+    lines = [_collapse_line(line) for line in text.replace("\r\n", "\n").split("\n")]
+    text = "\n".join(_dedupe_hashtag_tail(lines))
+    return _BLANK_LINES_RE.sub("\n\n", text).strip()
+
+
+def compress_post(text: str) -> str:
+    return _cap_length(_collapse(text))
+
+
+def compress_examples(texts: list) -> tuple:
+    """压缩一组案例，返回 (压缩后的案例, {"tokens_before", "tokens_after", "posts_capped"})。"""
+    from generation import estimate_tokens  # generation 在组装 Prompt 时才调用这里，避免循环导入
+
+    collapsed = [_collapse(t) for t in texts]
+    compressed = [_cap_length(t) for t in collapsed]
+    return compressed, {
+        "tokens_before": sum(estimate_tokens(t) for t in texts),
+        "tokens_after": sum(estimate_tokens(t) for t in compressed),
+        "posts_capped": sum(len(t) > MAX_EXAMPLE_CHARS for t in collapsed),
+    }
+
+
+# ==========================================
+# 风格特征（benchmark 用来检查压缩是否保真）
+# ==========================================
+_SENTENCE_END_RE = re.compile(r"[。！!？?…]+|\n")
+
+
+def style_profile(texts: list) -> dict:
+    """一组文本的风格特征均值：Emoji 密度、感叹 / 疑问比例、平均行长、加粗密度、分页数。"""
+    profiles = []
+    for text in texts:
+        chars = max(len(text), 1)
+        ends = [m.group(0) for m in _SENTENCE_END_RE.finditer(text) if m.group(0) != "\n"] or [""]
+        lines = [line for line in text.split("\n") if line.strip()]
+        profiles.append({
+            "emoji_per_100": len(EMOJI_RE.findall(text)) / chars * 100,
+            "exclaim_ratio": sum(("！" in e or "!" in e) for e in ends) / len(ends),
+            "question_ratio": sum(("？" in e or "?" in e) for e in ends) / len(ends),
+            "avg_line_chars": sum(len(line.strip()) for line in lines) / max(len(lines), 1),
+            "bold_per_100": text.count("**") / 2 / chars * 100,
+            "pages": len(PAGE_BREAK_RE.findall(text)) + 1,
+        })
+    return {key: sum(p[key] for p in profiles) / len(profiles) for key in profiles[0]} if profiles else {}
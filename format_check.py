@@ -0,0 +1,91 @@
+"""
+排版规则的本地校验：初稿已经符合排版要求的页，不必再交给模型做一次排版。
+
+规则与 format_content 的排版 Prompt 一致：
+- 每一行文字末尾有两个空格（软换行）。这条本地直接补上，不需要模型；
+- 每页（`@---` 分隔）包含 3~5 个 Emoji；
+- 不能每一行末尾都挂着 Emoji（机械式排版）。
+
+排版后再用 text_preserved 核对模型有没有改动原文：去掉 Emoji 和空白后做一次序列比对。
+"""
+import re
+from difflib import SequenceMatcher
+
+from emoji_pattern import EMOJI_SEQ, EMOJI_RE
+
+EMOJI_AT_END_RE = re.compile(rf"{EMOJI_SEQ}[\s*_~]*$")
+PAGE_BREAK_RE = re.compile(r"^[ \t]*@---[ \t]*$", re.MULTILINE)
+PAGE_BREAK = "@---"
+MIN_PAGE_EMOJI, MAX_PAGE_EMOJI = 3, 5
+# 允许的改动字数：全角/半角标点之类的细微差异不算改写，超过则视为模型改了原文
+MAX_CHANGED_CHARS = 2
+MAX_CHANGED_RATIO = 0.01
+_DIFF_IGNORE_RE = re.compile(rf"{EMOJI_SEQ}|[\s\uFE0F\u200D]")
+
+
+def split_pages(text: str) -> list:
+    """按 `@---` 行拆页；每页保留首尾换行，用 join_pages 拼回时版面不变。"""
+    return PAGE_BREAK_RE.split(text)
+
+
+def join_pages(pages: list) -> str:
+    return PAGE_BREAK.join(pages)
+
+
+def add_soft_breaks(text: str) -> str:
+    """给每一行文字末尾补上两个空格（代码块内、空行和分页行除外）。"""
+    lines, in_code = [], False
+    for line in text.split("\n"):
+        stripped = line.strip()
+        if stripped.startswith("```"):
+            in_code = not in_code
+            lines.append(line)
+        elif in_code or not stripped or PAGE_BREAK_RE.fullmatch(line):
+            lines.append(line)
+        else:
+            lines.append(line.rstrip() + "  ")
+    return "\n".join(lines)
+
+
+def page_problems(page: str) -> list:
+    """返回该页违反的排版规则（中文描述），空列表表示合格。空白页不做要求。"""
+    lines = [line for line in page.split("\n") if line.strip()]
+    if not lines:
+        return []
+    problems = []
+    if any(not line.endswith("  ") for line in lines):
+        problems.append("行末缺少软换行")
+    emoji_count = len(EMOJI_RE.findall(page))
+    if not MIN_PAGE_EMOJI <= emoji_count <= MAX_PAGE_EMOJI:
+        problems.append(f"Emoji 数量为 {emoji_count}，应为 {MIN_PAGE_EMOJI}~{MAX_PAGE_EMOJI} 个")
+    if len(lines) > 1 and all(EMOJI_AT_END_RE.search(line.rstrip()) for line in lines):
+        problems.append("每一行末尾都是 Emoji")
+    return problems
+
+
+def page_ok(page: str) -> bool:
+    """补上软换行之后仍然合格的页，不需要模型再排版。"""
+    return not page_problems(add_soft_breaks(page))
+
+
+def strip_for_diff(text: str) -> str:
+    """去掉 Emoji 和所有空白，只留下排版不应该改动的文字。"""
+    return _DIFF_IGNORE_RE.sub("", text)
+
+
+def changed_chars(original: str, formatted: str) -> int:
+    """两段文字（已去掉 Emoji 和空白）之间被改动的字数。"""
+    if original == formatted:
+        return 0
+    matcher = SequenceMatcher(None, original, formatted, autojunk=False)
+    return sum(max(i2 - i1, j2 - j1) for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != "equal")
+
+
+def text_preserved(original: str, formatted: str) -> bool:
+    """排版结果是否保留了原文的全部文字（允许极少量的标点差异）。"""
+    a, b = strip_for_diff(original), strip_for_diff(formatted)
+    limit = max(MAX_CHANGED_CHARS, int(len(a) * MAX_CHANGED_RATIO))
+    # 长度差已经超出上限时不必再做完整比对
+    if abs(len(a) - len(b)) > limit:
+        return False
+    return changed_chars(a, b) <= limit
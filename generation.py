@@ -0,0 +1,770 @@
+"""
+文案生成核心：缓存、历史记录、Prompt 构建与 DeepSeek 调用。
+
+不依赖 Streamlit，UI 脚本、后台任务队列和命令行工具共用同一套逻辑。
+这些函数会在后台工作线程里运行，所以不直接调用 st.*，提示信息走 logging。
+API 客户端、响应缓存和 Prompt 模板都是进程级共享的：多人同时使用时不会各自重复创建、重复读盘。
+"""
+import os
+import re
+import json
+import string
+import hashlib
+import logging
+import threading
+from concurrent.futures import Future
+from datetime import datetime
+from openai import OpenAI, RateLimitError, AuthenticationError
+
+from quotas import usage_ledger
+from cassette import CassetteMiss, backoff_sleep, chat_completion
+from format_check import split_pages, join_pages, add_soft_breaks, page_ok, text_preserved
+from example_compress import COMPRESS_EXAMPLES, compress_examples
+
+logger = logging.getLogger(__name__)
+
+# ==========================================
+# 全局配置
+# ==========================================
+base_dir = os.path.dirname(os.path.abspath(__file__))
+CACHE_FILE = os.path.join(base_dir, "api_cache.json")
+HISTORY_FILE = os.path.join(base_dir, "history.json")
+PROMPT_TEMPLATE_FILE = os.path.join(base_dir, "prompt_template.md")
+MAX_EXAMPLE_POSTS = 5
+HISTORY_LIMIT = 50  # 历史记录只保留最近 50 条
+# 可指向兼容 OpenAI 协议的代理或本地模拟服务（如 loadtest.py 启动的 mock 服务）
+API_BASE_URL = os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
+
+def _file_mtime(path: str):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+# ==========================================
+# 缓存模块（内存 + 文件两级）
+# ==========================================
+# 内存里常驻一份缓存，文件被其他进程改写或删除（清除缓存）时按修改时间自动重新加载
+_cache_lock = threading.RLock()
+_cache_memory = None
+_cache_mtime = None
+
+def _read_cache_file() -> dict:
+    if os.path.exists(CACHE_FILE):
+        try:
+            with open(CACHE_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, IOError):
+            return {}
+    return {}
+
+def _cache_view() -> dict:
+    """返回内存中的缓存字典本身，调用方需持有 _cache_lock 才能修改。"""
+    global _cache_memory, _cache_mtime
+    with _cache_lock:
+        mtime = _file_mtime(CACHE_FILE)
+        if _cache_memory is None or mtime != _cache_mtime:
+            _cache_memory = _read_cache_file()
+            _cache_mtime = mtime
+        return _cache_memory
+
+def load_cache() -> dict:
+    return dict(_cache_view())
+
+def save_cache(cache_data: dict):
+    global _cache_memory, _cache_mtime
+    with _cache_lock:
+        with open(CACHE_FILE, 'w', encoding='utf-8') as f:
+            json.dump(cache_data, f, ensure_ascii=False, indent=4)
+        _cache_memory = dict(cache_data)
+        _cache_mtime = _file_mtime(CACHE_FILE)
+
+def cache_size() -> int:
+    return len(_cache_view())
+
+def cache_get(key: str):
+    return _cache_view().get(key)
+
+def cache_put(key: str, text: str):
+    with _cache_lock:
+        cache = _cache_view()
+        cache[key] = text
+        save_cache(cache)
+
+def get_hash(text: str) -> str:
+    return hashlib.md5(text.encode('utf-8')).hexdigest()
+
+# ==========================================
+# 历史记录模块
+# ==========================================
+# 与缓存一样按修改时间常驻内存：页面每次重跑都要显示历史，文件没变就不再读盘
+_history_memory = (None, [])
+
+def load_history() -> list:
+    global _history_memory
+    mtime = _file_mtime(HISTORY_FILE)
+    if mtime is None:
+        return []
+    if _history_memory[0] != mtime:
+        try:
+            with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
+                _history_memory = (mtime, json.load(f))
+        except (json.JSONDecodeError, IOError):
+            return []
+    return list(_history_memory[1])
+
+def save_history(history_data: list):
+    global _history_memory
+    with open(HISTORY_FILE, 'w', encoding='utf-8') as f:
+        json.dump(history_data, f, ensure_ascii=False, indent=4)
+    _history_memory = (_file_mtime(HISTORY_FILE), list(history_data))
+
+_history_lock = threading.Lock()
+
+def add_to_history(topic: str, text: str):
+    item = {
+        "id": datetime.now().strftime("%Y%m%d_%H%M%S_%f"),
+        "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "topic": topic,
+        "text": text
+    }
+    # 多个后台任务可能同时完成，读-改-写必须串行，否则会互相覆盖
+    with _history_lock:
+        history_data = load_history()
+        history_data.insert(0, item) # 最新记录插到最前
+        history_data = history_data[:HISTORY_LIMIT] # 仅保留最近的 HISTORY_LIMIT 条
+        save_history(history_data)
+
+# ==========================================
+# Prompt 模板（进程内只解析一次，文件修改后自动重新加载）
+# ==========================================
+_template_lock = threading.Lock()
+_template_entry = (None, None)  # (mtime, (system_instruction, user_instruction_template) 或 None)
+
+def get_prompt_template():
+    """返回 prompt_template.md 中的 (系统提示词, 用户提示词模板)；文件缺失或格式不对时返回 None。"""
+    global _template_entry
+    mtime = _file_mtime(PROMPT_TEMPLATE_FILE)
+    with _template_lock:
+        if _template_entry[0] != mtime or mtime is None:
+            template = None
+            try:
+                with open(PROMPT_TEMPLATE_FILE, "r", encoding="utf-8") as f:
+                    template_content = f.read()
+                # Basic parsing of the markdown sections
+                sys_parts = template_content.split("## 系统提示词 (System Prompt)")
+                if len(sys_parts) > 1:
+                    user_parts = sys_parts[1].split("## 用户提示词 (User Prompt)")
+                    if len(user_parts) > 1:
+                        template = (user_parts[0].strip(), user_parts[1].strip())
+            except Exception:
+                template = None
+            _template_entry = (mtime, template)
+        return _template_entry[1]
+
+# ==========================================
+# Prompt 构建
+# ==========================================
+EXAMPLES_PLACEHOLDER = "{examples_text}"
+EXAMPLES_HEADER = "请仔细阅读以下爆款案例，深度分析它们的风格特征："
+_compression_lock = threading.Lock()
+_compression_stats = {"requests": 0, "tokens_before": 0, "tokens_after": 0}
+
+def get_compression_stats() -> dict:
+    """本进程启动以来组装的 Prompt 中，案例压缩前后的估算 Token 合计。"""
+    with _compression_lock:
+        return dict(_compression_stats)
+
+def _split_user_template(user_instruction_template: str, warn) -> tuple:
+    """把用户提示词模板拆成 (案例之前的开头, 案例之后的部分)。
+
+    DeepSeek 对与之前请求逐字节相同的 Prompt 前缀按缓存价计费，所以「系统提示词 + 案例」必须排在最前面，
+    主题、字数等每次不同的内容只能出现在案例之后。模板把这些变量写在案例前面（或没有 {examples_text}）时，
+    案例改为放在用户提示词开头，模板整体接在后面。
+    """
+    head, sep, tail = user_instruction_template.partition(EXAMPLES_PLACEHOLDER)
+    if sep and not any(field for _, field, _, _ in string.Formatter().parse(head)):
+        return head, tail
+    warn("prompt_template.md 中主题 / 字数等变量写在了 {examples_text} 之前（或缺少 {examples_text}），"
+         "已把案例移到用户提示词开头，以便重复使用同一批案例时命中 DeepSeek 的前缀缓存。")
+    return EXAMPLES_HEADER + "\n\n", "\n\n---\n\n" + user_instruction_template.replace(EXAMPLES_PLACEHOLDER, "（见上方案例）")
+
+def analyze_and_generate_prompt(viral_posts: list, target_topic: str, max_tokens_output: int, warn=logger.warning,
+                                compress: bool = COMPRESS_EXAMPLES, report=None):
+    """warn 用于提示模板缺失；UI 里传 st.warning，其余场景默认写日志。
+
+    案例可以是字符串，也可以是带 "text" 的字典；来自案例库的字典自带 char_count，不必再数一遍。
+    compress=True 时案例先经过 example_compress 压缩，report 会收到这一次的统计（见 compress_examples）。
+    同一批案例组装出的「系统提示词 + 用户提示词开头 + 案例」逐字节不变，主题和字数都在其后（见 _split_user_template）。
+    """
+    posts = viral_posts[:MAX_EXAMPLE_POSTS]
+    texts = [p["text"] if isinstance(p, dict) else p for p in posts]
+    # 目标字数按原文计算，压缩不影响生成篇幅
+    lengths = [p.get("char_count", len(t)) if isinstance(p, dict) else len(t) for p, t in zip(posts, texts)]
+    avg_length = sum(lengths) // len(lengths) if lengths else 300
+    if compress and texts:
+        texts, stats = compress_examples(texts)
+        with _compression_lock:
+            _compression_stats["requests"] += 1
+            _compression_stats["tokens_before"] += stats["tokens_before"]
+            _compression_stats["tokens_after"] += stats["tokens_after"]
+        logger.info("案例压缩：%s → %s Token（截断 %s 条长案例）",
+                    stats["tokens_before"], stats["tokens_after"], stats["posts_capped"])
+        if report:
+            report(stats)
+    examples_text = "\n\n".join(f"【案例 {i+1}】:\n{t}" for i, t in enumerate(texts))
+
+    system_instruction = "你是一个顶级的爆款内容创作者和 NLP 文本分析专家。你擅长从爆款案例中提炼风格 DNA，然后用这套风格创作出情节全新、细节丰富、独立成篇的内容。你的创作原则：风格高度还原，情节绝对原创。"
+    user_instruction_template = f"""请仔细阅读以下爆款案例，深度分析它们的风格特征：
+
+{{examples_text}}
+
+---
+
+【你的任务】基于上述案例的**风格 DNA**，为我创作一篇关于「{{target_topic}}」的全新帖子。
+
+**字数要求**：{{avg_length}} 字左右（±20%）
+
+**风格要求（必须严格遵守）**：
+- 复刻语气：情绪浓度、口语化程度、感叹/疑问句比例
+- 复刻结构：开头钩子、中间展开方式、结尾行动引导
+- 复刻排版：短句断行、分段节奏、Emoji 使用密度和位置
+- 复刻引导词：类似的转折词、递进词、呼吁性词汇
+
+**内容要求（同样必须严格遵守）**：
+- ❌ 禁止复制或改写原案例中的任何具体情节、场景、产品、人物
+- ✅ 必须构建与原案例**完全不同**的具体故事场景
+- ✅ 细节要丰富：有具体时间、地点、感受、对比、转折，不能泛泛而谈
+- ✅ 情绪要真实：有真实的痛点铺垫，有真实的惊喜/收获，不能只讲结论
+- ✅ 每次生成的内容必须是独特的，即使主题相同
+
+**输出格式**：
+1. **直接输出正文，禁止输出“风格特征摘要”等前置分析内容**
+2. **正文必须使用 Markdown 格式**，并且：
+   - 使用 `@---` 来强制分页（每页内容不要太多）
+   - 适当使用 `**加粗**` 突出核心词元或金句
+   - 合理使用一级标题 `#` 和二级标题 `##` 划分结构
+"""
+
+    # Try reading from external template file
+    template = get_prompt_template()
+    if template:
+        system_instruction, user_instruction_template = template
+    else:
+        warn("未找到 prompt_template.md 或是解析失败，使用内置默认 Prompt。")
+
+    head, tail = _split_user_template(user_instruction_template, warn)
+    user_instruction = head.format() + examples_text + tail.format(
+        examples_text=examples_text,
+        target_topic=target_topic,
+        avg_length=avg_length
+    )
+    return system_instruction, user_instruction
+
+# ==========================================
+# API 客户端池（按 Key 复用，客户端内部的连接池也随之复用）
+# ==========================================
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(api_key: str) -> OpenAI:
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            client = _clients[api_key] = OpenAI(
+                api_key=api_key,
+                base_url=API_BASE_URL,
+            )
+        return client
+
+# ==========================================
+# 进行中请求合并（singleflight）
+# ==========================================
+# 相同缓存 key 的请求还在进行时，后来者等待第一个请求的结果，不再重复调用 API
+_inflight = {}  # prompt_hash -> Future[(text, is_from_cache, error_msg)]
+_inflight_lock = threading.Lock()
+_coalesced_calls = 0
+
+def get_coalesced_calls() -> int:
+    """本进程启动以来被合并掉（没有真正发出）的 API 调用次数。"""
+    return _coalesced_calls
+
+# ==========================================
+# Token 用量统计（本进程累计，基准测试按前后差值计算）
+# ==========================================
+_usage_lock = threading.Lock()
+_usage_totals = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                 "prompt_cache_hit_tokens": 0, "prompt_cache_miss_tokens": 0}
+
+def _record_usage(usage):
+    # prompt_cache_hit_tokens / prompt_cache_miss_tokens 是 DeepSeek 在 usage 里额外返回的字段（命中前缀缓存的输入按缓存价计费）
+    hit = getattr(usage, "prompt_cache_hit_tokens", None) or 0
+    miss = getattr(usage, "prompt_cache_miss_tokens", None) or 0
+    with _usage_lock:
+        _usage_totals["calls"] += 1
+        if usage:
+            _usage_totals["prompt_tokens"] += usage.prompt_tokens or 0
+            _usage_totals["completion_tokens"] += usage.completion_tokens or 0
+            _usage_totals["prompt_cache_hit_tokens"] += hit
+            _usage_totals["prompt_cache_miss_tokens"] += miss
+    if hit or miss:
+        logger.info("输入 Token：命中前缀缓存 %s，未命中 %s（命中率 %.0f%%）", hit, miss, hit / (hit + miss) * 100)
+
+def get_usage_stats() -> dict:
+    with _usage_lock:
+        return dict(_usage_totals)
+
+# ==========================================
+# 截断续写（finish_reason == "length" 时接着写，直到写完或用完预算）
+# ==========================================
+MAX_CONTINUATIONS = 3  # 一次生成最多追加 3 次续写请求
+CONTINUE_PROMPT = "你的上一条回复因长度限制被截断了。请从断开的地方直接接着写，不要重复已经写过的内容，也不要输出任何说明。"
+_continuation_lock = threading.Lock()
+_continuation_stats = {"truncated": 0, "continuations": 0, "completed": 0, "gave_up": 0}
+
+def get_continuation_stats() -> dict:
+    """truncated：输出被 max_tokens 截断的生成次数；continuations：为此追加的续写请求数；
+    completed：续写后完整结束的次数；gave_up：续写预算用完（或续写失败）仍未写完的次数。"""
+    with _continuation_lock:
+        return dict(_continuation_stats)
+
+def _count_continuation(**deltas):
+    with _continuation_lock:
+        for key, value in deltas.items():
+            _continuation_stats[key] += value
+
+def _stitch(text: str, more: str) -> str:
+    """把续写接到已有文本后面；续写开头重复了上文结尾的部分（5～50 字，更短的可能只是巧合）去掉。"""
+    for size in range(min(len(text), len(more), 50), 4, -1):
+        if text.endswith(more[:size]):
+            return text + more[size:]
+    return text + more
+
+def _account(response, user: str):
+    _record_usage(response.usage)
+    if user and response.usage:
+        usage_ledger.add(user, response.usage.total_tokens)
+
+def _continue_truncated(client, request: dict, text: str, user: str) -> str:
+    """初次请求因 max_tokens 被截断：带上已写的部分追加续写请求，返回拼接后的全文。"""
+    _count_continuation(truncated=1)
+    for attempt in range(MAX_CONTINUATIONS):
+        messages = request["messages"] + [
+            {"role": "assistant", "content": text},
+            {"role": "user", "content": CONTINUE_PROMPT},
+        ]
+        try:
+            response = chat_completion(client, **dict(request, messages=messages))
+        except Exception as e:
+            logger.warning("续写请求失败，保留已生成的 %s 字：%s", len(text), e)
+            break
+        _count_continuation(continuations=1)
+        _account(response, user)
+        choice = response.choices[0]
+        text = _stitch(text, choice.message.content or "")
+        if choice.finish_reason != "length":
+            _count_continuation(completed=1)
+            logger.info("输出被截断，续写 %s 次后完成（共 %s 字）", attempt + 1, len(text))
+            return text
+    else:
+        logger.warning("续写 %s 次后仍未写完，保留已生成的 %s 字", MAX_CONTINUATIONS, len(text))
+    _count_continuation(gave_up=1)
+    return text
+
+def estimate_tokens(text: str) -> int:
+    """离线估算 Token 数：按 DeepSeek 的经验值，中文约 0.6 token/字，其余字符约 0.3 token/字。"""
+    cjk = sum(1 for ch in text if "\u4e00" <= ch <= "\u9fff" or "\u3000" <= ch <= "\u303f" or "\uff00" <= ch <= "\uffef")
+    return round(cjk * 0.6 + (len(text) - cjk) * 0.3)
+
+# ==========================================
+# API 调用（含重试 + 缓存 + 成本控制）
+# ==========================================
+def prompt_key(system_prompt: str, user_prompt: str, model: str, variant_id: int) -> str:
+    """generate_content 的缓存 key。"""
+    return get_hash(system_prompt + user_prompt + model + str(variant_id))
+
+def generate_content(system_prompt: str, user_prompt: str, api_key: str,
+                     model: str, max_tokens: int, temperature: float = 0.9,
+                     retries: int = 3, variant_id: int = 0, user: str = "", validate=None):
+    """返回 (text, is_from_cache, error_msg)。variant_id 用于区分同一 prompt 的多次并发调用的缓存 key
+
+    user 为发起者身份（见 quotas.user_identity），真正发出的请求按它记 Token 用量。
+    validate(text) 返回错误信息时，这次回复不写缓存、重新请求（算一次重试），否则下次重试只会拿到同一个坏结果。
+    """
+    # variant_id 保证每个并发变体有独立的缓存 key，不会互相命中
+    prompt_hash = prompt_key(system_prompt, user_prompt, model, variant_id)
+    cached = cache_get(prompt_hash)
+
+    if cached is not None:
+        return cached, True, None
+
+    if not api_key:
+        return None, False, "请先在左侧侧边栏填入 DeepSeek API Key！"
+
+    global _coalesced_calls
+    with _inflight_lock:
+        leader = _inflight.get(prompt_hash)
+        if leader is None:
+            future = _inflight[prompt_hash] = Future()
+        else:
+            _coalesced_calls += 1
+    if leader is not None:
+        # 同一请求正在进行：直接复用它的结果（对本次调用来说没有花钱，按缓存命中算）
+        text, _, err = leader.result()
+        return text, err is None, err
+
+    result = (None, False, "❌ 请求被中断，请重试。")
+    try:
+        # 刚好在我们查缓存之后、成为 leader 之前，上一个同 key 的请求已经完成并写入缓存
+        cached = cache_get(prompt_hash)
+        if cached is not None:
+            result = (cached, True, None)
+        else:
+            result = _request_api(system_prompt, user_prompt, api_key, model, max_tokens,
+                                  temperature, retries, prompt_hash, user, validate)
+    except Exception as e:
+        result = (None, False, f"❌ API 调用失败：{e}")
+    finally:
+        # 放在 finally 里：leader 被 KeyboardInterrupt / SystemExit 等打断时，等待中的请求也会收到「请求被中断」
+        with _inflight_lock:
+            del _inflight[prompt_hash]
+        future.set_result(result)
+    return result
+
+def _request_api(system_prompt: str, user_prompt: str, api_key: str, model: str, max_tokens: int,
+                 temperature: float, retries: int, prompt_hash: str, user: str, validate=None):
+    """真正发出请求（含重试），输出被截断时自动续写，通过 validate 后把完整文本写入缓存并记账。"""
+    client = get_client(api_key)
+    request = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ],
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+    }
+
+    problem = None
+    for attempt in range(retries):
+        try:
+            response = chat_completion(client, **request)
+            text = response.choices[0].message.content
+            _account(response, user)
+            if response.choices[0].finish_reason == "length":
+                text = _continue_truncated(client, request, text or "", user)
+            problem = validate(text) if validate else None
+            if problem:
+                logger.warning("回复不可用，不写缓存、重新请求：%s (%s/%s)", problem, attempt + 1, retries)
+                continue
+            cache_put(prompt_hash, text)
+            return text, False, None
+
+        except AuthenticationError:
+            return None, False, "❌ API Key 无效，请检查后重试。"
+        except CassetteMiss as e:
+            return None, False, f"❌ {e}"
+        except RateLimitError:
+            wait = 2 ** attempt * 5
+            logger.warning("触发限速，%s 秒后重试... (%s/%s)", wait, attempt + 1, retries)
+            backoff_sleep(wait)
+        except Exception as e:
+            if attempt < retries - 1:
+                backoff_sleep(3)
+            else:
+                return None, False, f"❌ API 调用失败：{e}"
+
+    return None, False, problem or "已达到最大重试次数，请稍后再试。"
+
+# ==========================================
+# 排版（本地校验，只把不合格的页交给模型）
+# ==========================================
+_format_lock = threading.Lock()
+_format_stats = {"calls_avoided": 0, "pages_skipped": 0, "pages_repaired": 0, "pages_reverted": 0}
+REPAIR_VARIANT_OFFSET = 500  # 单页重排用独立的缓存 key，不会命中上一次改写过的结果
+
+def get_format_stats() -> dict:
+    """calls_avoided：整篇本地校验通过、没有发出排版请求的次数；pages_skipped：合格而没送去排版的页数；
+    pages_repaired：改动了原文、单独重排后通过核对的页数；pages_reverted：重排后仍不通过、退回原文的页数。"""
+    with _format_lock:
+        return dict(_format_stats)
+
+def _count_format(**deltas):
+    with _format_lock:
+        for key, value in deltas.items():
+            _format_stats[key] += value
+
+def format_content(text: str, api_key: str, max_tokens: int, retries: int = 3, variant_id: int = 0, user: str = ""):
+    """排版阶段：返回 (text, is_from_cache, error_msg)。
+
+    先用 format_check 逐页校验初稿，软换行本地补齐；全部合格就不再调用模型，
+    否则只把不合格的页拼在一起送去排版，再按页放回原位。
+    每页排版结果都要和原文核对（text_preserved）：改动了文字的页单独重排一次，仍不通过就保留原文。
+    """
+    pages = split_pages(text)
+    failing = [i for i, page in enumerate(pages) if not page_ok(page)]
+    if not failing:
+        _count_format(calls_avoided=1, pages_skipped=len(pages))
+        return add_soft_breaks(text), True, None
+
+    _count_format(pages_skipped=len(pages) - len(failing))
+    formatted, is_cached, err = _format_with_model(
+        join_pages([pages[i] for i in failing]), api_key, max_tokens, retries, variant_id, user)
+    if err:
+        return None, False, err
+
+    results = {}
+    formatted_pages = split_pages(formatted)
+    if len(formatted_pages) == len(failing):
+        results = {i: page for i, page in zip(failing, formatted_pages) if text_preserved(pages[i], page)}
+    else:
+        logger.warning("排版结果页数不符（%s → %s），改为逐页排版", len(failing), len(formatted_pages))
+
+    # 页数对不上、或改动了原文的页：只把这些页单独重排，整篇不重复排版
+    for i in [i for i in failing if i not in results]:
+        page, page_cached, page_err = _format_with_model(
+            pages[i], api_key, max_tokens, retries, variant_id + REPAIR_VARIANT_OFFSET, user)
+        if not page_err and len(split_pages(page)) == 1 and text_preserved(pages[i], page):
+            results[i] = page
+            is_cached = is_cached and page_cached
+            _count_format(pages_repaired=1)
+        else:
+            logger.warning("第 %s 页排版后仍与原文不符，保留原文", i + 1)
+            _count_format(pages_reverted=1)
+
+    for i, page in results.items():
+        splice_page(pages, i, page)
+    return add_soft_breaks(join_pages(pages)), is_cached, None
+
+def splice_page(pages: list, index: int, page: str):
+    """把一页放回原位。分页行前后各留一个空行，避免拼接后 `@---` 和正文挤在同一行。"""
+    pages[index] = ("\n\n" if index > 0 else "") + page.strip("\n") + ("\n\n" if index < len(pages) - 1 else "\n")
+
+def _format_with_model(text: str, api_key: str, max_tokens: int, retries: int, variant_id: int, user: str):
+    system_prompt = "你是一个专业的小红书爆款排版专家。你的唯一任务是严格依据指令为提供的文案增加 Emoji 表情和换行符，【绝对禁止】改写或删减原有的任何文字内容。"
+    user_prompt = f"""请为以下文案进行排版加工作业（fast 模式排版），必须严格遵守以下 3 条指令：
+
+1. 【自然插入表情】：每个由 `@---` 分隔的画布中，必须包含 3 到 5 个符合语境的 Emoji。**🚫绝对禁止**像列表一样机械地在每一行末尾都加表情！表情应该自然地跟在核心词汇后面（如：科技感✨），或者穿插在句首/句中，做到错落有致、有呼吸感。
+2. 【软换行与留白】：
+   - 在**每一行文字的末尾**（除了完全空白的行和只有 `@---` 的行），强制添加**两个空格**再回车，触发软换行。
+   - 保留原句之间的空行（空行可以营造呼吸感）。如果连续几行文字太密集，允许你在大逻辑转折的地方插入一个空行。
+3. 【保持原意】：绝对禁止对原文进行删减、概括或改写！请原封不动地返回原文的所有词句。不要输出任何解释性文字。
+
+【需要排版的原始文案如下】：
+{text}
+"""
+    # 强制使用 deepseek-chat 进行格式化（速度快），降低温度确保稳定输出
+    # 强制限制为 8192，因为 deepseek-chat api 要求的最大 tokens 是 8192
+    format_max_tokens = min(max_tokens, 8192)
+    return generate_content(
+        system_prompt=system_prompt,
+        user_prompt=user_prompt,
+        api_key=api_key,
+        model="deepseek-chat",
+        max_tokens=format_max_tokens,
+        temperature=0.1,
+        retries=retries,
+        variant_id=variant_id + 1000,  # 偏移variant_id，防止和第一步的缓存互相碰撞
+        user=user,
+    )
+
+# ==========================================
+# 单次请求生成多个变体
+# ==========================================
+# N 个变体的系统提示词和案例完全相同，合成一次请求让模型连写 N 篇，输入 Token 只付一次
+VARIANT_MARK_RE = re.compile(r"^[ \t]*[<＜]{2,3}\s*VARIANT\s*(\d+)\s*[>＞]{2,3}[ \t]*$", re.IGNORECASE | re.MULTILINE)
+CODE_FENCE_RE = re.compile(r"^```[\w-]*\n|\n```$")
+MIN_VARIANT_CHARS = 50  # 比这还短的多半是被截断或解析错位，按失败处理
+MODEL_MAX_TOKENS = {"deepseek-chat": 8192, "deepseek-reasoner": 32768}
+# 一个合并请求最多写 5 篇；变体更多时每 5 个一组，各组分别合并（否则输出会超出模型上限）
+MAX_COMBINED_VARIANTS = 5
+
+def build_multi_variant_prompt(user_prompt: str, n: int) -> str:
+    return user_prompt + f"""
+
+---
+
+【一次输出 {n} 篇】请按以上全部要求，一次性创作 {n} 篇**情节、场景、开头都互不相同**的帖子。
+每篇正文之前单独占一行写分隔标记 `<<<VARIANT 序号>>>`（序号从 1 到 {n}），标记行不要有其它文字，例如：
+
+<<<VARIANT 1>>>
+（第 1 篇正文）
+<<<VARIANT 2>>>
+（第 2 篇正文）
+
+除分隔标记和正文外，不要输出任何说明。"""
+
+def parse_variants(text: str, n: int) -> list:
+    """按分隔标记拆出各篇正文，返回长度为 n 的列表；没能可靠解析的位置为 None。"""
+    variants = [None] * n
+    matches = list(VARIANT_MARK_RE.finditer(text or ""))
+    for i, match in enumerate(matches):
+        index = int(match.group(1)) - 1
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        body = CODE_FENCE_RE.sub("", text[match.end():end].strip()).strip()
+        if 0 <= index < n and variants[index] is None and len(body) >= MIN_VARIANT_CHARS and body not in variants:
+            variants[index] = body
+    return variants
+
+def combined_group_size(variant_id: int, n: int) -> int:
+    """共 n 个变体、按 MAX_COMBINED_VARIANTS 分组合并时，variant_id 所在那一组的篇数。"""
+    group_start = variant_id - variant_id % MAX_COMBINED_VARIANTS
+    return min(MAX_COMBINED_VARIANTS, n - group_start)
+
+def multi_variant_max_tokens(model: str, max_tokens: int, n: int) -> int:
+    """合并请求要容纳 N 篇的输出，但不能超过模型上限。"""
+    return min(max_tokens * n, MODEL_MAX_TOKENS.get(model, max_tokens * n))
+
+def combined_request_cached(system_prompt: str, user_prompt: str, model: str, variant_id: int, combined_n: int) -> bool:
+    """提交批次时调用：variant_id 所在那一组的合并请求是否已经在缓存里（之前的批次生成过）。"""
+    group_start = variant_id - variant_id % MAX_COMBINED_VARIANTS
+    key = prompt_key(system_prompt, build_multi_variant_prompt(user_prompt, combined_n), model, group_start)
+    return cache_get(key) is not None
+
+def generate_draft(system_prompt: str, user_prompt: str, api_key: str, model: str, max_tokens: int,
+                   temperature: float = 0.9, retries: int = 3, variant_id: int = 0, user: str = "",
+                   combined_n: int = 0, combined_cached: bool = False):
+    """生成一篇初稿，返回 (text, is_from_cache, error_msg)。
+
+    combined_n > 1 时走合并请求：同一组的 N 个任务发出的是同一个请求（同一缓存 key），
+    只有第一个真正调用 API，其余的合并等待或直接命中缓存，各自取出自己序号的那一篇；
+    解析不出自己那一篇时，退回到单独请求。combined_n 为所在组的篇数（见 combined_group_size）。
+    同组其余任务拿到的虽是缓存 / 合并等待的结果，但各自那一篇是新写的：只有提交批次前合并请求就已在缓存里
+    （combined_cached，见 combined_request_cached）才算命中缓存，否则照常写入历史、不标 ⚡缓存。
+    """
+    if combined_n > 1:
+        group_start = variant_id - variant_id % MAX_COMBINED_VARIANTS
+        combined_text, is_cached, err = generate_content(
+            system_prompt=system_prompt,
+            user_prompt=build_multi_variant_prompt(user_prompt, combined_n),
+            api_key=api_key,
+            model=model,
+            max_tokens=multi_variant_max_tokens(model, max_tokens, combined_n),
+            temperature=temperature,
+            retries=retries,
+            variant_id=group_start,
+            user=user,
+        )
+        if not err:
+            text = parse_variants(combined_text, combined_n)[variant_id - group_start]
+            if text is not None:
+                return text, is_cached and combined_cached, None
+            logger.warning("合并请求的结果中解析不到变体 %s，改为单独请求", variant_id + 1)
+
+    return generate_content(
+        system_prompt=system_prompt,
+        user_prompt=user_prompt,
+        api_key=api_key,
+        model=model,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        retries=retries,
+        variant_id=variant_id,
+        user=user,
+    )
+
+def generate_variant(system_prompt: str, user_prompt: str, api_key: str, model: str, max_tokens: int,
+                     temperature: float = 0.9, retries: int = 3, variant_id: int = 0, user: str = "",
+                     combined_n: int = 0, combined_cached: bool = False):
+    """一篇变体的完整流程：先生成初稿，再排版。返回 (text, is_from_cache, error_msg)。"""
+    # 第一步：原样生成文案初稿
+    base_text, is_cached1, err1 = generate_draft(
+        system_prompt=system_prompt,
+        user_prompt=user_prompt,
+        api_key=api_key,
+        model=model,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        retries=retries,
+        variant_id=variant_id,
+        user=user,
+        combined_n=combined_n,
+        combined_cached=combined_cached,
+    )
+    if err1:
+        return None, False, err1
+
+    # 第二步：使用 fast 模式补充排版（表情+软换行）
+    final_text, is_cached2, err2 = format_content(
+        text=base_text,
+        api_key=api_key,
+        max_tokens=max_tokens,
+        retries=retries,
+        variant_id=variant_id,
+        user=user,
+    )
+    if err2:
+        return None, False, f"第一步生成成功，但第二步排版时发生错误：{err2}"
+
+    # 综合缓存状态
+    return final_text, is_cached1 and is_cached2, None
+
+# ==========================================
+# 单页重写（只换掉一个 `@---` 页，其余页原样保留）
+# ==========================================
+# 只带前后几页作上下文、只输出一页：输入输出都只有整篇重新生成的零头，等待时间也短得多
+PAGE_CONTEXT_PAGES = 2  # 目标页前后各带 2 页
+PAGE_REWRITE_SYSTEM_PROMPT = "你是一个顶级的爆款内容创作者。你的任务是在不改变整篇帖子风格和前后衔接的前提下，只重写其中指定的一页。"
+
+def build_page_prompt(pages: list, page_index: int, topic: str = "", instruction: str = "") -> str:
+    """目标页和前后 PAGE_CONTEXT_PAGES 页作为上下文；要求写在最后，上下文相同的请求可以命中前缀缓存。"""
+    start, end = max(page_index - PAGE_CONTEXT_PAGES, 0), min(page_index + PAGE_CONTEXT_PAGES + 1, len(pages))
+    context = "\n\n".join(
+        f"【第 {i+1} 页{'（需要重写）' if i == page_index else ''}】\n{pages[i].strip()}"
+        for i in range(start, end) if pages[i].strip()
+    )
+    about = f"关于「{topic}」的" if topic else ""
+    request = f"\n\n**修改要求**：{instruction.strip()}" if instruction.strip() else ""
+    return f"""以下是一篇{about}帖子（共 {len(pages)} 页，页与页之间用 `@---` 分隔）中第 {start+1}~{end} 页的内容：
+
+{context}
+
+---
+
+【你的任务】只重写第 {page_index+1} 页：换一种写法，让这一页更抓人、更具体。
+- 语气、短句断行、Emoji 和加粗的用法与其它页保持一致
+- 与前后页自然衔接，不要重复前后页已经写过的内容
+- 篇幅与原来这一页相近{request}
+
+直接输出新的第 {page_index+1} 页正文，不要输出 `@---`、其它页或任何说明。"""
+
+def _reply_pages(reply: str) -> list:
+    return [page for page in split_pages(CODE_FENCE_RE.sub("", (reply or "").strip())) if page.strip()]
+
+def _single_page_problem(reply: str):
+    count = len(_reply_pages(reply))
+    return None if count == 1 else f"模型返回了 {count} 页内容，请重试。"
+
+def regenerate_page(text: str, page_index: int, api_key: str, model: str, max_tokens: int,
+                    temperature: float = 0.9, retries: int = 3, user: str = "", topic: str = "", instruction: str = ""):
+    """重写 text 的第 page_index 页（从 0 开始）并拼回全文，返回 (text, is_from_cache, error_msg)。
+
+    新的一页同样经过排版（合格就不调模型）。缓存 key 里含有这一页当前的内容：
+    同一页连续重写时，每次拿到的都是新版本；回到之前的某个版本再重写，直接命中缓存。
+    """
+    pages = split_pages(text)
+    if not 0 <= page_index < len(pages) or not pages[page_index].strip():
+        return None, False, "这一页是空的，无需重写。"
+
+    page_text, is_cached1, err = generate_content(
+        system_prompt=PAGE_REWRITE_SYSTEM_PROMPT,
+        user_prompt=build_page_prompt(pages, page_index, topic, instruction),
+        api_key=api_key,
+        model=model,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        retries=retries,
+        variant_id=page_index,
+        user=user,
+        validate=_single_page_problem,  # 页数不对的回复不进缓存，重试时会真正重新生成
+    )
+    if err:
+        return None, False, err
+    new_pages = _reply_pages(page_text)
+
+    formatted, is_cached2, err = format_content(new_pages[0].strip(), api_key, max_tokens, retries, page_index, user)
+    if err:
+        return None, False, f"新的一页已生成，但排版时发生错误：{err}"
+    logger.info("第 %s 页已重写（%s → %s 字）", page_index + 1, len(pages[page_index].strip()), len(formatted.strip()))
+    splice_page(pages, page_index, formatted)
+    return join_pages(pages), is_cached1 and is_cached2, None
@@ -0,0 +1,274 @@
+"""
+后台生成任务队列：点击 🚀 只负责把任务写进任务表，真正的生成由进程内的工作线程完成。
+
+以前生成直接跑在脚本线程里，30~60 秒内任何控件交互都会触发重跑，正在生成的结果随之丢失。
+现在任务状态和结果都记在 jobs.json 里，完成后自动写入历史记录；
+页面按批次号（batch_id，同时记在地址栏）轮询结果，换页面、刷新浏览器都能找回。
+
+多人共用时的调度规则：
+- 交互任务（变体数不多的一次点击）优先于批量任务，但每连续派发 INTERACTIVE_BURST 个交互任务，
+  就让等待中的批量任务跑一个，批量任务不会被饿死；
+- 同一优先级内按用户轮转：先派给正在运行任务最少、最久没被服务的用户，一个人排一长串也挡不住别人；
+- 每个用户同时运行的任务数、每天的 Token 用量受 quotas 中的配额限制；
+  任务派发时先按估算的最大用量预留 Token，结束后归还，同时在跑的任务不会一起冲过当天额度。
+
+    queue = JobQueue()
+    batch_id = queue.submit_batch(topic, sys_p, usr_p, api_key, "deepseek-chat", 2000, 0.95, 3, n=3, user="alice")
+    jobs = queue.batch(batch_id)   # 每个变体一条，含 status / text / error
+
+单页重写（submit_page_rewrite）同样作为任务排队，受同样的配额、并发上限和调度规则约束。
+"""
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+
+from generation import (
+    base_dir, add_to_history, combined_group_size, combined_request_cached, estimate_tokens, generate_variant,
+    regenerate_page,
+)
+from quotas import USER_MAX_CONCURRENCY, ANONYMOUS_USER, reserve_token_quota, release_token_quota
+from profiling import profiled
+
+logger = logging.getLogger(__name__)
+
+JOBS_FILE = os.path.join(base_dir, "jobs.json")
+MAX_WORKERS = int(os.environ.get("XHS_JOB_WORKERS", "4"))
+MAX_FINISHED_JOBS = 200  # 任务表只保留最近 200 条已结束的任务
+MAX_VARIANTS = 50        # 一次最多提交 50 个变体；同时在跑的始终只有 MAX_WORKERS 个，其余排队
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+PENDING_STATES = (QUEUED, RUNNING)
+
+INTERACTIVE, BATCH = "interactive", "batch"
+INTERACTIVE_MAX_VARIANTS = 3  # 一次提交超过 3 个变体按批量任务调度
+INTERACTIVE_BURST = 3         # 每连续派发 3 个交互任务，给等待中的批量任务让一次
+
+GENERATE, PAGE_REWRITE = "generate", "page_rewrite"  # 任务类型
+
+
+class JobQueue:
+    """进程内任务队列，整个 Streamlit 进程共用一个实例（UI 里用 st.cache_resource 持有）。"""
+
+    def __init__(self, jobs_file: str = JOBS_FILE, max_workers: int = MAX_WORKERS,
+                 user_concurrency: int = USER_MAX_CONCURRENCY):
+        self.jobs_file = jobs_file
+        self.user_concurrency = user_concurrency  # 0 表示不限
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._jobs = self._load()
+        self._pending = []          # 等待派发的任务：{job_id, user, priority, seq, params}
+        self._running_by_user = {}  # user -> 正在运行的任务数
+        self._last_served = {}      # user -> 最近一次被派发的序号
+        self._dispatch_seq = 0
+        self._interactive_streak = 0
+        self._recover()
+        for i in range(max_workers):
+            threading.Thread(target=self._worker_loop, name=f"gen-job-{i}", daemon=True).start()
+
+    # ---------- 任务表读写 ----------
+    def _load(self) -> dict:
+        if os.path.exists(self.jobs_file):
+            try:
+                with open(self.jobs_file, 'r', encoding='utf-8') as f:
+                    return {job["id"]: job for job in json.load(f)}
+            except (json.JSONDecodeError, IOError, KeyError, TypeError):
+                logger.warning("任务表 %s 损坏，已忽略", self.jobs_file)
+        return {}
+
+    def _save(self):
+        """调用方需持有 self._lock。先写临时文件再替换，避免进程中途退出留下半截 JSON。"""
+        finished = [j for j in self._jobs.values() if j["status"] not in PENDING_STATES]
+        for job in finished[:-MAX_FINISHED_JOBS]:
+            del self._jobs[job["id"]]
+        tmp_path = self.jobs_file + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(list(self._jobs.values()), f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, self.jobs_file)
+
+    def _recover(self):
+        """上次进程退出时还没跑完的任务：API Key 不落盘，无法续跑，标记为失败让用户重新生成。"""
+        with self._lock:
+            stale = [j for j in self._jobs.values() if j["status"] in PENDING_STATES]
+            for job in stale:
+                job.update(status=FAILED, finished=time.time(), error="服务已重启，任务被中断，请重新生成。")
+            if stale:
+                self._save()
+
+    def _update(self, job_id: str, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields)
+                self._save()
+
+    # ---------- 对外接口 ----------
+    def submit_batch(self, topic: str, system_prompt: str, user_prompt: str, api_key: str, model: str,
+                     max_tokens: int, temperature: float, retries: int, n: int,
+                     user: str = ANONYMOUS_USER, priority: str = None, combined: bool = False) -> str:
+        """一次点击生成 n 个变体，返回批次号。priority 缺省时按变体数自动判断交互 / 批量。
+
+        combined=True 时 n 篇初稿合成一次请求生成（见 generation.generate_draft），超过 5 篇时分组合并。
+        """
+        if not 1 <= n <= MAX_VARIANTS:
+            raise ValueError(f"变体数需在 1~{MAX_VARIANTS} 之间")
+        if priority is None:
+            priority = INTERACTIVE if n <= INTERACTIVE_MAX_VARIANTS else BATCH
+        batch_id = uuid.uuid4().hex[:12]
+        jobs = [self._new_job(batch_id, vid, topic, model, user, priority) for vid in range(n)]
+
+        params = dict(system_prompt=system_prompt, user_prompt=user_prompt, api_key=api_key, model=model,
+                      max_tokens=max_tokens, temperature=temperature, retries=retries, user=user)
+        job_params = {}
+        for job in jobs:
+            vid = job["variant_id"]
+            combined_n = combined_group_size(vid, n) if combined and n > 1 else 0
+            # 在入队前判断：同组第一个任务跑完后合并结果就进了缓存，到那时再查就分不清是不是本批次新写的
+            cached = bool(combined_n) and combined_request_cached(system_prompt, user_prompt, model, vid, combined_n)
+            job_params[job["id"]] = dict(params, combined_n=combined_n, combined_cached=cached)
+        self._enqueue(jobs, job_params)
+        return batch_id
+
+    def submit_page_rewrite(self, topic: str, text: str, page_index: int, api_key: str, model: str,
+                            max_tokens: int, temperature: float, retries: int,
+                            user: str = ANONYMOUS_USER, instruction: str = "") -> str:
+        """重写 text 的一页（见 generation.regenerate_page），返回批次号。批次里只有一个任务，完成后 text 为拼好的全文。"""
+        batch_id = uuid.uuid4().hex[:12]
+        job = self._new_job(batch_id, page_index, topic, model, user, INTERACTIVE, kind=PAGE_REWRITE)
+        params = dict(text=text, page_index=page_index, api_key=api_key, model=model, max_tokens=max_tokens,
+                      temperature=temperature, retries=retries, user=user, topic=topic, instruction=instruction)
+        self._enqueue([job], {job["id"]: params})
+        return batch_id
+
+    @staticmethod
+    def _new_job(batch_id: str, vid: int, topic: str, model: str, user: str, priority: str, kind: str = GENERATE) -> dict:
+        return {
+            "id": f"{batch_id}-{vid}",
+            "batch_id": batch_id,
+            "variant_id": vid,
+            "kind": kind,
+            "topic": topic,
+            "model": model,
+            "user": user,
+            "priority": priority,
+            "status": QUEUED,
+            "created": time.time(),
+            "started": None,
+            "finished": None,
+            "text": None,
+            "is_cached": False,
+            "error": None,
+        }
+
+    def _enqueue(self, jobs: list, job_params: dict):
+        with self._lock:
+            for job in jobs:
+                self._jobs[job["id"]] = job
+                self._dispatch_seq += 1
+                self._pending.append({"job_id": job["id"], "user": job["user"], "priority": job["priority"],
+                                      "seq": self._dispatch_seq, "topic": job["topic"], "kind": job["kind"],
+                                      "variant_id": job["variant_id"], "params": job_params[job["id"]]})
+            self._save()
+            self._wakeup.notify_all()
+
+    def batch(self, batch_id: str) -> list:
+        """按变体顺序返回该批次的任务快照（副本，可放心在 UI 里读）。"""
+        with self._lock:
+            jobs = [dict(j) for j in self._jobs.values() if j["batch_id"] == batch_id]
+        return sorted(jobs, key=lambda j: j["variant_id"])
+
+    def update_text(self, job_id: str, text: str):
+        """单页重写后，把拼好的全文写回已完成的任务（结果区、打包下载都读这里）。"""
+        self._update(job_id, text=text)
+
+    def counts(self, user: str = None) -> dict:
+        """排队中 / 运行中的任务数；传入 user 时只统计该用户。"""
+        with self._lock:
+            jobs = [j for j in self._jobs.values() if user is None or j.get("user") == user]
+            return {
+                QUEUED: sum(j["status"] == QUEUED for j in jobs),
+                RUNNING: sum(j["status"] == RUNNING for j in jobs),
+            }
+
+    # ---------- 调度 ----------
+    def _next_task(self):
+        """调用方需持有 self._lock。挑出下一个可以运行的任务并移出等待队列，没有则返回 None。"""
+        runnable = [t for t in self._pending
+                    if not self.user_concurrency or self._running_by_user.get(t["user"], 0) < self.user_concurrency]
+        if not runnable:
+            return None
+        interactive = [t for t in runnable if t["priority"] == INTERACTIVE]
+        batch = [t for t in runnable if t["priority"] != INTERACTIVE]
+        if interactive and (not batch or self._interactive_streak < INTERACTIVE_BURST):
+            pool = interactive
+            self._interactive_streak += 1
+        else:
+            pool = batch
+            self._interactive_streak = 0
+        task = min(pool, key=lambda t: (self._running_by_user.get(t["user"], 0),
+                                        self._last_served.get(t["user"], 0), t["seq"]))
+        self._pending.remove(task)
+        self._running_by_user[task["user"]] = self._running_by_user.get(task["user"], 0) + 1
+        self._dispatch_seq += 1
+        self._last_served[task["user"]] = self._dispatch_seq
+        return task
+
+    def _worker_loop(self):
+        while True:
+            with self._wakeup:
+                task = self._next_task()
+                while task is None:
+                    self._wakeup.wait()
+                    task = self._next_task()
+            try:
+                self._run(task)
+            except Exception:
+                logger.exception("生成任务 %s 调度异常", task["job_id"])
+            finally:
+                with self._wakeup:
+                    self._running_by_user[task["user"]] -= 1
+                    self._wakeup.notify_all()
+
+    @staticmethod
+    def _estimate_tokens(task: dict) -> int:
+        """派发时预留的 Token：输入按 Prompt（单页重写按全文）离线估算，输出按 max_tokens 上限。"""
+        params = task["params"]
+        prompt = params.get("system_prompt", "") + params.get("user_prompt", "") + params.get("text", "")
+        return estimate_tokens(prompt) + params["max_tokens"]
+
+    def _run(self, task: dict):
+        job_id = task["job_id"]
+        reserved = self._estimate_tokens(task)
+        quota_error = reserve_token_quota(task["user"], reserved)
+        if quota_error:
+            self._update(job_id, status=FAILED, finished=time.time(), error=quota_error)
+            return
+        try:
+            self._execute(task)
+        finally:
+            # 实际用量已在每次 API 调用后记账，这里归还预留
+            release_token_quota(task["user"], reserved)
+
+    def _execute(self, task: dict):
+        job_id = task["job_id"]
+        self._update(job_id, status=RUNNING, started=time.time())
+        try:
+            with profiled("job"):
+                if task["kind"] == PAGE_REWRITE:
+                    text, is_cached, err = regenerate_page(**task["params"])
+                else:
+                    text, is_cached, err = generate_variant(variant_id=task["variant_id"], **task["params"])
+        except Exception as e:
+            logger.exception("生成任务 %s 异常", job_id)
+            text, is_cached, err = None, False, f"❌ 任务异常：{e}"
+
+        if err:
+            self._update(job_id, status=FAILED, finished=time.time(), error=err)
+            return
+        # 先存历史再标记完成：用户离开页面时，结果也已经在历史记录里
+        # 单页重写的结果写回原来的变体 / 编辑器，不另记一条历史
+        if not is_cached and task["kind"] == GENERATE:
+            add_to_history(task["topic"], text)
+        self._update(job_id, status=DONE, finished=time.time(), text=text, is_cached=is_cached)
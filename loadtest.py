@@ -0,0 +1,358 @@
+"""
+多人同时使用的压力测试：模拟 N 个人同时点 🚀，让真实的生成代码（任务队列 → 初稿 → 排版 → 缓存 / 历史）
+跑在一个本地的模拟 LLM 服务上，量出吞吐、延迟分位数、丢失的缓存 / 历史写入和内存峰值。
+
+模拟服务兼容 OpenAI 的 /chat/completions 协议，按 --latency 模拟模型耗时，按 --rate-limit 的比例返回 429，
+按 --truncate 的比例只返回半篇初稿（finish_reason 为 length），另一半等续写请求来取；
+初稿有一半故意不满足排版规则，排版阶段的调用也会被压到。
+模拟服务也像 DeepSeek 一样按块缓存见过的 Prompt 前缀，在 usage 里返回 prompt_cache_hit_tokens / prompt_cache_miss_tokens。
+每个模拟会话提交一批任务后像页面一样轮询结果，轮询时顺带读取历史和缓存统计（对应页面重跑）。
+--processes 大于 1 时，会话分散到多个进程，模拟多个 Streamlit 进程共用同一份 api_cache.json / history.json。
+
+缓存、历史、任务表和 Token 用量账本都写在临时目录里，不会动到正式数据；也不需要 API Key，不产生费用。
+
+    python loadtest.py --sessions 20
+    python loadtest.py --sessions 40 --variants 3 --processes 2 --latency 2 --rate-limit 0.05
+    python loadtest.py --sessions 20 --truncate 0.3
+"""
+import os
+import json
+import time
+import uuid
+import random
+import socket
+import argparse
+import tempfile
+import threading
+import multiprocessing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块，不统计内存峰值
+    resource = None
+
+import generation
+import jobs
+import quotas
+from generation import analyze_and_generate_prompt, cache_size, load_history
+from jobs import JobQueue, MAX_WORKERS, PENDING_STATES, DONE
+from benchmark import load_posts
+
+FORMAT_MARKER = "【需要排版的原始文案如下】：\n"
+MOCK_EMOJIS = "✨🔥💡"
+PREFIX_BLOCK_CHARS = 100  # 模拟前缀缓存的粒度（DeepSeek 按 64 Token 一块，约合 100 个汉字）
+
+
+# ==========================================
+# 模拟 LLM 服务
+# ==========================================
+def _mock_reply(content: str) -> str:
+    """排版请求：原文不动，每页第一行补 3 个 Emoji、每行补软换行；其余请求：写一篇独一无二的两页初稿。"""
+    if FORMAT_MARKER in content:
+        pages = generation.split_pages(content.split(FORMAT_MARKER, 1)[1])
+        formatted = []
+        for page in pages:
+            lines = page.split("\n")
+            first = next((i for i, line in enumerate(lines) if line.strip()), None)
+            if first is not None:
+                lines[first] = lines[first].rstrip() + MOCK_EMOJIS
+            formatted.append("\n".join(lines))
+        return generation.add_soft_breaks(generation.join_pages(formatted))
+
+    tag = uuid.uuid4().hex[:8]
+    emojis = MOCK_EMOJIS if random.random() < 0.5 else ""  # 一半初稿已经合格，可以跳过排版
+    return (f"模拟文案 {tag} 的开头{emojis}\n这是第一页的正文内容，用来测试并发写入\n\n"
+            f"@---\n\n第二页继续讲 {tag}{emojis}\n最后一句收尾\n")
+
+
+def _prefix_hit_chars(prompt: str, seen: set) -> int:
+    """prompt 开头有多少字的前缀之前出现过（按 PREFIX_BLOCK_CHARS 整块计），并把它的各块前缀记为已见。"""
+    hit, blocks = 0, range(PREFIX_BLOCK_CHARS, len(prompt) + 1, PREFIX_BLOCK_CHARS)
+    for end in blocks:
+        key = generation.get_hash(prompt[:end])
+        if key in seen and hit == end - PREFIX_BLOCK_CHARS:
+            hit = end
+        seen.add(key)
+    return hit
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    latency = 1.0
+    rate_limit = 0.0
+    truncate = 0.0
+    counts = {"requests": 0, "rate_limited": 0, "truncated": 0}
+    prefixes = set()
+    remainders = {}  # 被截断的前半篇 -> 留给续写请求的后半篇
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        with self.lock:
+            self._send_json(200, dict(self.counts))
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        limited = random.random() < self.rate_limit
+        with self.lock:
+            self.counts["requests"] += 1
+            self.counts["rate_limited"] += limited
+        if limited:
+            self._send_json(429, {"error": {"message": "模拟限速", "type": "rate_limit"}})
+            return
+        time.sleep(self.latency * random.uniform(0.7, 1.3))
+        prompt = "".join(m["content"] for m in request["messages"])
+        finish_reason = "stop"
+        if request["messages"][-1]["content"] == generation.CONTINUE_PROMPT:
+            with self.lock:
+                text = self.remainders.pop(request["messages"][-2]["content"], "")
+        else:
+            text = _mock_reply(request["messages"][-1]["content"])
+            if FORMAT_MARKER not in prompt and random.random() < self.truncate:
+                text, rest = text[:len(text) // 2], text[len(text) // 2:]
+                finish_reason = "length"
+                with self.lock:
+                    self.counts["truncated"] += 1
+                    self.remainders[text] = rest
+        prompt_tokens, completion_tokens = generation.estimate_tokens(prompt), generation.estimate_tokens(text)
+        with self.lock:
+            hit_tokens = generation.estimate_tokens(prompt[:_prefix_hit_chars(prompt, self.prefixes)])
+        self._send_json(200, {
+            "id": f"mock-{uuid.uuid4().hex}", "object": "chat.completion", "created": int(time.time()),
+            "model": request["model"],
+            "choices": [{"index": 0, "finish_reason": finish_reason, "message": {"role": "assistant", "content": text}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens,
+                      "prompt_cache_hit_tokens": hit_tokens, "prompt_cache_miss_tokens": prompt_tokens - hit_tokens},
+        })
+
+
+def serve_mock(port: int, latency: float, rate_limit: float, truncate: float = 0.0):
+    MockLLMHandler.latency, MockLLMHandler.rate_limit, MockLLMHandler.truncate = latency, rate_limit, truncate
+    ThreadingHTTPServer(("127.0.0.1", port), MockLLMHandler).serve_forever()
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# ==========================================
+# 模拟会话（每个进程一组）
+# ==========================================
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)  # Linux 下单位是 KB
+
+
+def _timed(func, durations: list):
+    """包一层计时：记录每次缓存 / 历史写入的耗时（含等锁），看读-改-写整份 JSON 的争用。"""
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            durations.append(time.perf_counter() - started)
+    return wrapper
+
+
+def run_sessions(task: dict) -> dict:
+    """在当前进程里跑一组会话，返回原始测量数据，由主进程汇总。
+
+    模拟会话的 Token 用量记到临时目录里的账本，不写进正式的 usage.json（那是每日配额的依据）。
+    """
+    ledger = quotas.usage_ledger  # generation / jobs 引用的是同一个对象，改它的文件路径即可
+    saved = ledger.usage_file, ledger._usage
+    ledger.usage_file, ledger._usage = os.path.join(task["data_dir"], f"usage-{task['index']}.json"), {}
+    try:
+        return _run_sessions(task)
+    finally:
+        ledger.usage_file, ledger._usage = saved
+
+
+def _run_sessions(task: dict) -> dict:
+    opts = task["opts"]
+    generation.API_BASE_URL = task["base_url"]
+    generation.CACHE_FILE = os.path.join(task["data_dir"], "api_cache.json")
+    generation.HISTORY_FILE = os.path.join(task["data_dir"], "history.json")
+    generation.HISTORY_LIMIT = 10 ** 6  # 压测时保留全部历史，才能逐条核对有没有丢
+
+    cache_keys, cache_writes, history_writes = set(), [], []
+    original_cache_put = generation.cache_put
+
+    def tracked_cache_put(key, text):
+        cache_keys.add(key)
+        original_cache_put(key, text)
+
+    generation.cache_put = _timed(tracked_cache_put, cache_writes)
+    jobs.add_to_history = _timed(jobs.add_to_history, history_writes)
+
+    queue = JobQueue(os.path.join(task["data_dir"], f"jobs-{task['index']}.json"),
+                     max_workers=opts["workers"], user_concurrency=0)
+    sys_p, usr_p = task["prompts"]
+    sessions, peak_threads = [], [threading.active_count()]
+    finished = threading.Event()
+
+    def monitor():
+        while not finished.wait(0.2):
+            peak_threads[0] = max(peak_threads[0], threading.active_count())
+
+    def session(session_id: int):
+        time.sleep(random.uniform(0, opts["ramp"]))
+        # 不同会话的主题不同（各自真实请求）；--shared-topic 时大家生成同一个主题，考验合并与缓存
+        prompt = usr_p if opts["shared_topic"] else f"{usr_p}\n（会话 {session_id}）"
+        submitted = time.time()
+        batch_id = queue.submit_batch(f"压测 {session_id}", sys_p, prompt, "sk-loadtest", "deepseek-chat", 500,
+                                      0.9, opts["retries"], n=opts["variants"], user=f"user{session_id}",
+                                      combined=opts["combined"])
+        while True:
+            time.sleep(opts["poll"])
+            load_history()  # 页面每次重跑都会读历史和缓存统计
+            cache_size()
+            current = queue.batch(batch_id)
+            if all(j["status"] not in PENDING_STATES for j in current):
+                break
+        sessions.append({"submitted": submitted, "jobs": current})
+
+    threading.Thread(target=monitor, daemon=True).start()
+    threads = [threading.Thread(target=session, args=(sid,)) for sid in task["session_ids"]]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    finished.set()
+
+    return {
+        "sessions": sessions,
+        "cache_keys": sorted(cache_keys),
+        "cache_writes": cache_writes,
+        "history_writes": history_writes,
+        "peak_threads": peak_threads[0],
+        "peak_rss_mb": _peak_rss_mb(),
+        "usage": generation.get_usage_stats(),
+        "continuation": generation.get_continuation_stats(),
+    }
+
+
+# ==========================================
+# 汇总
+# ==========================================
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def _read_json(path: str, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def summarize(results: list, data_dir: str, elapsed: float, server_counts: dict) -> list:
+    sessions = [s for r in results for s in r["sessions"]]
+    all_jobs = [j for s in sessions for j in s["jobs"]]
+    done = [j for j in all_jobs if j["status"] == DONE]
+    job_latency = [j["finished"] - j["created"] for j in all_jobs if j["finished"]]
+    session_latency = [max(j["finished"] for j in s["jobs"]) - s["submitted"] for s in sessions]
+    writes = lambda key: [d * 1000 for r in results for d in r[key]]
+
+    # 丢失的写入：本进程确实写过、但最终文件里没有的缓存 key / 历史记录
+    expected_keys = {k for r in results for k in r["cache_keys"]}
+    expected_texts = {j["text"] for j in done if not j["is_cached"]}
+    disk_keys = set(_read_json(os.path.join(data_dir, "api_cache.json"), {}))
+    disk_texts = {item["text"] for item in _read_json(os.path.join(data_dir, "history.json"), [])}
+
+    rss = [r["peak_rss_mb"] for r in results if r["peak_rss_mb"] is not None]
+    continuation = {key: sum(r["continuation"][key] for r in results) for key in results[0]["continuation"]}
+    cache_hit = sum(r["usage"]["prompt_cache_hit_tokens"] for r in results)
+    prompt_tokens = sum(r["usage"]["prompt_cache_hit_tokens"] + r["usage"]["prompt_cache_miss_tokens"] for r in results)
+    return [
+        ("会话 / 任务", f"{len(sessions)} / {len(all_jobs)}（成功 {len(done)}，失败 {len(all_jobs) - len(done)}）"),
+        ("总耗时", f"{elapsed:.1f} s"),
+        ("吞吐", f"{len(done) / elapsed:.2f} 篇/s"),
+        ("单篇延迟 p50 / p95 / p99", " / ".join(f"{percentile(job_latency, p):.1f}" for p in (50, 95, 99)) + " s"),
+        ("会话等待 p50 / p95 / 最长", f"{percentile(session_latency, 50):.1f} / {percentile(session_latency, 95):.1f} / "
+                                  f"{max(session_latency, default=0):.1f} s"),
+        ("模拟服务请求数", f"{server_counts['requests']}（其中 429 限速 {server_counts['rate_limited']}）"),
+        ("截断 / 续写请求 / 续写后完成", f"{continuation['truncated']}（服务端截断 {server_counts['truncated']}）/ "
+                                   f"{continuation['continuations']} / {continuation['completed']}"),
+        ("输入命中前缀缓存", f"{cache_hit} / {prompt_tokens} Token（{cache_hit / max(prompt_tokens, 1):.0%}）"),
+        ("缓存写入耗时 p50 / p95 / 最长", " / ".join(f"{percentile(writes('cache_writes'), p):.1f}" for p in (50, 95, 100)) + " ms"),
+        ("历史写入耗时 p50 / p95 / 最长", " / ".join(f"{percentile(writes('history_writes'), p):.1f}" for p in (50, 95, 100)) + " ms"),
+        ("丢失的缓存写入", f"{len(expected_keys - disk_keys)} / {len(expected_keys)}"),
+        ("丢失的历史记录", f"{len(expected_texts - disk_texts)} / {len(expected_texts)}"),
+        ("线程数峰值（单进程）", str(max(r["peak_threads"] for r in results))),
+        ("内存峰值 RSS（单进程）", f"{max(rss):.1f} MB" if rss else "-（当前系统不支持）"),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多会话压力测试（本地模拟 LLM 服务，不消耗 API 额度）")
+    parser.add_argument("--sessions", type=int, default=20, help="同时点 🚀 的人数")
+    parser.add_argument("--variants", "-n", type=int, default=1, help="每人生成的变体数")
+    parser.add_argument("--combined", action="store_true", help="开启「一次请求生成全部变体」")
+    parser.add_argument("--shared-topic", action="store_true", help="所有人生成同一个主题")
+    parser.add_argument("--processes", type=int, default=1, help="模拟多少个 Streamlit 进程共用数据文件")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS, help="每个进程的后台任务线程数")
+    parser.add_argument("--latency", type=float, default=1.0, help="模拟模型每次调用的平均耗时（秒）")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="返回 429 的比例（0~1）")
+    parser.add_argument("--truncate", type=float, default=0.0, help="初稿被截断（finish_reason=length）的比例（0~1）")
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--ramp", type=float, default=1.0, help="所有会话在这么多秒内陆续开始")
+    parser.add_argument("--poll", type=float, default=1.0, help="会话轮询结果的间隔（秒）")
+    parser.add_argument("--posts", default="", help="案例 JSON，默认取 history.json")
+    args = parser.parse_args()
+
+    prompts = analyze_and_generate_prompt(load_posts(args.posts), "压力测试主题", 500)
+    port = _free_port()
+    server = multiprocessing.Process(target=serve_mock, args=(port, args.latency, args.rate_limit, args.truncate), daemon=True)
+    server.start()
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(50):  # 等模拟服务起来
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.1)
+
+    data_dir = tempfile.mkdtemp(prefix="xhs-loadtest-")
+    opts = {key: getattr(args, key) for key in ("variants", "combined", "shared_topic", "workers", "retries", "ramp", "poll")}
+    tasks = [{"index": i, "session_ids": list(range(i, args.sessions, args.processes)), "opts": opts,
+              "prompts": prompts, "base_url": base_url, "data_dir": data_dir} for i in range(args.processes)]
+    print(f"{args.sessions} 个会话 × {args.variants} 个变体，{args.processes} 个进程 × {args.workers} 个工作线程，"
+          f"模拟耗时 {args.latency}s，限速比例 {args.rate_limit:.0%}，截断比例 {args.truncate:.0%}；数据目录 {data_dir}\n")
+
+    started = time.perf_counter()
+    if args.processes == 1:
+        results = [run_sessions(tasks[0])]
+    else:
+        with multiprocessing.Pool(args.processes) as pool:
+            results = pool.map(run_sessions, tasks)
+    elapsed = time.perf_counter() - started
+
+    with socket.create_connection(("127.0.0.1", port)) as conn:
+        conn.sendall(b"GET /stats HTTP/1.0\r\n\r\n")
+        server_counts = json.loads(conn.makefile("rb").read().split(b"\r\n\r\n", 1)[1])
+    server.terminate()
+
+    for name, value in summarize(results, data_dir, elapsed, server_counts):
+        print(f"{name:<24}{value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+实测分页：按画布尺寸和正文字号测量文字真实高度，重新决定 `@---` 的位置。
+
+模型给出的分页经常一页塞太多，编辑器只能靠 fitCard 把字号一路缩到 10px。
+这里在导出前一次性算好分页：按段落装箱，段落放不下时在句子边界拆开，
+标题不会孤零零留在页底。测量复用 card_renderer 的字体度量和排版（中文、Emoji 按字形宽度计算），
+所以与无头渲染结果一致；编辑器里的「智能分页」按钮用同一套规则在浏览器端实测。
+
+    from pagination import repaginate
+    text = repaginate(text, style_id="serif", size="375x667", body_size=16)
+"""
+import re
+
+from card_renderer import THEMES, CANVAS_SIZES, content_box, layout_blocks, parse_blocks
+
+PAGE_BREAK = "\n\n@---\n\n"
+# 句末标点 / 软换行之后都可以断开
+SENTENCE_SPLIT_RE = re.compile(r"(?<=[。！？!?…；;])(?![”’」』）)])|(?<=\n)")
+MIN_SPLIT_LINES = 3  # 剩余空间不足 3 行时不拆段落，直接换页
+
+
+def split_units(text: str) -> list:
+    """按空行切成段落单元（代码块整体保留）。"""
+    units, buf, in_code = [], [], False
+    for line in text.split("\n"):
+        if line.strip().startswith("```"):
+            in_code = not in_code
+        if not line.strip() and not in_code:
+            if buf:
+                units.append("\n".join(buf))
+                buf = []
+        else:
+            buf.append(line)
+    if buf:
+        units.append("\n".join(buf))
+    return units
+
+
+def split_sentences(text: str) -> list:
+    return [s for s in SENTENCE_SPLIT_RE.split(text) if s]
+
+
+def _balance_bold(head: str, tail: str) -> tuple:
+    """拆开的位置落在 **加粗** 中间时，两边各自补齐标记。"""
+    if head.count("**") % 2:
+        return head + "**", "**" + tail
+    return head, tail
+
+
+class _Measurer:
+    """带缓存的单元高度测量；每个单元在每种位置（页首/页中）只排版一次。"""
+
+    def __init__(self, style_id: str, size: str, body_size: float, heading_scale: int, image_root: str):
+        self.theme = THEMES[style_id]
+        _, _, self.width, self.page_height = content_box(style_id, size)
+        self.body_size = body_size
+        self.heading_scale = heading_scale
+        self.image_root = image_root
+        self._cache = {}
+
+    def blocks(self, unit: str) -> list:
+        return parse_blocks(unit, self.image_root)
+
+    def height(self, unit: str, at_top: bool) -> float:
+        key = (unit, at_top)
+        if key not in self._cache:
+            _, h = layout_blocks(self.blocks(unit), self.theme, self.width, self.body_size,
+                                 self.heading_scale, 1, at_top)
+            self._cache[key] = h
+        return self._cache[key]
+
+    def line_height(self) -> float:
+        return self.body_size * 1.7
+
+
+def _pack(units: list, m: _Measurer) -> list:
+    """贪心装箱，返回每页的单元列表。"""
+    pages, cur, used = [], [], 0.0
+    queue = list(units)
+
+    def page_height(page_units):
+        return sum(m.height(u, i == 0) for i, u in enumerate(page_units))
+
+    while queue:
+        unit = queue.pop(0)
+        h = m.height(unit, not cur)
+        if used + h <= m.page_height:
+            cur.append(unit)
+            used += h
+            continue
+
+        remaining = m.page_height - used
+        blocks = m.blocks(unit)
+        sentences = split_sentences(unit) if len(blocks) == 1 and blocks[0][0] == "p" else []
+        if len(sentences) > 1 and (remaining >= MIN_SPLIT_LINES * m.line_height() or not cur):
+            # 段落放不下：二分找出当前页还能装下的最多句子数，剩下的放回队首
+            def fits(k):
+                head, _ = _balance_bold("".join(sentences[:k]).rstrip("\n"), "")
+                return m.height(head, not cur) <= remaining
+
+            lo, hi = 0, len(sentences) - 1
+            while lo < hi:
+                mid = (lo + hi + 1) // 2
+                if fits(mid):
+                    lo = mid
+                else:
+                    hi = mid - 1
+            k = lo
+            if k > 0:
+                head, tail = _balance_bold("".join(sentences[:k]).rstrip("\n"), "".join(sentences[k:]).lstrip())
+                cur.append(head)
+                queue.insert(0, tail)
+                pages.append(cur)
+                cur, used = [], 0.0
+                continue
+
+        if not cur:
+            # 单个单元比整页还高且无法再拆：单独成页，交给字号自动缩放兜底
+            pages.append([unit])
+            continue
+
+        # 换页；若上一页以标题结尾，把标题一起带到新页（避免标题孤悬页底）
+        carry = []
+        if len(cur) > 1 and all(b[0] == "h" for b in m.blocks(cur[-1])):
+            carry = [cur.pop()]
+        pages.append(cur)
+        cur = carry
+        used = page_height(cur)
+        queue.insert(0, unit)
+
+    if cur:
+        pages.append(cur)
+    return pages
+
+
+def paginate(markdown_text: str, style_id: str = "minimal", size: str = "375x500", body_size: float = 15,
+             heading_scale: int = 26, keep_breaks: bool = False, image_root: str = "") -> list:
+    """按实测高度分页，返回每页的 Markdown 文本列表。
+
+    keep_breaks=True 时保留原有的 `@---` 作为强制分页，只拆分放不下的页；
+    否则忽略原分页，整篇重新装箱。
+    """
+    if size not in CANVAS_SIZES:
+        raise ValueError(f"未知画布尺寸: {size}")
+    m = _Measurer(style_id, size, body_size, heading_scale, image_root)
+    sections = markdown_text.split("@---") if keep_breaks else [markdown_text.replace("@---", "\n\n")]
+    pages = []
+    for section in sections:
+        units = split_units(section)
+        if units:
+            pages.extend("\n\n".join(p) for p in _pack(units, m))
+    return pages
+
+
+def repaginate(markdown_text: str, style_id: str = "minimal", size: str = "375x500", body_size: float = 15,
+               heading_scale: int = 26, keep_breaks: bool = False, image_root: str = "") -> str:
+    """paginate 的字符串版本：用 `@---` 重新拼接，可直接交给编辑器或 card_renderer。"""
+    return PAGE_BREAK.join(paginate(markdown_text, style_id, size, body_size, heading_scale, keep_breaks, image_root))
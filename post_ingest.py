@@ -0,0 +1,203 @@
+"""
+爆款案例 JSON 的流式导入：边读边解析、清洗、去重，解析结果按文件哈希缓存在磁盘上。
+
+抓取来的数据集动辄几万条、几百 MB，json.load 会把整个文件读进内存，而且每次重跑都要重来。
+这里用 ijson 流式读取（未安装时退回 json.load），逐条规范化文本，
+先去掉完全相同的帖子，再用 SimHash 去掉近似重复（换了几个字、加了几个表情的搬运帖）。
+同一个文件（按内容的 SHA-256）只解析一次，结果存在 upload_cache/ 下。
+
+    with open("posts.json", "rb") as f:
+        result = ingest_upload(f)
+    result["posts"], result["duplicates"]
+"""
+import os
+import re
+import json
+import hashlib
+import logging
+
+try:
+    import ijson
+except ImportError:  # 可选依赖：没有时整文件解析，功能不变，只是更占内存
+    ijson = None
+
+from generation import base_dir
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CACHE_DIR = os.path.join(base_dir, "upload_cache")
+UPLOAD_CACHE_KEEP = 20          # 最多保留最近 20 个文件的解析结果
+INGEST_VERSION = 1              # 清洗 / 去重规则变化时加一，旧缓存自动失效
+HASH_CHUNK = 1 << 20
+MIN_POST_CHARS = 10             # 比这还短的当作空帖子丢掉
+TEXT_KEYS = ("text", "content", "desc", "body")
+SIMHASH_BITS = 64
+SIMHASH_BANDS = 4               # 64 位分成 4 段 16 位：海明距离 ≤ 3 的两个指纹必有一段完全相同
+SIMHASH_MAX_DISTANCE = 3
+SHINGLE_SIZE = 3
+
+_ZERO_WIDTH_RE = re.compile(r"[\u200b\u200c\u2060\ufeff]")
+_EXTRA_BLANK_LINES_RE = re.compile(r"\n{3,}")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+# ==========================================
+# 解析与清洗
+# ==========================================
+def _first_byte(fileobj) -> bytes:
+    """看一眼文件开头第一个非空白字符，判断是 [...] 还是 {"posts": [...]}；文件指针停在 BOM 之后。"""
+    start = fileobj.tell()
+    head = fileobj.read(4096)
+    fileobj.seek(start + (3 if head.startswith(b"\xef\xbb\xbf") else 0))
+    return head.lstrip(b"\xef\xbb\xbf \t\r\n")[:1]
+
+
+def iter_raw_posts(fileobj):
+    """逐条产出原始帖子（str 或 dict），支持 [...] 和 {"posts": [...]} 两种格式。"""
+    shape = _first_byte(fileobj)
+    if shape not in (b"[", b"{"):
+        raise ValueError("JSON 格式不支持，需要 `{\"posts\": [...]}` 或 `[...]`")
+
+    if ijson is None:
+        data = json.loads(fileobj.read().decode("utf-8"))
+        if isinstance(data, dict):
+            if "posts" not in data:
+                raise ValueError("JSON 格式不支持，需要 `{\"posts\": [...]}` 或 `[...]`")
+            data = data["posts"]
+        yield from data
+        return
+
+    prefix = "item" if shape == b"[" else "posts.item"
+    try:
+        yield from ijson.items(fileobj, prefix, use_float=True)
+    except ijson.JSONError as e:
+        raise ValueError(str(e).strip()) from e
+
+
+def normalize_post(raw) -> str:
+    """统一成一段 Markdown 文本：取常见的正文字段，标题放在第一行，清掉零宽字符和多余空行。"""
+    if isinstance(raw, dict):
+        text = next((raw[k] for k in TEXT_KEYS if isinstance(raw.get(k), str) and raw[k].strip()), "")
+        title = raw.get("title")
+        if isinstance(title, str) and title.strip() and title.strip() not in text:
+            text = f"{title.strip()}\n{text}"
+    elif isinstance(raw, str):
+        text = raw
+    else:
+        return ""
+    text = _ZERO_WIDTH_RE.sub("", text.replace("\r\n", "\n").replace("\r", "\n"))
+    return _EXTRA_BLANK_LINES_RE.sub("\n\n", text).strip()
+
+
+# ==========================================
+# 近似去重（SimHash）
+# ==========================================
+def simhash(text: str) -> int:
+    """按 3 字 shingle 计算 64 位 SimHash。
+
+    逐位累加用字符串切片完成（每一位对应二进制串里的一列），比逐个 shingle 循环 64 次快一个数量级。
+    """
+    compact = _WHITESPACE_RE.sub("", text)
+    shingles = {compact[i:i + SHINGLE_SIZE] for i in range(max(len(compact) - SHINGLE_SIZE + 1, 1))}
+    bits = "".join(
+        format(int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big"), "064b")
+        for s in shingles
+    )
+    half = len(shingles) / 2
+    fingerprint = 0
+    for bit in range(SIMHASH_BITS):
+        if bits[bit::SIMHASH_BITS].count("1") > half:
+            fingerprint |= 1 << (SIMHASH_BITS - 1 - bit)
+    return fingerprint
+
+
+class NearDuplicateIndex:
+    """按 SimHash 分段建索引，只和至少有一段相同的指纹比较海明距离。"""
+
+    def __init__(self, max_distance: int = SIMHASH_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self._band_bits = SIMHASH_BITS // SIMHASH_BANDS
+        self._bands = [{} for _ in range(SIMHASH_BANDS)]
+
+    def _band_keys(self, fingerprint: int):
+        mask = (1 << self._band_bits) - 1
+        return [(fingerprint >> (i * self._band_bits)) & mask for i in range(SIMHASH_BANDS)]
+
+    def add_if_new(self, fingerprint: int) -> bool:
+        """与已收录的帖子都不近似时收录并返回 True，否则返回 False。"""
+        keys = self._band_keys(fingerprint)
+        for band, key in zip(self._bands, keys):
+            for other in band.get(key, ()):
+                if (fingerprint ^ other).bit_count() <= self.max_distance:
+                    return False
+        for band, key in zip(self._bands, keys):
+            band.setdefault(key, []).append(fingerprint)
+        return True
+
+
+def dedupe_posts(raw_posts) -> dict:
+    """清洗 + 精确去重 + 近似去重，返回 {"posts", "total", "empty", "duplicates"}。"""
+    posts, seen, index = [], set(), NearDuplicateIndex()
+    total = empty = duplicates = 0
+    for raw in raw_posts:
+        total += 1
+        text = normalize_post(raw)
+        if len(text) < MIN_POST_CHARS:
+            empty += 1
+            continue
+        digest = hashlib.md5(_WHITESPACE_RE.sub("", text).encode("utf-8")).digest()
+        if digest in seen or not index.add_if_new(simhash(text)):
+            duplicates += 1
+            continue
+        seen.add(digest)
+        posts.append(text)
+    return {"posts": posts, "total": total, "empty": empty, "duplicates": duplicates}
+
+
+# ==========================================
+# 磁盘缓存（按上传文件内容的哈希）
+# ==========================================
+def file_digest(fileobj) -> str:
+    start = fileobj.tell()
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: fileobj.read(HASH_CHUNK), b""):
+        digest.update(chunk)
+    fileobj.seek(start)
+    return digest.hexdigest()
+
+
+def _cache_path(digest: str, cache_dir: str) -> str:
+    return os.path.join(cache_dir, f"{digest}.v{INGEST_VERSION}.json")
+
+
+def _prune_cache(cache_dir: str):
+    entries = sorted((os.path.join(cache_dir, name) for name in os.listdir(cache_dir) if name.endswith(".json")),
+                     key=os.path.getmtime, reverse=True)
+    for path in entries[UPLOAD_CACHE_KEEP:]:
+        os.remove(path)
+
+
+def ingest_upload(fileobj, cache_dir: str = UPLOAD_CACHE_DIR) -> dict:
+    """解析一个上传的 JSON 文件（二进制文件对象），返回 dedupe_posts 的结果并附带 digest / from_cache。
+
+    同一份内容第二次上传时直接读磁盘缓存，不再解析。
+    """
+    digest = file_digest(fileobj)
+    path = _cache_path(digest, cache_dir)
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                result = json.load(f)
+            os.utime(path)
+            return dict(result, digest=digest, from_cache=True)
+        except (json.JSONDecodeError, IOError):
+            logger.warning("解析缓存 %s 损坏，重新解析", path)
+
+    result = dedupe_posts(iter_raw_posts(fileobj))
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    _prune_cache(cache_dir)
+    return dict(result, digest=digest, from_cache=False)
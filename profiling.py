@@ -0,0 +1,129 @@
+"""
+可选的性能分析：页面卡的时候，分清时间花在 Streamlit 重跑、缓存 / 历史的 JSON 读写、组装 Prompt 还是网络请求上。
+
+设置环境变量 XHS_PROFILE=1，或在侧边栏打开「🩺 性能分析」后：
+- 每次整页重跑、每个面板（fragment）的局部重跑、每个后台生成任务各记录一份 cProfile；
+- 结果写到 profiles/ 下的 .pstats 文件（可用 snakeviz 等工具看火焰图），只保留最近 PROFILE_KEEP 份；
+- 页面底部的「性能热点」表汇总最近几次记录里自身耗时最多的函数。
+
+    with profiled("job"):
+        generate_variant(...)
+    python profiling.py --kind rerun -n 20
+"""
+import os
+import sys
+import pstats
+import cProfile
+import argparse
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+PROFILE_DIR = os.environ.get("XHS_PROFILE_DIR", os.path.join(base_dir, "profiles"))
+PROFILE_KEEP = 200       # profiles/ 下最多保留 200 份记录
+PROFILE_AGGREGATE = 20   # 热点表默认汇总最近 20 份记录
+
+_enabled = os.environ.get("XHS_PROFILE", "") == "1"
+_local = threading.local()  # 当前线程上正在记录的分析器（嵌套时只记录最外层）
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def set_enabled(enabled: bool):
+    """侧边栏开关：对整个进程生效，后台任务也随之开始 / 停止记录。"""
+    global _enabled
+    _enabled = bool(enabled)
+
+
+def start_profiling():
+    """整页重跑开始时调用。上一次重跑被 st.rerun 打断、没能收尾的记录直接丢弃。"""
+    stale = getattr(_local, "profiler", None)
+    if stale is not None:
+        stale.disable()
+    _local.profiler = None
+    if not _enabled:
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:  # Python 3.12 起同一时间只能有一个分析器，其它线程正在记录时跳过这一次
+        return
+    _local.profiler = profiler
+
+
+def stop_profiling(label: str):
+    """结束当前线程的记录并写入 profiles/{时间}-{label}.pstats。"""
+    profiler = getattr(_local, "profiler", None)
+    _local.profiler = None
+    if profiler is None:
+        return
+    profiler.disable()
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profiler.dump_stats(os.path.join(PROFILE_DIR, f"{datetime.now():%Y%m%d-%H%M%S-%f}-{label}.pstats"))
+    _prune()
+
+
+@contextmanager
+def profiled(label: str):
+    """记录一段代码；也可以当装饰器用。已经在记录中（如整页重跑里的面板）时不再单独记录。"""
+    if not _enabled or getattr(_local, "profiler", None) is not None:
+        yield
+        return
+    start_profiling()
+    try:
+        yield
+    finally:
+        stop_profiling(label)
+
+
+def _prune():
+    for path in recent_profiles()[PROFILE_KEEP:]:
+        os.remove(path)
+
+
+def recent_profiles(kind: str = "") -> list:
+    """最近的记录文件，新的在前；kind 为 label 前缀（rerun / fragment / job）。"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    names = [name for name in os.listdir(PROFILE_DIR) if name.endswith(".pstats")]
+    # 文件名以时间开头，按名字倒序即按时间倒序；label 在第三个 "-" 之后
+    return [os.path.join(PROFILE_DIR, name) for name in sorted(names, reverse=True)
+            if name.split("-", 3)[-1].startswith(kind)]
+
+
+def hotspots(kind: str = "", limit: int = 20, recent: int = PROFILE_AGGREGATE) -> list:
+    """汇总最近 recent 份记录，按自身耗时返回前 limit 个函数。"""
+    files = recent_profiles(kind)[:recent]
+    if not files:
+        return []
+    stats = pstats.Stats(*files).stats
+    rows = [{
+        "function": f"{os.path.basename(filename)}:{line}({func})" if line else func,
+        "calls": calls,
+        "tottime_ms": round(tottime * 1000, 1),
+        "cumtime_ms": round(cumtime * 1000, 1),
+    } for (filename, line, func), (_, calls, tottime, cumtime, _) in stats.items()]
+    rows.sort(key=lambda row: row["tottime_ms"], reverse=True)
+    return rows[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="汇总 profiles/ 下最近的性能记录")
+    parser.add_argument("--kind", default="", help="只看某类记录：rerun / fragment / job")
+    parser.add_argument("-n", "--limit", type=int, default=20, help="显示前 N 个函数")
+    parser.add_argument("--recent", type=int, default=PROFILE_AGGREGATE, help="汇总最近多少份记录")
+    args = parser.parse_args()
+
+    rows = hotspots(args.kind, args.limit, args.recent)
+    if not rows:
+        sys.exit("profiles/ 下还没有记录：设置 XHS_PROFILE=1 或在侧边栏打开性能分析后再使用页面")
+    print(f"{'自身(ms)':>10} {'累计(ms)':>10} {'调用次数':>8}  函数")
+    for row in rows:
+        print(f"{row['tottime_ms']:>10} {row['cumtime_ms']:>10} {row['calls']:>8}  {row['function']}")
+
+
+if __name__ == "__main__":
+    main()
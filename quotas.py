@@ -0,0 +1,114 @@
+"""
+多人共用一个实例时的用户身份、配额与 Token 用量记账。
+
+设置环境变量 XHS_SERVER_MODE=1 开启服务模式：每个人在侧边栏填写使用者名称，
+API Key 可以留空使用团队共用的 DEEPSEEK_API_KEY（不会再回填到浏览器里）。
+配额（0 表示不限）：
+    XHS_USER_MAX_CONCURRENCY  每个用户同时运行的生成任务数（服务模式默认 2）
+    XHS_USER_DAILY_TOKENS     每个用户每天可用的 Token 总数
+用量按 "用户 × 日期" 记在 usage.json，进程重启后依然有效。
+
+Token 额度在任务派发时检查：每个任务先按估算的最大用量预留（reserve_token_quota），
+实际用量在每次 API 调用后记账，任务结束时归还预留（release_token_quota）。
+这样同时派发的几个任务不会都看到"还有余量"而一起超额；但估算只是上限的近似，
+已经在跑的任务不会被中途打断，最后几个任务仍可能让当天用量略超额度。
+"""
+import os
+import json
+import hashlib
+import threading
+from datetime import date
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+USAGE_FILE = os.path.join(base_dir, "usage.json")
+USAGE_KEEP_DAYS = 7
+
+SERVER_MODE = os.environ.get("XHS_SERVER_MODE", "") == "1"
+USER_MAX_CONCURRENCY = int(os.environ.get("XHS_USER_MAX_CONCURRENCY", "2" if SERVER_MODE else "0"))
+USER_DAILY_TOKENS = int(os.environ.get("XHS_USER_DAILY_TOKENS", "0"))
+ANONYMOUS_USER = "anonymous"
+
+
+def user_identity(user_name: str = "", api_key: str = "") -> str:
+    """配额按使用者名称计；没填名称时按自带的 API Key 计（只保留摘要，不落明文）。"""
+    if user_name.strip():
+        return user_name.strip()
+    if api_key:
+        return "key:" + hashlib.md5(api_key.encode('utf-8')).hexdigest()[:8]
+    return ANONYMOUS_USER
+
+
+class UsageLedger:
+    """进程内共享的 Token 用量账本，线程安全，每次记账后写回 usage.json。"""
+
+    def __init__(self, usage_file: str = USAGE_FILE):
+        self.usage_file = usage_file
+        self._lock = threading.Lock()
+        self._usage = self._load()  # {"2024-01-01": {"alice": 1234}}
+        self._reserved = {}         # {"alice": 4000}：已派发、还没结束的任务预留的 Token，只记在内存里
+
+    def _load(self) -> dict:
+        if os.path.exists(self.usage_file):
+            try:
+                with open(self.usage_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (json.JSONDecodeError, IOError):
+                return {}
+        return {}
+
+    def _save(self):
+        for day in sorted(self._usage)[:-USAGE_KEEP_DAYS]:
+            del self._usage[day]
+        with open(self.usage_file, 'w', encoding='utf-8') as f:
+            json.dump(self._usage, f, ensure_ascii=False, indent=4)
+
+    def add(self, user: str, tokens: int):
+        if not tokens:
+            return
+        today = date.today().isoformat()
+        with self._lock:
+            day = self._usage.setdefault(today, {})
+            day[user] = day.get(user, 0) + tokens
+            self._save()
+
+    def used_today(self, user: str) -> int:
+        with self._lock:
+            return self._usage.get(date.today().isoformat(), {}).get(user, 0)
+
+    def reserve(self, user: str, tokens: int, limit: int):
+        """今日已用 + 已预留不足 limit 时预留 tokens 并返回 None；否则不预留，返回已用 + 已预留的 Token 数。"""
+        with self._lock:
+            committed = self._usage.get(date.today().isoformat(), {}).get(user, 0) + self._reserved.get(user, 0)
+            if committed >= limit:
+                return committed
+            self._reserved[user] = self._reserved.get(user, 0) + tokens
+            return None
+
+    def release(self, user: str, tokens: int):
+        """任务结束后归还预留。实际用量已经由 add 逐次记入，这里只把估算的部分去掉。"""
+        with self._lock:
+            left = self._reserved.get(user, 0) - tokens
+            if left > 0:
+                self._reserved[user] = left
+            else:
+                self._reserved.pop(user, None)
+
+
+usage_ledger = UsageLedger()
+
+
+def reserve_token_quota(user: str, tokens: int):
+    """派发任务前预留 tokens。今日额度已用完（含进行中任务的预留）时返回错误信息，否则返回 None。"""
+    if USER_DAILY_TOKENS <= 0:
+        return None
+    committed = usage_ledger.reserve(user, tokens, USER_DAILY_TOKENS)
+    if committed is not None:
+        return (f"❌ 今日 Token 额度已用完（已用及进行中任务预留 {committed}/{USER_DAILY_TOKENS}），"
+                f"请明天再试或联系管理员调整 XHS_USER_DAILY_TOKENS。")
+    return None
+
+
+def release_token_quota(user: str, tokens: int):
+    """任务结束后归还 reserve_token_quota 预留的 Token。"""
+    if USER_DAILY_TOKENS > 0:
+        usage_ledger.release(user, tokens)
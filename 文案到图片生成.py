@@ -476,11 +476,18 @@
 
         <div class="h-12 border-b border-gray-100 flex items-center justify-between px-4 shrink-0 bg-white">
             <h2 class="font-bold text-sm flex items-center gap-2"><i data-lucide="pen-tool" size="14"></i> 正文编辑</h2>
-            <button onclick="pasteFromClipboard()"
-                class="text-green-600 hover:bg-green-50 px-2 py-1 rounded text-xs flex items-center gap-1 transition-colors border border-green-200"
-                title="读取剪贴板">
-                <i data-lucide="clipboard-paste" size="12"></i> 粘贴
-            </button>
+            <div class="flex items-center gap-2">
+                <button onclick="autoPaginate()"
+                    class="text-purple-600 hover:bg-purple-50 px-2 py-1 rounded text-xs flex items-center gap-1 transition-colors border border-purple-200"
+                    title="按当前画布尺寸和字号实测，重新插入 @--- 分页">
+                    <i data-lucide="scissors" size="12"></i> 智能分页
+                </button>
+                <button onclick="pasteFromClipboard()"
+                    class="text-green-600 hover:bg-green-50 px-2 py-1 rounded text-xs flex items-center gap-1 transition-colors border border-green-200"
+                    title="读取剪贴板">
+                    <i data-lucide="clipboard-paste" size="12"></i> 粘贴
+                </button>
+            </div>
         </div>
 
         <div class="flex-1 p-4 flex flex-col h-full overflow-hidden">
@@ -576,7 +583,7 @@
             </div>
             <button onclick="downloadAll()"
                 class="bg-black hover:bg-gray-800 text-white text-xs px-3 py-1.5 rounded font-bold flex items-center gap-1 transition-all shadow-sm">
-                <i data-lucide="download" size="12"></i> 导出JPG
+                <i data-lucide="download" size="12"></i> 导出图片
             </button>
         </div>
 
@@ -670,6 +677,37 @@
                 </div>
             </div>
 
+            <div class="space-y-4 pt-4 border-t border-gray-100">
+                <h3 class="text-xs font-black text-gray-400 uppercase tracking-widest">导出设置</h3>
+
+                <div class="grid grid-cols-2 gap-2">
+                    <div>
+                        <label class="block text-xs font-bold text-gray-500 mb-1">格式</label>
+                        <select id="export-format"
+                            class="w-full bg-gray-50 border border-gray-200 text-xs rounded px-2 py-1.5 focus:ring-1 focus:ring-black outline-none cursor-pointer">
+                            <option value="jpeg">JPG</option>
+                            <option value="webp">WebP</option>
+                            <option value="png">PNG</option>
+                        </select>
+                    </div>
+                    <div>
+                        <label class="block text-xs font-bold text-gray-500 mb-1">清晰度</label>
+                        <select id="export-pixel-ratio"
+                            class="w-full bg-gray-50 border border-gray-200 text-xs rounded px-2 py-1.5 focus:ring-1 focus:ring-black outline-none cursor-pointer">
+                            <option value="1">1x</option>
+                            <option value="1.5">1.5x</option>
+                            <option value="2" selected>2x</option>
+                            <option value="3">3x</option>
+                        </select>
+                    </div>
+                </div>
+                <div>
+                    <label class="block text-xs font-bold text-gray-500 mb-1">单张大小上限 (KB，0 = 不限)</label>
+                    <input type="number" id="export-max-kb" min="0" step="50" value="0"
+                        class="w-full bg-gray-50 border border-gray-200 rounded px-2 py-1.5 text-xs focus:bg-white focus:ring-1 focus:ring-black outline-none">
+                </div>
+            </div>
+
             <div class="mt-8 pt-6 border-t border-gray-100 text-center pb-6">
                 <p class="text-[10px] text-gray-400 font-mono leading-relaxed opacity-70">
                     小红书笔记生成器<br>
@@ -701,12 +739,70 @@
             titleSize: 48,
             introSize: 14,
             bodySize: 15,
-            coverImage: null,
-            bodyImages: {}
+            coverImage: null // 封面图在 imageStore 中的 id
         };
 
-        const renderer = new marked.Renderer();
-        renderer.image = function (href, title, text) {
+        // ==================== 图片 Blob 仓库 ====================
+        // 粘贴/上传的图片以 Blob 保存，入库时缩到画布实际用得到的最大尺寸，预览里只引用短小的 blob: URL。
+        // object URL 按 LRU 管理：超出容量时回收当前内容没有引用的 URL（Blob 保留，再次用到时重新生成）。
+        const MAX_IMAGE_WIDTH = 750;    // 375px 宽画布 × pixelRatio 2
+        const MAX_IMAGE_HEIGHT = 1334;  // 375x667 画布 × pixelRatio 2
+        const IMAGE_URL_CAPACITY = 32;
+
+        const imageStore = {
+            blobs: new Map(),  // id -> Blob
+            urls: new Map(),   // id -> object URL，Map 的插入顺序即 LRU 顺序
+            inUse: new Set(),
+
+            async put(file) {
+                const id = Date.now().toString();
+                this.blobs.set(id, await downscaleImage(file));
+                return id;
+            },
+            url(id) {
+                if (!this.blobs.has(id)) return null;
+                let url = this.urls.get(id);
+                if (url) this.urls.delete(id); // 移到队尾 = 最近使用
+                else url = URL.createObjectURL(this.blobs.get(id));
+                this.urls.set(id, url);
+                this.evict();
+                return url;
+            },
+            // 记录本次渲染引用到的图片，这些 URL 不会被回收（导出时 html-to-image 还要重新读取）
+            markInUse(ids) {
+                this.inUse = new Set(ids);
+                this.evict();
+            },
+            evict() {
+                for (const [id, url] of this.urls) {
+                    if (this.urls.size <= IMAGE_URL_CAPACITY) break;
+                    if (this.inUse.has(id)) continue;
+                    URL.revokeObjectURL(url);
+                    this.urls.delete(id);
+                }
+            }
+        };
+
+        async function downscaleImage(file) {
+            let bitmap;
+            try { bitmap = await createImageBitmap(file); } catch (e) { return file; } // 浏览器无法解码（如 SVG）时原样保存
+            const ratio = Math.min(1, MAX_IMAGE_WIDTH / bitmap.width, MAX_IMAGE_HEIGHT / bitmap.height);
+            if (ratio === 1) { bitmap.close(); return file; }
+            const canvas = document.createElement('canvas');
+            canvas.width = Math.round(bitmap.width * ratio);
+            canvas.height = Math.round(bitmap.height * ratio);
+            canvas.getContext('2d').drawImage(bitmap, 0, 0, canvas.width, canvas.height);
+            bitmap.close();
+            // PNG 可能带透明通道，保持 PNG；其余统一转 JPG
+            const type = file.type === 'image/png' ? 'image/png' : 'image/jpeg';
+            const blob = await new Promise(resolve => canvas.toBlob(resolve, type, 0.92));
+            canvas.width = 0; canvas.height = 0;
+            return blob || file;
+        }
+
+        // img:ID 形式的粘贴图在这里原样输出，由主线程的 resolveImageSources 换成 blob: URL，
+        // 这样本函数也能原样放进 Markdown Worker 里执行
+        function renderImage(href, title, text) {
             let widthStyle = '';
             let altText = text;
             if (text && text.includes('|')) {
@@ -717,18 +813,89 @@
                     widthStyle = `width: ${width};`;
                 }
             }
-            let imgSource = href;
-            if (href && href.startsWith('img:')) {
-                const id = href.split(':')[1];
-                if (state.bodyImages[id]) {
-                    imgSource = state.bodyImages[id];
-                }
-            }
-            return `<img src="${imgSource}" alt="${altText}" title="${title || ''}" style="${widthStyle}">`;
-        };
+            return `<img src="${href}" alt="${altText}" title="${title || ''}" style="${widthStyle}">`;
+        }
+
+        function preprocessMarkdown(pageText) {
+            return pageText.replace(/::: row\n([\s\S]*?)\n:::/g, '<div class="img-row">$1</div>');
+        }
 
+        const renderer = new marked.Renderer();
+        renderer.image = renderImage;
         marked.setOptions({ breaks: true, gfm: true, renderer: renderer });
 
+        // ==================== Markdown 解析 Worker ====================
+        // 各页的 marked.parse 放到 Worker 里做，并按页缓存结果；主线程只负责把 HTML 挂到卡片上。
+        // Worker 不可用时（如被沙箱禁止）退回主线程同步解析。
+        const MARKED_URL = 'https://cdn.jsdelivr.net/npm/marked@4.3.0/marked.min.js';
+        const PAGE_HTML_CACHE_LIMIT = 500;
+        const pageHtmlCache = new Map(); // 页面 Markdown -> HTML（img:ID 尚未替换）
+        let parseRequestId = 0;
+        let markdownWorker = createMarkdownWorker();
+
+        function markdownWorkerMain() {
+            const renderer = new marked.Renderer();
+            renderer.image = renderImage;
+            marked.setOptions({ breaks: true, gfm: true, renderer: renderer });
+            self.onmessage = (e) => {
+                const { id, pages } = e.data;
+                const html = pages.map(text => marked.parse(preprocessMarkdown(text)));
+                self.postMessage({ id, pages, html });
+            };
+        }
+
+        function createMarkdownWorker() {
+            try {
+                const source = `importScripts('${MARKED_URL}');\n${renderImage}\n${preprocessMarkdown}\n(${markdownWorkerMain})();`;
+                const worker = new Worker(URL.createObjectURL(new Blob([source], { type: 'text/javascript' })));
+                worker.onmessage = (e) => {
+                    const { id, pages, html } = e.data;
+                    pages.forEach((text, i) => cachePageHtml(text, html[i]));
+                    if (id === parseRequestId) updatePreview();
+                };
+                worker.onerror = (error) => {
+                    console.warn('Markdown Worker 不可用，改为主线程解析:', error);
+                    markdownWorker = null;
+                    updatePreview();
+                };
+                return worker;
+            } catch (error) {
+                return null;
+            }
+        }
+
+        function cachePageHtml(pageText, html) {
+            pageHtmlCache.delete(pageText);
+            pageHtmlCache.set(pageText, html);
+            if (pageHtmlCache.size > PAGE_HTML_CACHE_LIMIT) pageHtmlCache.delete(pageHtmlCache.keys().next().value);
+        }
+
+        // 所有页面都已有解析结果时返回 true；否则把缺的页交给 Worker，解析完成后会再次调用 updatePreview
+        function ensurePagesParsed(pages) {
+            const missing = pages.filter(p => p.trim() && !pageHtmlCache.has(p));
+            parseRequestId++;
+            if (!missing.length) return true;
+            if (!markdownWorker) {
+                missing.forEach(p => cachePageHtml(p, marked.parse(preprocessMarkdown(p))));
+                return true;
+            }
+            markdownWorker.postMessage({ id: parseRequestId, pages: missing });
+            return false;
+        }
+
+        function resolveImageSources(html) {
+            return html.replace(/src="img:(\w+)"/g, (match, id) => {
+                const url = imageStore.url(id);
+                return url ? `src="${url}"` : match;
+            });
+        }
+
+        // 同步版本（智能分页测量用）：优先取缓存
+        function renderMarkdown(pageText) {
+            if (!pageHtmlCache.has(pageText)) cachePageHtml(pageText, marked.parse(preprocessMarkdown(pageText)));
+            return resolveImageSources(pageHtmlCache.get(pageText));
+        }
+
         window.onload = () => {
             renderStyleGrid();
             initUrlParams();
@@ -820,14 +987,11 @@
                 for (let i = 0; i < items.length; i++) {
                     if (items[i].kind === 'file' && items[i].type.indexOf('image/') !== -1) {
                         e.preventDefault();
-                        const reader = new FileReader();
-                        reader.onload = function (event) {
-                            const id = Date.now().toString(); state.bodyImages[id] = event.target.result;
+                        imageStore.put(items[i].getAsFile()).then(id => {
                             const textarea = document.getElementById('input-content');
                             textarea.value = textarea.value.substring(0, textarea.selectionStart) + `![截图](img:${id})` + textarea.value.substring(textarea.selectionEnd);
                             updatePreview();
-                        };
-                        reader.readAsDataURL(items[i].getAsFile());
+                        });
                     }
                 }
             });
@@ -847,28 +1011,26 @@
 
         function handleImageUpload(input) {
             const file = input.files[0]; if (!file) return;
-            const reader = new FileReader(); reader.onload = (e) => { state.coverImage = e.target.result; updatePreview(); }; reader.readAsDataURL(file);
+            imageStore.put(file).then(id => { state.coverImage = id; updatePreview(); });
         }
 
         function handleBodyImageUpload(input) {
             const file = input.files[0]; if (!file) return;
-            const reader = new FileReader(); reader.onload = (e) => {
-                const id = Date.now().toString(); state.bodyImages[id] = e.target.result;
+            imageStore.put(file).then(id => {
                 const textarea = document.getElementById('input-content'); textarea.value = textarea.value + `\n![插图](img:${id})\n`; updatePreview(); input.value = '';
-            }; reader.readAsDataURL(file);
+            });
         }
 
         function clearImage() { state.coverImage = null; document.getElementById('cover-image-upload').value = ''; updatePreview(); }
 
         // ==================== 核心：渲染与包裹逻辑 ====================
         function updatePreview() {
-            const container = document.getElementById('preview-canvas'); container.innerHTML = '';
-
             const title = document.getElementById('input-title').value;
             const date = document.getElementById('input-date').value;
             const tag = document.getElementById('input-tag').value;
             const intro = document.getElementById('input-intro').value;
             const rawContent = document.getElementById('input-content').value;
+            imageStore.markInUse([...Array.from(rawContent.matchAll(/\(img:(\w+)/g), m => m[1]), state.coverImage]);
 
             state.bodySize = document.getElementById('body-size').value;
             state.titleSize = document.getElementById('title-size').value;
@@ -890,6 +1052,13 @@
             const cardHeight = sizeVal[1];
             const styleConfig = STYLES.find(s => s.id === state.styleId);
             const pages = rawContent.split('@---');
+            if (!ensurePagesParsed(pages)) return;
+
+            const container = document.getElementById('preview-canvas'); container.innerHTML = '';
+            if (cardObserver) cardObserver.disconnect();
+            cardRecords = [];
+            const pageCount = pages.filter(p => p.trim()).length;
+            const virtualize = pageCount + 1 >= VIRTUALIZE_MIN_CARDS;
 
             const createCardWithDownload = (elementHTML, filename) => {
                 const wrapper = document.createElement('div');
@@ -899,11 +1068,14 @@
                 card.className = `card-wrapper ${styleConfig.class}`;
                 card.style.width = cardWidth + 'px';
                 card.style.height = cardHeight + 'px';
-                card.innerHTML = elementHTML;
+                // 内容先不挂载，由 mountCard（直接或按视口）填充
+                const rec = { wrapper, card, html: elementHTML, key: `${styleConfig.class}|${cardWidth}x${cardHeight}|${state.bodySize}|${elementHTML}`, mounted: false, visible: false };
+                wrapper.__cardRecord = rec;
+                cardRecords.push(rec);
 
                 const btn = document.createElement('button');
                 btn.className = 'absolute top-3 right-3 z-50 bg-black/60 hover:bg-black text-white p-2 rounded-full opacity-0 group-hover:opacity-100 transition-all duration-200 shadow-lg cursor-pointer transform hover:scale-110';
-                btn.title = "保存为JPG";
+                btn.title = "保存图片";
                 btn.innerHTML = '<i data-lucide="download" size="16"></i>';
                 btn.onclick = (e) => { e.stopPropagation(); saveSingleCard(card, filename, btn); };
 
@@ -916,49 +1088,367 @@
 
             pages.forEach((pageText, index) => {
                 if (!pageText.trim()) return;
-                let processedText = pageText.replace(/::: row\n([\s\S]*?)\n:::/g, '<div class="img-row">$1</div>');
-                const htmlContent = marked.parse(processedText);
+                const htmlContent = resolveImageSources(pageHtmlCache.get(pageText));
                 container.appendChild(createCardWithDownload(renderPageHTML(styleConfig, htmlContent, index + 1, date), `rednote_page_${index + 1}.jpg`));
             });
             
-            // Auto size adjustment
-            setTimeout(autoFitText, 50);
-            
+            releaseStaleThumbs();
+            if (virtualize) {
+                observeCards();
+            } else {
+                cardRecords.forEach(rec => mountCard(rec, false));
+            }
+
             lucide.createIcons();
         }
 
+        // ==================== 实测智能分页 ====================
+        // 与 pagination.py 同一套规则：按段落装箱，段落放不下时在句子边界拆开，标题不留在页底。
+        // 所有段落在一张离屏卡片里一次性测量，分页结果保证以当前字号放得下，fitCard 不再需要缩字。
+        const SENTENCE_SPLIT_RE = /(?<=[。！？!?…；;])(?![”’」』）)])|(?<=\n)/;
+        const MIN_SPLIT_LINES = 3;
+
+        function splitUnits(text) {
+            const units = []; let buf = []; let inCode = false;
+            text.split('\n').forEach(line => {
+                if (line.trim().startsWith('```')) inCode = !inCode;
+                if (!line.trim() && !inCode) { if (buf.length) { units.push(buf.join('\n')); buf = []; } }
+                else buf.push(line);
+            });
+            if (buf.length) units.push(buf.join('\n'));
+            return units;
+        }
+
+        function balanceBold(head, tail) {
+            return (head.split('**').length - 1) % 2 ? [head + '**', '**' + tail] : [head, tail];
+        }
+
+        function createMeasurer() {
+            const sizeVal = document.getElementById('canvas-size').value.split('x');
+            const styleConfig = STYLES.find(s => s.id === state.styleId);
+            const host = document.createElement('div');
+            host.style.cssText = 'position: absolute; left: -99999px; top: 0; visibility: hidden; pointer-events: none;';
+            const card = document.createElement('div');
+            card.className = `card-wrapper ${styleConfig.class}`;
+            card.style.width = sizeVal[0] + 'px';
+            card.style.height = sizeVal[1] + 'px';
+            card.innerHTML = renderPageHTML(styleConfig, '', 1, document.getElementById('input-date').value);
+            host.appendChild(card);
+            document.body.appendChild(host);
+            const body = card.querySelector('.markdown-body');
+            const pageHeight = body.clientHeight;
+            const cache = new Map();
+
+            // flow-root 让子元素外边距计入包裹层高度（略偏保守，不会塞爆）
+            const makeBox = (unit) => {
+                const box = document.createElement('div');
+                box.style.display = 'flow-root';
+                box.innerHTML = renderMarkdown(unit);
+                body.appendChild(box);
+                return box;
+            };
+            return {
+                pageHeight,
+                lineHeight: parseFloat(state.bodySize) * 1.7,
+                // 批量测量：先全部插入再统一读取，只触发一次布局
+                measureAll(units) {
+                    const todo = units.filter(u => !cache.has(u)).map(u => [u, makeBox(u)]);
+                    todo.forEach(([u, box]) => cache.set(u, box.getBoundingClientRect().height));
+                    todo.forEach(([, box]) => box.remove());
+                },
+                height(unit) {
+                    if (!cache.has(unit)) this.measureAll([unit]);
+                    return cache.get(unit);
+                },
+                isHeading(unit) { return /^#{1,6}\s/.test(unit.trim()) && !unit.trim().includes('\n'); },
+                isParagraph(unit) { return !/^(#{1,6}\s|>|[-*+]\s|\d+\.\s|```|!\[|::: row)/.test(unit.trim()); },
+                destroy() { host.remove(); }
+            };
+        }
+
+        function paginateUnits(units, m) {
+            const pages = []; let cur = []; let used = 0;
+            const queue = units.slice();
+            m.measureAll(units);
+
+            while (queue.length) {
+                const unit = queue.shift();
+                const h = m.height(unit);
+                if (used + h <= m.pageHeight) { cur.push(unit); used += h; continue; }
+
+                const remaining = m.pageHeight - used;
+                const sentences = m.isParagraph(unit) ? unit.split(SENTENCE_SPLIT_RE).filter(Boolean) : [];
+                if (sentences.length > 1 && (remaining >= MIN_SPLIT_LINES * m.lineHeight || !cur.length)) {
+                    // 二分找出当前页还能装下的最多句子数
+                    const headOf = (k) => balanceBold(sentences.slice(0, k).join('').replace(/\n+$/, ''), '')[0];
+                    let lo = 0, hi = sentences.length - 1;
+                    while (lo < hi) {
+                        const mid = Math.floor((lo + hi + 1) / 2);
+                        if (m.height(headOf(mid)) <= remaining) lo = mid; else hi = mid - 1;
+                    }
+                    if (lo > 0) {
+                        const [head, tail] = balanceBold(sentences.slice(0, lo).join('').replace(/\n+$/, ''), sentences.slice(lo).join('').trimStart());
+                        cur.push(head); queue.unshift(tail);
+                        pages.push(cur); cur = []; used = 0;
+                        continue;
+                    }
+                }
+
+                if (!cur.length) { pages.push([unit]); continue; } // 整页都放不下且无法再拆，交给 fitCard 兜底
+
+                const carry = (cur.length > 1 && m.isHeading(cur[cur.length - 1])) ? [cur.pop()] : [];
+                pages.push(cur);
+                cur = carry;
+                used = carry.reduce((sum, u) => sum + m.height(u), 0);
+                queue.unshift(unit);
+            }
+            if (cur.length) pages.push(cur);
+            return pages.map(p => p.join('\n\n'));
+        }
+
+        function autoPaginate() {
+            const textarea = document.getElementById('input-content');
+            const units = splitUnits(textarea.value.replace(/@---/g, '\n\n'));
+            if (!units.length) return;
+            updatePreview(); // 同步 state 中的字号设置
+            const m = createMeasurer();
+            try {
+                textarea.value = paginateUnits(units, m).join('\n\n@---\n\n');
+            } finally {
+                m.destroy();
+            }
+            updatePreview();
+        }
+
+        // ==================== 虚拟化预览 ====================
+        // 长文（几十页）时只挂载视口附近的卡片；离开视口的卡片换成缓存的低清缩略图，滚回来时再还原。
+        // 导出不受影响：导出前会逐张挂载。
+        const VIRTUALIZE_MIN_CARDS = 12;
+        const THUMB_PIXEL_RATIO = 0.3;
+        let cardRecords = [];      // { wrapper, card, html, key, mounted, visible }
+        let cardObserver = null;
+        const thumbCache = new Map(); // 卡片内容 key -> 缩略图 blob URL
+
+        function mountCard(rec, withIcons = true) {
+            if (rec.mounted) return;
+            rec.card.innerHTML = rec.html;
+            rec.mounted = true;
+            fitCard(rec.card);
+            if (withIcons) lucide.createIcons();
+        }
+
+        async function unmountCard(rec, capture = true) {
+            if (!rec.mounted || rec.capturing) return;
+            if (capture && !thumbCache.has(rec.key)) {
+                rec.capturing = true;
+                try {
+                    const canvas = await htmlToImage.toCanvas(rec.card, { pixelRatio: THUMB_PIXEL_RATIO, skipFonts: true });
+                    thumbCache.set(rec.key, URL.createObjectURL(await canvasToBlob(canvas, 'image/jpeg', 0.7)));
+                } catch (error) {
+                    // 缩略图失败只影响占位显示
+                } finally {
+                    rec.capturing = false;
+                }
+                // 截图期间又滚回了视口，或预览已经重建
+                if (rec.visible || !cardRecords.includes(rec)) return;
+            }
+            const thumb = thumbCache.get(rec.key);
+            rec.card.innerHTML = thumb ? `<img src="${thumb}" alt="" style="width: 100%; height: 100%; display: block;">` : '';
+            rec.mounted = false;
+        }
+
+        function observeCards() {
+            cardObserver = new IntersectionObserver(entries => {
+                entries.forEach(entry => {
+                    const rec = entry.target.__cardRecord;
+                    rec.visible = entry.isIntersecting;
+                    if (entry.isIntersecting) mountCard(rec); else unmountCard(rec);
+                });
+            }, { root: document.getElementById('scroll-container'), rootMargin: '100% 0px' });
+            cardRecords.forEach(rec => cardObserver.observe(rec.wrapper));
+        }
+
+        // 导出等操作临时挂载了全部卡片后，把视口外的重新卸载（不额外截图）
+        function revirtualize() {
+            if (!cardObserver) return;
+            cardRecords.forEach(rec => { if (!rec.visible) unmountCard(rec, false); });
+        }
+
+        function releaseStaleThumbs() {
+            const live = new Set(cardRecords.map(rec => rec.key));
+            for (const [key, url] of thumbCache) {
+                if (!live.has(key)) { URL.revokeObjectURL(url); thumbCache.delete(key); }
+            }
+        }
+
         // ==================== 自动字体缩放逻辑 ====================
-        function autoFitText() {
-            const cards = document.querySelectorAll('.card-wrapper.auto-fit-page');
-            cards.forEach(card => {
-                const markdownBody = card.querySelector('.markdown-body');
-                if (!markdownBody) return;
-                
-                // Keep shrinking until scrollHeight is <= clientHeight (with a 20px padding buffer)
-                let currentSize = parseFloat(window.getComputedStyle(markdownBody).fontSize);
-                const minSize = 10; // Don't go below 10px
-                
-                while(markdownBody.scrollHeight > markdownBody.clientHeight + 2 && currentSize > minSize) {
-                    currentSize -= 0.5;
-                    markdownBody.style.fontSize = currentSize + 'px';
+        function fitCard(card) {
+            const markdownBody = card.querySelector('.auto-fit-page .markdown-body');
+            if (!markdownBody) return;
+
+            // Keep shrinking until scrollHeight is <= clientHeight (with a 2px buffer)
+            let currentSize = parseFloat(window.getComputedStyle(markdownBody).fontSize);
+            const minSize = 10; // Don't go below 10px
+
+            while (markdownBody.scrollHeight > markdownBody.clientHeight + 2 && currentSize > minSize) {
+                currentSize -= 0.5;
+                markdownBody.style.fontSize = currentSize + 'px';
+            }
+        }
+
+        // ==================== 极速图片导出逻辑 ====================
+        const EXPORT_CONCURRENCY = 3; // 同时渲染的卡片数，过大反而会挤占主线程和内存
+        const EXPORT_FORMATS = {
+            jpeg: { mime: 'image/jpeg', ext: 'jpg', lossy: true },
+            webp: { mime: 'image/webp', ext: 'webp', lossy: true },
+            png: { mime: 'image/png', ext: 'png', lossy: false },
+        };
+        const MAX_QUALITY = 0.92;
+        const MIN_QUALITY = 0.4;
+        const QUALITY_SEARCH_STEPS = 6; // 二分 6 次，质量精度约 0.008
+
+        function getExportOptions() {
+            return {
+                format: EXPORT_FORMATS[document.getElementById('export-format').value],
+                maxBytes: (parseInt(document.getElementById('export-max-kb').value) || 0) * 1024,
+                pixelRatio: parseFloat(document.getElementById('export-pixel-ratio').value) || 2,
+            };
+        }
+
+        function canvasToBlob(canvas, mime, quality) {
+            return new Promise((resolve, reject) => {
+                canvas.toBlob(blob => blob ? resolve(blob) : reject(new Error('canvas.toBlob 返回为空')), mime, quality);
+            });
+        }
+
+        function extensionOf(blob) {
+            const format = Object.values(EXPORT_FORMATS).find(f => f.mime === blob.type);
+            return format ? format.ext : 'png';
+        }
+
+        // 在同一张已渲染好的 canvas 上二分搜索质量，找出不超过字节预算的最高质量
+        async function encodeWithinBudget(canvas, format, maxBytes) {
+            if (!format.lossy) return canvasToBlob(canvas, format.mime);
+            const first = await canvasToBlob(canvas, format.mime, MAX_QUALITY);
+            // 浏览器不支持该格式时 toBlob 会退回 PNG，此时改用 JPG
+            if (first.type !== format.mime) return encodeWithinBudget(canvas, EXPORT_FORMATS.jpeg, maxBytes);
+            if (!maxBytes || first.size <= maxBytes) return first;
+
+            let lo = MIN_QUALITY, hi = MAX_QUALITY, best = null;
+            for (let i = 0; i < QUALITY_SEARCH_STEPS; i++) {
+                const quality = (lo + hi) / 2;
+                const blob = await canvasToBlob(canvas, format.mime, quality);
+                if (blob.size <= maxBytes) { best = blob; lo = quality; } else { hi = quality; }
+            }
+            // 最低质量仍超出预算时，返回能做到的最小结果
+            return best || canvasToBlob(canvas, format.mime, MIN_QUALITY);
+        }
+
+        // ==================== 字体内嵌缓存 ====================
+        // 每个主题用到的字体族；导出时只内嵌这些字体
+        const THEME_FONTS = {
+            minimal: ['Inter', 'Noto Sans SC'],
+            serif: ['Noto Serif SC', 'Inter', 'Noto Sans SC'],
+            acid: ['Noto Sans SC', 'Inter'],
+            tech: ['Inter', 'Noto Sans SC'],
+        };
+        const fontEmbedCache = new Map(); // styleId -> Promise<fontEmbedCSS>
+        const fontDataCache = new Map(); // 字体 URL -> Promise<data URL>
+
+        // 本地字体文件只下载一次（浏览器也会按 URL 缓存），转成 data URL 供导出内嵌
+        function fetchFontDataURL(url) {
+            if (!fontDataCache.has(url)) {
+                fontDataCache.set(url, fetch(url)
+                    .then(response => {
+                        if (!response.ok) throw new Error(`${response.status} ${url}`);
+                        return response.blob();
+                    })
+                    .then(blob => new Promise((resolve, reject) => {
+                        const reader = new FileReader();
+                        reader.onload = () => resolve(reader.result);
+                        reader.onerror = () => reject(reader.error);
+                        reader.readAsDataURL(blob);
+                    })));
+            }
+            return fontDataCache.get(url);
+        }
+
+        // #local-font-faces 里的一条 @font-face（按 URL 引用）-> 内嵌 data URL 的 @font-face；失败返回空串
+        async function embedFontFaceRule(rule) {
+            const match = rule.style.getPropertyValue('src').match(/url\(["']?([^"')]+)["']?\)/);
+            if (!match) return rule.cssText;
+            try {
+                const dataURL = await fetchFontDataURL(new URL(match[1], document.baseURI).href);
+                return rule.cssText.split(match[1]).join(dataURL);
+            } catch (error) {
+                console.warn('本地字体读取失败，导出将使用系统字体:', error);
+                return '';
+            }
+        }
+
+        // 每个会话、每个主题只准备一次 fontEmbedCSS，之后所有卡片导出共用，html-to-image 不再逐张抓取字体。
+        // 优先使用 Streamlit 注入的本地字体（#local-font-faces，引用 static/fonts/ 下的文件）；没有本地字体或
+        // 单独打开编辑器时退回由 html-to-image 解析页面上的 Web 字体，同样只解析一次。
+        function getFontEmbedCSS(styleId, sampleNode) {
+            if (!fontEmbedCache.has(styleId)) {
+                const families = THEME_FONTS[styleId] || [];
+                const localSheet = document.getElementById('local-font-faces');
+                let promise;
+                if (localSheet && localSheet.sheet && localSheet.sheet.cssRules.length) {
+                    const rules = Array.from(localSheet.sheet.cssRules)
+                        .filter(rule => rule instanceof CSSFontFaceRule)
+                        .filter(rule => families.includes(rule.style.getPropertyValue('font-family').replace(/['"]/g, '').trim()));
+                    promise = Promise.all(rules.map(embedFontFaceRule)).then(parts => parts.filter(Boolean).join('\n'));
+                } else {
+                    promise = htmlToImage.getFontEmbedCSS(sampleNode).catch(error => {
+                        console.warn('字体内嵌失败，导出将使用系统字体:', error);
+                        return '';
+                    });
                 }
+                fontEmbedCache.set(styleId, promise);
+            }
+            return fontEmbedCache.get(styleId);
+        }
+
+        // 单张卡片 -> 图片 Blob：toCanvas 只渲染一次，编码阶段不经过 base64 字符串
+        async function renderCardBlob(element, options = getExportOptions()) {
+            const canvas = await htmlToImage.toCanvas(element, {
+                pixelRatio: options.pixelRatio,
+                backgroundColor: '#ffffff',
+                fontEmbedCSS: await getFontEmbedCSS(state.styleId, element)
             });
+            try {
+                return await encodeWithinBudget(canvas, options.format, options.maxBytes);
+            } finally {
+                // 尽早释放位图内存
+                canvas.width = 0; canvas.height = 0;
+            }
+        }
+
+        // 有界并发执行：最多 limit 个任务同时进行，每完成一个回调一次 onProgress
+        async function runWithConcurrency(tasks, limit, onProgress) {
+            const results = new Array(tasks.length);
+            let next = 0, done = 0;
+            const worker = async () => {
+                while (next < tasks.length) {
+                    const i = next++;
+                    results[i] = await tasks[i]();
+                    done++;
+                    if (onProgress) onProgress(done, tasks.length);
+                }
+            };
+            await Promise.all(Array.from({ length: Math.min(limit, tasks.length) }, worker));
+            return results;
         }
 
-        // ==================== 极速 JPG 导出逻辑 ====================
         async function saveSingleCard(element, filename, btn) {
             const originalIcon = btn.innerHTML;
             btn.innerHTML = '<i data-lucide="loader-2" class="animate-spin" size="16"></i>';
             btn.classList.add('bg-blue-600', 'opacity-100'); btn.classList.remove('bg-black/60', 'group-hover:opacity-100');
 
             try {
-                const dataUrl = await htmlToImage.toJpeg(element, {
-                    quality: 0.92,
-                    pixelRatio: 2,
-                    backgroundColor: '#ffffff',
-                    skipFonts: true
-                });
-                saveAs(dataUrl, filename);
+                const blob = await renderCardBlob(element);
+                saveAs(blob, filename.replace(/\.jpg$/, '.' + extensionOf(blob)));
             } catch (error) {
                 console.error('保存失败:', error);
                 alert('保存出错');
@@ -975,30 +1465,32 @@
         async function downloadAll() {
             const btn = document.querySelector('button[onclick="downloadAll()"]');
             const originalText = btn.innerHTML;
-            btn.innerHTML = `<i data-lucide="loader-2" class="animate-spin" size="14"></i> 导出中...`;
+            const setProgress = (label) => { btn.innerHTML = `<i data-lucide="loader-2" class="animate-spin" size="14"></i> ${label}`; lucide.createIcons(); };
+            setProgress('导出中...');
 
             try {
                 const zip = new JSZip();
-                const cards = document.querySelectorAll('.card-wrapper');
-
-                for (let i = 0; i < cards.length; i++) {
-                    const dataUrl = await htmlToImage.toJpeg(cards[i], {
-                        quality: 0.92,
-                        pixelRatio: 2,
-                        backgroundColor: '#ffffff',
-                        skipFonts: true
-                    });
-                    const imgData = dataUrl.split(',')[1];
-                    zip.file(`rednote_page_${i + 1}.jpg`, imgData, { base64: true });
-                }
+                const records = cardRecords.slice();
+                const options = getExportOptions();
+
+                // 虚拟化时视口外的卡片未挂载，渲染前逐张挂载
+                const tasks = records.map(rec => () => { mountCard(rec, false); return renderCardBlob(rec.card, options); });
+                const blobs = await runWithConcurrency(tasks, EXPORT_CONCURRENCY, (done, total) => setProgress(`渲染 ${done}/${total}`));
+
+                // 图片本身已是压缩格式，用 STORE 直接存入二进制 Blob，避免重复压缩；按页序写入保证文件顺序
+                blobs.forEach((blob, i) => zip.file(`rednote_page_${i + 1}.${extensionOf(blob)}`, blob, { binary: true, compression: 'STORE' }));
 
-                const content = await zip.generateAsync({ type: "blob" });
-                saveAs(content, "RedNote_Images_JPG.zip");
+                const content = await zip.generateAsync(
+                    { type: "blob", streamFiles: true },
+                    meta => setProgress(`打包 ${Math.round(meta.percent)}%`)
+                );
+                saveAs(content, `RedNote_Images_${extensionOf(blobs[0]).toUpperCase()}.zip`);
 
             } catch (error) {
                 console.error('导出失败:', error);
                 alert('导出出错');
             } finally {
+                revirtualize();
                 btn.innerHTML = originalText;
                 lucide.createIcons();
             }
@@ -1019,7 +1511,7 @@
 
                 return `
                 <div class="card-bg p-0 flex flex-col h-full overflow-hidden" style="padding: 0; background-color: ${s.bg};">
-                    <div class="h-[55%] w-full relative overflow-hidden bg-gray-100"><img src="${state.coverImage}" class="w-full h-full object-cover"></div>
+                    <div class="h-[55%] w-full relative overflow-hidden bg-gray-100"><img src="${imageStore.url(state.coverImage)}" class="w-full h-full object-cover"></div>
                     <div class="h-[45%] w-full p-8 flex flex-col justify-center text-left">
                         <div class="flex items-center gap-2 mb-4 text-xs font-bold opacity-70" style="color: ${s.text};"><i data-lucide="user" size="14"></i><span>${tag}</span></div>
                         <h1 class="leading-[1.1] mb-5 font-bold" style="font-size: ${state.titleSize}px; margin-left:0; margin-right:0; text-align: left; text-shadow: none; border: none; padding: 0; font-family: ${s.fontTitle}; ${titleStyle}">${title}</h1>
@@ -1,14 +1,33 @@
 import os
-import json
-import hashlib
+import io
+import re
+import math
 import time
+import zipfile
 import logging
 import urllib.parse
 import streamlit as st
 import streamlit.components.v1 as components
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from openai import OpenAI, RateLimitError, AuthenticationError
+
+from generation import (
+    CACHE_FILE, HISTORY_FILE, MAX_EXAMPLE_POSTS,
+    cache_size, load_history, analyze_and_generate_prompt, get_coalesced_calls, get_format_stats,
+    get_compression_stats, get_usage_stats, get_continuation_stats,
+)
+from format_check import split_pages
+from jobs import JobQueue, MAX_VARIANTS, MAX_WORKERS, PENDING_STATES, DONE, QUEUED, RUNNING
+from post_ingest import ingest_upload
+from corpus import CorpusStore
+from example_compress import COMPRESS_EXAMPLES
+from quotas import SERVER_MODE, USER_DAILY_TOKENS, user_identity, usage_ledger
+from profiling import (
+    PROFILE_AGGREGATE, hotspots, is_enabled, profiled, recent_profiles, set_enabled, start_profiling, stop_profiling,
+)
+
+logger = logging.getLogger(__name__)
+_rerun_started = time.perf_counter()
+start_profiling()
 
 # ==========================================
 # 页面配置
@@ -107,198 +126,82 @@ st.markdown("""
 # 全局配置
 # ==========================================
 base_dir = os.path.dirname(os.path.abspath(__file__))
-CACHE_FILE = os.path.join(base_dir, "api_cache.json")
-HISTORY_FILE = os.path.join(base_dir, "history.json")
-MAX_EXAMPLE_POSTS = 5
+JOB_POLL_SECONDS = 2  # 后台任务进行中时，结果区每 2 秒刷新一次
+RESULTS_PAGE_SIZE = 10  # 结果区每页列出 10 个变体，只渲染选中的那一个
+PROFILE_KINDS = {"": "全部", "rerun": "整页重跑", "fragment": "面板局部重跑", "job": "后台生成任务"}
 
 # ==========================================
-# 缓存模块
+# 后台任务队列与案例库（整个进程共用，重跑脚本不会丢失）
 # ==========================================
-def load_cache() -> dict:
-    if os.path.exists(CACHE_FILE):
-        try:
-            with open(CACHE_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError):
-            return {}
-    return {}
-
-def save_cache(cache_data: dict):
-    with open(CACHE_FILE, 'w', encoding='utf-8') as f:
-        json.dump(cache_data, f, ensure_ascii=False, indent=4)
-
-def get_hash(text: str) -> str:
-    return hashlib.md5(text.encode('utf-8')).hexdigest()
+@st.cache_resource(show_spinner=False)
+def get_job_queue() -> JobQueue:
+    return JobQueue()
 
-# ==========================================
-# 历史记录模块
-# ==========================================
-def load_history() -> list:
-    if os.path.exists(HISTORY_FILE):
-        try:
-            with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError):
-            return []
-    return []
-
-def save_history(history_data: list):
-    with open(HISTORY_FILE, 'w', encoding='utf-8') as f:
-        json.dump(history_data, f, ensure_ascii=False, indent=4)
-
-def add_to_history(topic: str, text: str):
-    history_data = load_history()
-    item = {
-        "id": datetime.now().strftime("%Y%m%d_%H%M%S_%f"),
-        "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "topic": topic,
-        "text": text
-    }
-    history_data.insert(0, item) # 最新记录插到最前
-    history_data = history_data[:50] # 仅保留最近的50条
-    save_history(history_data)
+job_queue = get_job_queue()
 
-# ==========================================
-# Prompt 构建
-# ==========================================
-def analyze_and_generate_prompt(viral_posts: list, target_topic: str, max_tokens_output: int):
-    posts = viral_posts[:MAX_EXAMPLE_POSTS]
-    texts = [p["text"] if isinstance(p, dict) else p for p in posts]
-    avg_length = sum(len(t) for t in texts) // len(texts) if texts else 300
-    examples_text = "\n\n".join(f"【案例 {i+1}】:\n{t}" for i, t in enumerate(texts))
-
-    system_instruction = "你是一个顶级的爆款内容创作者和 NLP 文本分析专家。你擅长从爆款案例中提炼风格 DNA，然后用这套风格创作出情节全新、细节丰富、独立成篇的内容。你的创作原则：风格高度还原，情节绝对原创。"
-    user_instruction_template = f"""请仔细阅读以下爆款案例，深度分析它们的风格特征：
-
-{{examples_text}}
-
----
-
-【你的任务】基于上述案例的**风格 DNA**，为我创作一篇关于「{{target_topic}}」的全新帖子。
-
-**字数要求**：{{avg_length}} 字左右（±20%）
-
-**风格要求（必须严格遵守）**：
-- 复刻语气：情绪浓度、口语化程度、感叹/疑问句比例
-- 复刻结构：开头钩子、中间展开方式、结尾行动引导
-- 复刻排版：短句断行、分段节奏、Emoji 使用密度和位置
-- 复刻引导词：类似的转折词、递进词、呼吁性词汇
-
-**内容要求（同样必须严格遵守）**：
-- ❌ 禁止复制或改写原案例中的任何具体情节、场景、产品、人物
-- ✅ 必须构建与原案例**完全不同**的具体故事场景
-- ✅ 细节要丰富：有具体时间、地点、感受、对比、转折，不能泛泛而谈
-- ✅ 情绪要真实：有真实的痛点铺垫，有真实的惊喜/收获，不能只讲结论
-- ✅ 每次生成的内容必须是独特的，即使主题相同
-
-**输出格式**：
-1. **直接输出正文，禁止输出“风格特征摘要”等前置分析内容**
-2. **正文必须使用 Markdown 格式**，并且：
-   - 使用 `@---` 来强制分页（每页内容不要太多）
-   - 适当使用 `**加粗**` 突出核心词元或金句
-   - 合理使用一级标题 `#` 和二级标题 `##` 划分结构
-"""
-    
-    # Try reading from external template file
-    try:
-        template_path = os.path.join(base_dir, "prompt_template.md")
-        with open(template_path, "r", encoding="utf-8") as f:
-            template_content = f.read()
-            # Basic parsing of the markdown sections
-            sys_parts = template_content.split("## 系统提示词 (System Prompt)")
-            if len(sys_parts) > 1:
-                user_parts = sys_parts[1].split("## 用户提示词 (User Prompt)")
-                if len(user_parts) > 1:
-                    system_instruction = user_parts[0].strip()
-                    user_instruction_template = user_parts[1].strip()
-    except Exception as e:
-        st.warning("未找到 prompt_template.md 或是解析失败，使用内置默认 Prompt。")
+@st.cache_resource(show_spinner=False)
+def get_corpus() -> CorpusStore:
+    return CorpusStore()
 
-    user_instruction = user_instruction_template.format(
-        examples_text=examples_text,
-        target_topic=target_topic,
-        avg_length=avg_length
-    )
-    return system_instruction, user_instruction
+corpus = get_corpus()
 
 # ==========================================
-# API 调用（含重试 + 缓存 + 成本控制）
+# 本地字体（编辑器预览与导出共用）
 # ==========================================
-def generate_content(system_prompt: str, user_prompt: str, api_key: str,
-                     model: str, max_tokens: int, temperature: float = 0.9,
-                     retries: int = 3, variant_id: int = 0):
-    """返回 (text, is_from_cache, error_msg)。variant_id 用于区分同一 prompt 的多次并发调用的缓存 key"""
-    # variant_id 保证每个并发变体有独立的缓存 key，不会互相命中
-    prompt_hash = get_hash(system_prompt + user_prompt + model + str(variant_id))
-    cache = load_cache()
-
-    if prompt_hash in cache:
-        return cache[prompt_hash], True, None
-
-    if not api_key:
-        return None, False, "请先在左侧侧边栏填入 DeepSeek API Key！"
-
-    client = OpenAI(
-        api_key=api_key,
-        base_url="https://api.deepseek.com",
-    )
+# 字体放在 static/fonts/，由 Streamlit 静态文件服务提供（.streamlit/config.toml 里的 server.enableStaticServing）。
+# 编辑器里只注入引用这些文件的 @font-face，字体本身由浏览器按 URL 下载并缓存，不随每次重跑重新发送。
+FONT_DIR = os.path.join(base_dir, "static", "fonts")
+FONT_FAMILIES = {"Inter": "Inter", "NotoSansSC": "Noto Sans SC", "NotoSerifSC": "Noto Serif SC"}
+FONT_WEIGHTS = {"Light": 300, "Regular": 400, "Medium": 500, "SemiBold": 600, "Bold": 700, "ExtraBold": 800, "Black": 900}
+FONT_FORMATS = {".woff2": "woff2", ".woff": "woff", ".otf": "opentype", ".ttf": "truetype"}
+
+@st.cache_resource(show_spinner=False)
+def build_font_face_css() -> str:
+    """为 static/fonts/ 下的字体（如 NotoSansSC-Bold.woff2）生成按 URL 引用的 @font-face，每个进程只做一次。
+
+    编辑器导出时按这些规则取一次字体、转成 fontEmbedCSS 交给 html-to-image，不再逐张抓取字体。
+    仓库不附带字体文件；没有放字体时返回空串，编辑器退回 Google Fonts（导出时要联网取字体）。
+    建议放子集化的 woff2，体积小很多。
+    """
+    if not st.get_option("server.enableStaticServing"):
+        logger.warning("未开启 server.enableStaticServing，编辑器不使用本地字体，导出时从 Google Fonts 取字体")
+        return ""
+    names = sorted(os.listdir(FONT_DIR)) if os.path.isdir(FONT_DIR) else []
+    url_prefix = "/".join(part for part in ("", st.get_option("server.baseUrlPath").strip("/"), "app/static/fonts") if part)
+    rules = []
+    for name in names:
+        stem, ext = os.path.splitext(name)
+        match = re.match(r"^(\w+?)-(\w+)$", stem)
+        if ext.lower() not in FONT_FORMATS or not match or match.group(1) not in FONT_FAMILIES:
+            continue
+        fmt = FONT_FORMATS[ext.lower()]
+        rules.append(
+            f"@font-face {{ font-family: '{FONT_FAMILIES[match.group(1)]}'; "
+            f"font-weight: {FONT_WEIGHTS.get(match.group(2), 400)}; font-style: normal; font-display: block; "
+            f"src: url('/{url_prefix}/{urllib.parse.quote(name)}') format('{fmt}'); }}"
+        )
+    if not rules:
+        logger.warning("%s 下没有可用的字体文件，编辑器导出时从 Google Fonts 取字体", FONT_DIR)
+    return "\n".join(rules)
 
-    for attempt in range(retries):
-        try:
-            response = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt},
-                ],
-                max_tokens=max_tokens,
-                temperature=temperature,
-            )
-            text = response.choices[0].message.content
-            cache[prompt_hash] = text
-            save_cache(cache)
-            return text, False, None
-
-        except AuthenticationError:
-            return None, False, "❌ API Key 无效，请检查后重试。"
-        except RateLimitError:
-            wait = 2 ** attempt * 5
-            st.warning(f"触发限速，{wait} 秒后重试... ({attempt+1}/{retries})")
-            time.sleep(wait)
-        except Exception as e:
-            if attempt < retries - 1:
-                time.sleep(3)
-            else:
-                return None, False, f"❌ API 调用失败：{e}"
-
-    return None, False, "已达到最大重试次数，请稍后再试。"
-
-def format_content(text: str, api_key: str, max_tokens: int, retries: int = 3, variant_id: int = 0):
-    system_prompt = "你是一个专业的小红书爆款排版专家。你的唯一任务是严格依据指令为提供的文案增加 Emoji 表情和换行符，【绝对禁止】改写或删减原有的任何文字内容。"
-    user_prompt = f"""请为以下文案进行排版加工作业（fast 模式排版），必须严格遵守以下 3 条指令：
-
-1. 【自然插入表情】：每个由 `@---` 分隔的画布中，必须包含 3 到 5 个符合语境的 Emoji。**🚫绝对禁止**像列表一样机械地在每一行末尾都加表情！表情应该自然地跟在核心词汇后面（如：科技感✨），或者穿插在句首/句中，做到错落有致、有呼吸感。
-2. 【软换行与留白】：
-   - 在**每一行文字的末尾**（除了完全空白的行和只有 `@---` 的行），强制添加**两个空格**再回车，触发软换行。
-   - 保留原句之间的空行（空行可以营造呼吸感）。如果连续几行文字太密集，允许你在大逻辑转折的地方插入一个空行。
-3. 【保持原意】：绝对禁止对原文进行删减、概括或改写！请原封不动地返回原文的所有词句。不要输出任何解释性文字。
-
-【需要排版的原始文案如下】：
-{text}
-"""
-    # 强制使用 deepseek-chat 进行格式化（速度快），降低温度确保稳定输出
-    # 强制限制为 8192，因为 deepseek-chat api 要求的最大 tokens 是 8192
-    format_max_tokens = min(max_tokens, 8192)
-    return generate_content(
-        system_prompt=system_prompt,
-        user_prompt=user_prompt,
-        api_key=api_key,
-        model="deepseek-chat",
-        max_tokens=format_max_tokens,
-        temperature=0.1,
-        retries=retries,
-        variant_id=variant_id + 1000  # 偏移variant_id，防止和第一步的缓存互相碰撞
-    )
+# ==========================================
+# 局部重跑的耗时显示
+# ==========================================
+# 各面板都是 st.fragment：在面板里操作只重跑这一块，其余部分（以及全量缓存、历史）不再重新计算
+def show_panel_timing(label: str, started: float):
+    st.caption(f"⏱️ {label}重跑耗时 {(time.perf_counter() - started) * 1000:.0f} ms")
+
+def remove_file(path: str, notice_key: str):
+    """按钮回调：在面板重跑之前执行，面板随后直接显示清除后的状态，不需要再手动重跑。"""
+    if os.path.exists(path):
+        os.remove(path)
+    st.session_state[notice_key] = True
+
+@st.cache_data(show_spinner=False, max_entries=1)
+def load_editor_template(mtime: float) -> str:
+    """编辑器 HTML 有几百 KB，按修改时间缓存，只有文件变了才重新读取。"""
+    with open(os.path.join(base_dir, "文案到图片生成.py"), "r", encoding="utf-8") as f:
+        return f.read()
 
 # ==========================================
 # 侧边栏配置
@@ -309,13 +212,25 @@ with st.sidebar:
 
     # API Key（优先读环境变量）
     env_key = os.environ.get("DEEPSEEK_API_KEY", "")
-    api_key_input = st.text_input(
-        "🔑 DeepSeek API Key",
-        value=env_key,
-        type="password",
-        help="也可以设置环境变量 DEEPSEEK_API_KEY，自动填入",
-        placeholder="sk-..."
-    )
+    if SERVER_MODE:
+        # 服务模式：团队共用的 Key 只留在服务端，不回填到每个人的浏览器里
+        user_name_input = st.text_input("👤 使用者", placeholder="填写你的名字，用于配额和任务排队")
+        api_key_input = st.text_input(
+            "🔑 DeepSeek API Key",
+            type="password",
+            help="留空则使用团队共用的 Key",
+            placeholder="sk-..."
+        ) or env_key
+    else:
+        user_name_input = ""
+        api_key_input = st.text_input(
+            "🔑 DeepSeek API Key",
+            value=env_key,
+            type="password",
+            help="也可以设置环境变量 DEEPSEEK_API_KEY，自动填入",
+            placeholder="sk-..."
+        )
+    current_user = user_identity(user_name_input, api_key_input)
 
     st.markdown("---")
     st.markdown("### 🎛️ 生成参数")
@@ -352,43 +267,103 @@ with st.sidebar:
     num_variants = st.slider(
         "同时生成变体数",
         min_value=1,
-        max_value=5,
+        max_value=MAX_VARIANTS,
         value=1,
         step=1,
-        help="同时发起 N 个 API 请求，生成风格相同但情节不同的 N 篇文案"
+        help=f"生成风格相同但情节不同的 N 篇文案，适合 A/B 测试；任务在后台排队，同时最多 {MAX_WORKERS} 个请求"
+    )
+    combined_variants = st.toggle(
+        "🧩 一次请求生成全部变体",
+        value=False,
+        disabled=num_variants == 1,
+        help="每 5 篇初稿合成一个请求，案例和提示词只发送一次（输入 Token 约为原来的 1/5）；解析失败的变体会自动改为单独请求"
+    )
+    compress_examples = st.toggle(
+        "🗜️ 压缩案例",
+        value=COMPRESS_EXAMPLES,
+        help="发送前去掉案例里重复的 Emoji / 标点、装饰分隔线、多余空白和重复话题标签，超长案例只保留开头、中段样本和结尾"
     )
 
-    st.markdown("---")
-    st.markdown("### 📦 缓存状态")
-    cache_data = load_cache()
-    st.metric("已缓存条数", len(cache_data))
-    if st.button("🗑️ 清除缓存", help="删除所有缓存记录"):
-        if os.path.exists(CACHE_FILE):
-            os.remove(CACHE_FILE)
-        st.success("缓存已清除！")
-        st.rerun()
-
-    st.markdown("---")
-    st.markdown("### 📂 生成历史记录")
-    history_data = load_history()
-    if history_data:
-        with st.expander(f"查看近期 {len(history_data)} 条记录", expanded=False):
-            for i, item in enumerate(history_data):
-                st.markdown(f"**{item['time']}**")
-                st.caption(f"主题: {item['topic'][:15]}...")
-                if st.button("恢复到画布", key=f"hist_{item['id']}", use_container_width=True):
-                    st.session_state.editor_content = item['text']
-                    st.session_state.editor_title = item['topic']
-                    st.session_state.show_editor = True
-                    st.rerun()
-                st.divider()
-        if st.button("🗑️ 清除历史记录", key="clear_hist", use_container_width=True):
-            if os.path.exists(HISTORY_FILE):
-                os.remove(HISTORY_FILE)
+    @st.fragment
+    @profiled("fragment-status")
+    def status_panel():
+        """任务数与缓存统计：清除缓存只重跑这一块。"""
+        started = time.perf_counter()
+        my_jobs = job_queue.counts(current_user)
+        st.caption(f"后台任务：运行中 {my_jobs[RUNNING]}，排队中 {my_jobs[QUEUED]}")
+        if SERVER_MODE and USER_DAILY_TOKENS:
+            used_tokens = usage_ledger.used_today(current_user)
+            st.progress(min(used_tokens / USER_DAILY_TOKENS, 1.0), text=f"今日 Token：{used_tokens} / {USER_DAILY_TOKENS}")
+
+        st.markdown("---")
+        st.markdown("### 📦 缓存状态")
+        col_cache, col_coalesced = st.columns(2)
+        col_cache.metric("已缓存条数", cache_size())
+        col_coalesced.metric("合并的重复请求", get_coalesced_calls(), help="相同请求还在进行时再次提交（如双击、多人同时生成同一内容），会直接复用进行中的结果，不再重复计费")
+        format_stats = get_format_stats()
+        st.caption(f"✂️ 初稿已符合排版规则、省掉的排版调用：{format_stats['calls_avoided']} 次（另有 {format_stats['pages_skipped']} 页合格未送排版）")
+        if format_stats['pages_repaired'] or format_stats['pages_reverted']:
+            st.caption(f"🔍 排版改动了原文：{format_stats['pages_repaired']} 页已单独重排，{format_stats['pages_reverted']} 页退回原文")
+        continuation_stats = get_continuation_stats()
+        if continuation_stats['truncated']:
+            st.caption(f"✍️ 输出被截断 {continuation_stats['truncated']} 次，已自动续写 {continuation_stats['continuations']} 次"
+                       f"（{continuation_stats['completed']} 次写完，{continuation_stats['gave_up']} 次超出续写预算）")
+        compression_stats = get_compression_stats()
+        if compression_stats['requests']:
+            saved = compression_stats['tokens_before'] - compression_stats['tokens_after']
+            st.caption(f"🗜️ 案例压缩：{compression_stats['requests']} 次请求共省约 {saved} Token（{saved / max(compression_stats['tokens_before'], 1):.0%}）")
+        usage_stats = get_usage_stats()
+        cache_hit, cache_miss = usage_stats['prompt_cache_hit_tokens'], usage_stats['prompt_cache_miss_tokens']
+        if cache_hit or cache_miss:
+            st.caption(f"💾 DeepSeek 前缀缓存：输入 {cache_hit + cache_miss} Token 中命中 {cache_hit}（{cache_hit / (cache_hit + cache_miss):.0%}，按缓存价计费）",
+                       help="系统提示词和案例排在 Prompt 最前面，用同一批案例换主题或多生成几篇时，这部分会命中缓存")
+        # 服务模式下缓存和历史是全组共用的，不提供一键清除
+        if not SERVER_MODE:
+            st.button("🗑️ 清除缓存", help="删除所有缓存记录", on_click=remove_file, args=(CACHE_FILE, "cache_cleared"))
+        if st.session_state.pop("cache_cleared", False):
+            st.success("缓存已清除！")
+        show_panel_timing("缓存面板", started)
+
+    @st.fragment
+    @profiled("fragment-history")
+    def history_panel():
+        """历史记录：清除只重跑这一块；恢复到画布要打开页面底部的编辑器，整页重跑。"""
+        started = time.perf_counter()
+        st.markdown("---")
+        st.markdown("### 📂 生成历史记录")
+        history_data = load_history()
+        if history_data:
+            with st.expander(f"查看近期 {len(history_data)} 条记录", expanded=False):
+                for i, item in enumerate(history_data):
+                    st.markdown(f"**{item['time']}**")
+                    st.caption(f"主题: {item['topic'][:15]}...")
+                    if st.button("恢复到画布", key=f"hist_{item['id']}", use_container_width=True):
+                        st.session_state.editor_content = item['text']
+                        st.session_state.editor_title = item['topic']
+                        st.session_state.show_editor = True
+                        st.rerun()
+                    st.divider()
+            if not SERVER_MODE:
+                st.button("🗑️ 清除历史记录", key="clear_hist", use_container_width=True,
+                          on_click=remove_file, args=(HISTORY_FILE, "history_cleared"))
+        else:
+            st.info("暂无历史记录，开始生成后将自动保存近期文案。")
+        if st.session_state.pop("history_cleared", False):
             st.success("历史记录已清除！")
-            st.rerun()
-    else:
-        st.info("暂无历史记录，开始生成后将自动保存近期文案。")
+        show_panel_timing("历史面板", started)
+
+    status_panel()
+    history_panel()
+
+    if not SERVER_MODE:
+        st.markdown("---")
+        st.toggle(
+            "🩺 性能分析",
+            value=is_enabled(),
+            key="profiling_toggle",
+            on_change=lambda: set_enabled(st.session_state.profiling_toggle),
+            help="记录每次重跑和每个后台任务的耗时分布（cProfile），写入 profiles/ 目录，页面底部显示热点函数；也可以设置环境变量 XHS_PROFILE=1"
+        )
 
 # ==========================================
 # 主界面
@@ -402,13 +377,21 @@ st.markdown("---")
 
 col_left, col_right = st.columns([1, 1], gap="large")
 
-with col_left:
+# 当前批次号同时记在地址栏，刷新页面后也能找回后台任务的结果
+if "batch_id" not in st.session_state:
+    st.session_state.batch_id = st.query_params.get("batch")
+
+@st.fragment
+@profiled("fragment-input")
+def input_panel():
+    """输入区：切换输入方式、筛选案例库只重跑这一块；提交任务后整页重跑，让结果区开始轮询。"""
+    started = time.perf_counter()
     st.markdown("### 📥 输入区")
 
     # 输入方式选择
     input_mode = st.radio(
         "输入方式",
-        ["✏️ 手动输入帖子", "📂 上传 JSON 文件"],
+        ["✏️ 手动输入帖子", "📂 上传 JSON 文件", "📚 从案例库选择"],
         horizontal=True,
         label_visibility="collapsed"
     )
@@ -428,23 +411,59 @@ with col_left:
             blocks = [b.strip() for b in raw_posts_text.split("\n\n") if b.strip()]
             viral_posts = blocks
 
-    else:
+    elif input_mode == "📂 上传 JSON 文件":
         uploaded = st.file_uploader("上传 JSON 文件", type=["json"])
         if uploaded:
-            try:
-                data = json.load(uploaded)
-                # 支持 {"posts": [...]} 或直接 [...] 两种格式
-                if isinstance(data, list):
-                    viral_posts = data
-                elif isinstance(data, dict) and "posts" in data:
-                    viral_posts = data["posts"]
-                else:
-                    st.error("JSON 格式不支持，需要 `{\"posts\": [...]}` 或 `[...]`")
-            except Exception as e:
-                st.error(f"JSON 解析失败: {e}")
+            # 同一个上传文件在重跑之间只解析一次；换了会话但内容相同时走磁盘缓存
+            memo = st.session_state.get("ingest_memo")
+            if memo and memo[0] == uploaded.file_id:
+                ingest = memo[1]
+            else:
+                try:
+                    # 支持 {"posts": [...]} 或直接 [...] 两种格式，流式解析并去重
+                    with st.spinner("正在解析并去重..."):
+                        ingest = ingest_upload(uploaded)
+                    st.session_state.ingest_memo = (uploaded.file_id, ingest)
+                except Exception as e:
+                    ingest = None
+                    st.error(f"JSON 解析失败: {e}")
+            if ingest:
+                viral_posts = ingest["posts"]
+                if ingest["duplicates"] or ingest["empty"]:
+                    st.caption(f"共读取 {ingest['total']} 条，去掉重复 / 近似重复 {ingest['duplicates']} 条、空帖子 {ingest['empty']} 条")
+                if not viral_posts:
+                    st.error("文件里没有读到有效的帖子")
+
+    else:
+        col_query, col_platform = st.columns([2, 1])
+        library_query = col_query.text_input("关键词", placeholder="例如：凌晨三点（3 个字以上走全文索引）")
+        library_platform = col_platform.selectbox("平台", ["全部"] + corpus.platforms())
+        library_tags = st.multiselect("标签", corpus.tags())
+        found = corpus.search(library_query, library_tags, "" if library_platform == "全部" else library_platform, limit=50)
+        if found:
+            options = {p["id"]: p for p in found}
+            picked = st.multiselect(
+                f"选择案例（找到 {len(found)} 条）",
+                list(options),
+                default=list(options)[:MAX_EXAMPLE_POSTS],
+                max_selections=MAX_EXAMPLE_POSTS,
+                format_func=lambda i: f"#{i} · {options[i]['char_count']} 字 · {options[i]['text'][:24]}",
+            )
+            # 直接用库里的记录（自带字数等特征），组装 Prompt 时不再重新统计
+            viral_posts = [options[i] for i in picked]
+        else:
+            st.info("案例库里没有符合条件的帖子。可以手动输入或上传 JSON 后「存入案例库」，或用 `python corpus.py import` 批量导入。")
 
     if viral_posts:
         st.success(f"✅ 已加载 {len(viral_posts)} 条帖子（最多使用前 {MAX_EXAMPLE_POSTS} 条）")
+        if input_mode != "📚 从案例库选择":
+            with st.expander("📚 存入案例库"):
+                col_save_platform, col_save_tags = st.columns(2)
+                save_platform = col_save_platform.text_input("平台", placeholder="小红书")
+                save_tags = col_save_tags.text_input("标签", placeholder="职场, AI（逗号分隔）")
+                if st.button("保存这些帖子", use_container_width=True):
+                    added, skipped = corpus.add_posts(viral_posts, save_platform, save_tags)
+                    st.success(f"新增 {added} 条，已存在 {skipped} 条")
 
     st.markdown("**目标主题**")
     topic_input = st.text_input(
@@ -453,133 +472,219 @@ with col_left:
         label_visibility="collapsed"
     )
 
-    generate_btn = st.button("🚀 开始生成", use_container_width=True)
-
-with col_right:
-    st.markdown("### 📤 生成结果")
-
-    # 用 session_state 保留上次结果
-    if "last_result" not in st.session_state:
-        st.session_state.last_result = None
-        st.session_state.last_is_cached = False
-
-    if "results" not in st.session_state:
-        st.session_state.results = []  # list of (text, is_cached)
-
-    if generate_btn:
+    if st.button("🚀 开始生成", use_container_width=True):
         if not viral_posts:
             st.error("请先输入至少 1 条爆款帖子！")
         elif not topic_input.strip():
             st.error("请填写目标主题！")
+        elif SERVER_MODE and not user_name_input.strip():
+            st.error("请先在左侧侧边栏填写使用者名称！")
         else:
-            sys_p, usr_p = analyze_and_generate_prompt(viral_posts, topic_input, max_tokens_slider)
-            n = int(num_variants)
-
-            placeholder = st.empty()
-            with placeholder:
-                st.info(f"🚀 正在并发生成 {n} 篇文案，请稍候...")
-
-            def _call(vid):
-                # 第一步：原样生成文案初稿
-                base_text, is_cached1, err1 = generate_content(
-                    system_prompt=sys_p,
-                    user_prompt=usr_p,
-                    api_key=api_key_input,
-                    model=model_choice,
-                    max_tokens=max_tokens_slider,
-                    temperature=temperature_slider,
-                    retries=int(retries_input),
-                    variant_id=vid,
-                )
-                if err1:
-                    return vid, (None, False, err1)
-                
-                # 第二步：使用 fast 模式补充排版（表情+软换行）
-                final_text, is_cached2, err2 = format_content(
-                    text=base_text,
-                    api_key=api_key_input,
-                    max_tokens=max_tokens_slider,
-                    retries=int(retries_input),
-                    variant_id=vid,
-                )
-                if err2:
-                    return vid, (None, False, f"第一步生成成功，但第二步排版时发生错误：{err2}")
-                
-                # 综合缓存状态
-                is_cached = is_cached1 and is_cached2
-                return vid, (final_text, is_cached, None)
-
-            results_raw = [None] * n
-            with ThreadPoolExecutor(max_workers=n) as executor:
-                futures = {executor.submit(_call, i): i for i in range(n)}
-                for future in as_completed(futures):
-                    vid, (text, is_cached, err) = future.result()
-                    if err:
-                        st.error(f"变体 {vid+1} 失败：{err}")
-                        results_raw[vid] = None
-                    else:
-                        results_raw[vid] = (text, is_cached)
-
-            placeholder.empty()
-            st.session_state.results = [r for r in results_raw if r is not None]
-            
-            # 将新生成的保存至历史记录
-            for text, is_cached in st.session_state.results:
-                if not is_cached:
-                    add_to_history(topic_input, text)
-
-    if st.session_state.results:
-        results = st.session_state.results
-        tab_labels = [f"📄 变体 {i+1}{'  ⚡缓存' if r[1] else ''}" for i, r in enumerate(results)]
-        tabs = st.tabs(tab_labels)
-
-        for i, (tab, (text, is_cached)) in enumerate(zip(tabs, results)):
-            with tab:
-                with st.expander("🔍 预览（渲染效果）", expanded=True):
-                    st.markdown(text)
-                with st.expander("📄 原始 Markdown"):
-                    st.code(text, language="markdown")
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                
-                col_btn1, col_btn2 = st.columns(2)
-                with col_btn1:
-                    if st.button("🎨 到画布编辑并成图", key=f"edit_{i}", use_container_width=True):
-                        st.session_state.editor_content = text
-                        st.session_state.editor_title = topic_input if topic_input else "生成文案"
-                        st.session_state.show_editor = True
-                        st.rerun()
-                with col_btn2:
-                    st.download_button(
-                        label="⬇️ 下载此变体",
-                        data=text.encode("utf-8"),
-                        file_name=f"viral_post_v{i+1}_{timestamp}.md",
-                        mime="text/markdown",
-                        use_container_width=True,
-                        key=f"dl_{i}_{timestamp}",
-                    )
+            sys_p, usr_p = analyze_and_generate_prompt(
+                viral_posts, topic_input, max_tokens_slider, warn=st.warning, compress=compress_examples,
+                report=lambda stats: st.session_state.update(compression_report=stats),
+            )
+            # 只入队，不等待：生成在后台线程池里跑，期间可以继续操作页面
+            st.session_state.batch_id = job_queue.submit_batch(
+                topic=topic_input,
+                system_prompt=sys_p,
+                user_prompt=usr_p,
+                api_key=api_key_input,
+                model=model_choice,
+                max_tokens=max_tokens_slider,
+                temperature=temperature_slider,
+                retries=int(retries_input),
+                n=int(num_variants),
+                user=current_user,
+                combined=combined_variants,
+            )
+            st.query_params["batch"] = st.session_state.batch_id
+            st.rerun()
+    report = st.session_state.get("compression_report")
+    if report and report["tokens_before"] > report["tokens_after"]:
+        capped = f"，{report['posts_capped']} 条长案例已截取" if report["posts_capped"] else ""
+        st.caption(f"🗜️ 上次案例压缩：约 {report['tokens_before']} → {report['tokens_after']} Token{capped}")
+    show_panel_timing("输入区", started)
+
+# ==========================================
+# 单页重写（结果区和编辑器共用）
+# ==========================================
+def page_title(page: str) -> str:
+    return next((line.strip().strip("#*> ") for line in page.split("\n") if line.strip()), "")
+
+def submit_page_rewrite(key: str, text: str, page_index: int, params: dict):
+    """按钮回调：重写任务交给后台队列（配额、每人并发上限与生成任务一致），页面只记下批次号去轮询。"""
+    batch = job_queue.submit_page_rewrite(text=text, page_index=page_index,
+                                          instruction=st.session_state.get(f"rewrite_hint_{key}", ""), **params)
+    st.session_state[f"page_rewrite_{key}"] = batch
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def page_rewrite_progress(key: str, apply):
+    """轮询重写任务；完成后 apply(new_text) 写回（任务结果或编辑器内容），再整页重跑一次显示新文案。"""
+    job = job_queue.batch(st.session_state[f"page_rewrite_{key}"])[0]
+    if job["status"] in PENDING_STATES:
+        st.info(f"🔄 正在后台重写第 {job['variant_id']+1} 页（{'生成中' if job['status'] == RUNNING else '排队中'}）...")
+        return
+    del st.session_state[f"page_rewrite_{key}"]
+    if job["status"] == DONE:
+        apply(job["text"])
+        st.session_state[f"page_rewrite_notice_{key}"] = (
+            "success", f"第 {job['variant_id']+1} 页已重写{'（⚡缓存）' if job['is_cached'] else ''}，其余页保持不变")
+    else:
+        st.session_state[f"page_rewrite_notice_{key}"] = ("error", f"第 {job['variant_id']+1} 页重写失败：{job['error']}")
+    st.rerun()
+
+def page_rewrite_controls(text: str, key: str, apply, topic: str):
+    """选一页、可选填修改要求，点击后只重写这一页；只有一页的帖子直接整篇重新生成即可。key 区分结果区和编辑器。"""
+    pages = split_pages(text)
+    options = [i for i, page in enumerate(pages) if page.strip()]
+    if len(options) < 2:
+        return
+    params = dict(api_key=api_key_input, model=model_choice, max_tokens=max_tokens_slider,
+                  temperature=temperature_slider, retries=int(retries_input), user=current_user, topic=topic)
+    pending = f"page_rewrite_{key}" in st.session_state
+    col_page, col_hint, col_go = st.columns([0.3, 0.45, 0.25])
+    page_index = col_page.selectbox("重写第几页", options, format_func=lambda i: f"第 {i+1} 页 · {page_title(pages[i])[:12]}",
+                                    key=f"rewrite_page_{key}", label_visibility="collapsed")
+    col_hint.text_input("修改要求", placeholder="修改要求（可选），如：开头更抓人", key=f"rewrite_hint_{key}",
+                        label_visibility="collapsed")
+    # 重写进行中不能再提交：两次重写都基于旧文案，后完成的会覆盖先完成的
+    col_go.button("🔄 只重写这一页", key=f"rewrite_{key}", use_container_width=True, disabled=pending,
+                  on_click=submit_page_rewrite, args=(key, text, page_index, params),
+                  help="只把这一页和前后几页发给模型、只生成这一页，比整篇重新生成快得多，也省 Token")
+    if pending:
+        page_rewrite_progress(key, apply)
+    notice = st.session_state.pop(f"page_rewrite_notice_{key}", None)
+    if notice:
+        getattr(st, notice[0])(notice[1])
+
+def save_job_text(job_id: str, text: str):
+    job_queue.update_text(job_id, text)
+    batch_zip.clear()
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def batch_zip(batch_id: str) -> bytes:
+    """已结束批次的全部成功变体打成一个 zip，每个批次只打包一次。"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        for job in job_queue.batch(batch_id):
+            if job["status"] == DONE:
+                zf.writestr(f"viral_post_v{job['variant_id']+1}.md", job["text"])
+    return buffer.getvalue()
+
+def variant_label(job: dict) -> str:
+    first_line = job["text"].strip().split("\n")[0].strip("#*> ")
+    return f"变体 {job['variant_id']+1}{'  ⚡缓存' if job['is_cached'] else ''} · {len(job['text'])} 字 · {first_line[:20]}"
+
+batch_id = st.session_state.batch_id
+batch_pending = bool(batch_id) and any(j["status"] in PENDING_STATES for j in job_queue.batch(batch_id))
+
+@st.fragment(run_every=JOB_POLL_SECONDS if batch_pending else None)
+@profiled("fragment-results")
+def results_panel():
+    """结果区：进行中时只重跑这一块来轮询任务状态；全部结束后整页重跑一次，刷新侧边栏并停止轮询。"""
+    started = time.perf_counter()
+    st.markdown("### 📤 生成结果")
+    jobs = job_queue.batch(batch_id) if batch_id else []
+    finished = sum(j["status"] not in PENDING_STATES for j in jobs)
+    if batch_pending and finished == len(jobs):
+        st.rerun()
+    if finished < len(jobs):
+        st.info(f"🚀 正在后台生成 {len(jobs)} 篇文案（已完成 {finished}/{len(jobs)}），可以继续操作页面，结果会自动出现...")
+        st.progress(finished / len(jobs))
+        return
+
+    # 同样的错误（如 Key 无效）只显示一次，列出受影响的变体
+    failures = {}
+    for job in jobs:
+        if job["status"] != DONE:
+            failures.setdefault(job["error"], []).append(str(job["variant_id"] + 1))
+    for error, variant_ids in failures.items():
+        st.error(f"变体 {'、'.join(variant_ids)} 失败：{error}")
+
+    results = [j for j in jobs if j["status"] == DONE]
+    result_topic = jobs[0]["topic"] if jobs else ""
+
+    if results:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        page_count = math.ceil(len(results) / RESULTS_PAGE_SIZE)
+        col_page, col_zip = st.columns(2)
+        page = col_page.number_input(f"页码（共 {page_count} 页）", min_value=1, max_value=page_count, value=1,
+                                     key=f"page_{batch_id}") if page_count > 1 else 1
+        if len(results) > 1:
+            col_zip.download_button(
+                label=f"📦 下载全部 {len(results)} 篇（zip）",
+                data=batch_zip(batch_id),
+                file_name=f"viral_posts_{batch_id}.zip",
+                mime="application/zip",
+                use_container_width=True,
+            )
+
+        # 变体多的时候只列标题，选中哪一篇才渲染哪一篇的预览
+        page_results = {j["variant_id"]: j for j in results[(page - 1) * RESULTS_PAGE_SIZE:page * RESULTS_PAGE_SIZE]}
+        picked = st.radio("选择变体", list(page_results), format_func=lambda vid: variant_label(page_results[vid]),
+                          key=f"pick_{batch_id}_{page}", label_visibility="collapsed")
+        text = page_results[picked]["text"]
+        with st.expander("🔍 预览（渲染效果）", expanded=True):
+            st.markdown(text)
+        if st.toggle("📄 显示原始 Markdown", key=f"raw_{batch_id}"):
+            st.code(text, language="markdown")
+        job_id = page_results[picked]["id"]
+        page_rewrite_controls(text, job_id, lambda new_text: save_job_text(job_id, new_text), result_topic)
+
+        col_btn1, col_btn2 = st.columns(2)
+        with col_btn1:
+            if st.button("🎨 到画布编辑并成图", key=f"edit_{picked}", use_container_width=True):
+                st.session_state.editor_content = text
+                st.session_state.editor_title = result_topic if result_topic else "生成文案"
+                st.session_state.show_editor = True
+                st.rerun()
+        with col_btn2:
+            st.download_button(
+                label="⬇️ 下载此变体",
+                data=text.encode("utf-8"),
+                file_name=f"viral_post_v{picked+1}_{timestamp}.md",
+                mime="text/markdown",
+                use_container_width=True,
+                key=f"dl_{picked}",
+            )
     else:
         st.info("👈 左侧填写帖子和主题后，点击「开始生成」")
+    show_panel_timing("结果区", started)
+
+with col_left:
+    input_panel()
+
+with col_right:
+    results_panel()
 
 # Show editor at the bottom if requested
-if st.session_state.get("show_editor", False):
+@st.fragment
+@profiled("fragment-editor")
+def editor_panel():
+    """编辑器：关闭只重跑这一块（回调先收起编辑器）；模板按修改时间缓存，不再每次重跑都读盘。"""
+    if not st.session_state.get("show_editor", False):
+        return
     st.markdown("---")
     col_title, col_close = st.columns([0.9, 0.1])
     with col_title:
         st.markdown("### 🎨 爆款图文编辑器 工作台")
     with col_close:
-        if st.button("❌ 关闭", use_container_width=True):
-            st.session_state.show_editor = False
-            st.rerun()
-            
+        st.button("❌ 关闭", use_container_width=True, on_click=lambda: st.session_state.update(show_editor=False))
+    # 画布里的修改不会回传，这里重写的是送进编辑器时的文案；重写后编辑器重新载入
+    page_rewrite_controls(st.session_state.editor_content, "editor",
+                          lambda new_text: st.session_state.update(editor_content=new_text), st.session_state.editor_title)
+
     try:
         editor_path = os.path.join(base_dir, "文案到图片生成.py")
-        with open(editor_path, "r", encoding="utf-8") as f:
-            html_template = f.read()
-            
+        html_template = load_editor_template(os.path.getmtime(editor_path))
+
         content_encoded = urllib.parse.quote(st.session_state.editor_content)
         title_encoded = urllib.parse.quote(st.session_state.editor_title)
-        
+
+        font_face_css = build_font_face_css()
         inject_script = f"""
+        <style id="local-font-faces">{font_face_css}</style>
         <script>
         window.addEventListener('DOMContentLoaded', () => {{
             setTimeout(() => {{
@@ -594,8 +699,35 @@ if st.session_state.get("show_editor", False):
         </head>
         """
         html_code = html_template.replace("</head>", inject_script)
-        
+
         components.html(html_code, height=900, scrolling=True)
-        
+
     except Exception as e:
         st.error(f"加载编辑器失败: {e}")
+
+editor_panel()
+stop_profiling("rerun")
+
+@st.fragment
+def hotspots_panel():
+    """性能热点：汇总 profiles/ 下最近几次记录，按函数自身耗时排序。"""
+    if not is_enabled():
+        return
+    st.markdown("---")
+    st.markdown("### 🩺 性能热点")
+    col_kind, col_limit = st.columns(2)
+    kind = col_kind.selectbox("记录类型", list(PROFILE_KINDS), format_func=PROFILE_KINDS.get)
+    limit = col_limit.slider("显示前 N 个函数", min_value=5, max_value=50, value=15)
+    rows = hotspots(kind, limit)
+    if not rows:
+        st.info("还没有记录，操作一下页面或生成一篇文案后再来看。")
+        return
+    st.caption(f"汇总最近 {min(len(recent_profiles(kind)), PROFILE_AGGREGATE)} 份记录，完整数据在 profiles/ 目录（.pstats，可用 snakeviz 查看火焰图）")
+    st.dataframe(
+        [{"函数": r["function"], "调用次数": r["calls"], "自身耗时(ms)": r["tottime_ms"], "累计耗时(ms)": r["cumtime_ms"]}
+         for r in rows],
+        hide_index=True,
+    )
+
+hotspots_panel()
+show_panel_timing("整页", _rerun_started)